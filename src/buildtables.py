@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+#coding=utf8
+
+import multiprocessing
+import sys
+
+from whacked4 import tablebuilder
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(tablebuilder.main())
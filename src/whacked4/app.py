@@ -7,7 +7,7 @@ import traceback
 import wx
 import os
 
-from whacked4 import config
+from whacked4 import config, timing
 from whacked4.ui import mainwindow
 from whacked4.ui.dialogs import errordialog
 
@@ -34,7 +34,12 @@ class WhackEd4App(wx.App):
         # Enable debugging mode.
         if args.debug:
             config.DEBUG = True
-            print 'Debug mode enabled. Only writing exceptions to stdout.'
+            print 'Debug mode enabled. Only writing exceptions and timings to stdout.'
+
+            # Time opening and saving patches.
+            timing.enabled = True
+            timing.log = True
+            timing.summary_path = config.TIMING_PATH
         else:
             self.redirect_logs()
             sys.excepthook = self.exception_handler
@@ -29,9 +29,21 @@ else:
 # Path to the settings file.
 SETTINGS_PATH = CONFIG_DIR + '/settings.json'
 
+# Path of the decoded sprite cache directory.
+SPRITE_CACHE_PATH = CONFIG_DIR + '/sprites'
+
+# Path of the WAD directory cache file.
+WAD_CACHE_PATH = CONFIG_DIR + '/wads.cache'
+
+# Path of the compiled engine table cache directory.
+ENGINE_CACHE_PATH = CONFIG_DIR + '/engines'
+
 # Path of the program's log output.
 LOG_PATH = CONFIG_DIR + '/log.txt'
 
+# Path of the timing summaries of the last patch open and save, written in debug mode.
+TIMING_PATH = CONFIG_DIR + '/timings.json'
+
 # Enable debugging functions.
 DEBUG = False
 
@@ -61,6 +73,12 @@ class WhackEd4Settings(settingshandler.SettingsHandler):
         self.register_setting('undo_size', 256)
         self.register_setting('recent_files_count', 10)
 
+        # The maximum size of decoded sprite images to keep in memory, in bytes.
+        self.register_setting('sprite_cache_size', 64 * 1024 * 1024)
+
+        # The maximum size of the decoded sprite cache on disk, in bytes.
+        self.register_setting('sprite_disk_cache_size', 256 * 1024 * 1024)
+
     def main_window_state_store(self, x, y, width, height, is_maximized):
         """
         Stores the state of the main window.
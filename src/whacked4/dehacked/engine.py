@@ -5,6 +5,7 @@ from collections import OrderedDict
 from json.encoder import JSONEncoder
 from whacked4.dehacked import table, entries, entry
 import json
+import mmap
 import struct
 
 
@@ -84,6 +85,31 @@ class Engine(object):
         # A dict of supported features.
         self.features = None
 
+        # Lookup dicts built by update_lookups(), from cheat and misc patch keys to their keys, and from action names to
+        # action keys.
+        self.cheat_patch_keys = None
+        self.misc_patch_keys = None
+        self.action_keys = None
+
+        # Reverse lookup dicts built by update_lookups(), from a text to a sorted tuple of the indices or keys of the
+        # strings, and of the indices of the sprite names and sound names with that text. Must not be modified.
+        self.string_keys = None
+        self.sprite_name_indices = None
+        self.sound_name_indices = None
+
+        # Code pointer lookup dicts built by update_lookups(), from a state index to its action pointer index, and from
+        # an action key to the index of the first state that uses it. The first is None for extended engines.
+        self.state_pointer_indices = None
+        self.action_states = None
+
+        # Thing flag lookups built by update_thing_flags(). A list of the mnemonic of each of the 32 flag bits or None,
+        # a dict of bit masks by mnemonic, a dict of mnemonics with their aliases resolved, by mnemonic, and a dict of
+        # the position of each flag in the flags dict, by mnemonic.
+        self.thing_flag_bits = None
+        self.thing_flag_masks = None
+        self.thing_flag_mnemonics = None
+        self.thing_flag_order = None
+
     def read_table(self, filename):
         """
         Reads engine data from a JSON table configuration file.
@@ -104,6 +130,7 @@ class Engine(object):
 
             self.things.names = data['thingNames']
             self.things.flags = data['thingFlags']
+            self.update_thing_flags()
             self.things.read_from_json(data['things'])
             if len(self.things.names) != len(self.things):
                 raise DehackedEngineError('Thing and thing names sizes do not match.')
@@ -147,6 +174,170 @@ class Engine(object):
         except KeyError as e:
             raise DehackedEngineError('Invalid engine table data. Exception: {}'.format(e))
 
+        self.update_lookups()
+
+    def update_thing_flags(self):
+        """
+        Builds the thing flag lookups of this engine. Must be called after the thing flags have been loaded, and before
+        thing flag values are read.
+
+        If more than one flag uses the same bit, the first one is used for that bit.
+        """
+
+        flags = self.things.flags
+
+        self.thing_flag_bits = [None] * 32
+        self.thing_flag_masks = {}
+        self.thing_flag_mnemonics = {}
+        self.thing_flag_order = {}
+        for position, (mnemonic, flag) in enumerate(flags.iteritems()):
+            self.thing_flag_order[mnemonic] = position
+
+            if 'index' in flag:
+                self.thing_flag_masks[mnemonic] = 1 << flag['index']
+                if 0 <= flag['index'] < 32 and self.thing_flag_bits[flag['index']] is None:
+                    self.thing_flag_bits[flag['index']] = mnemonic
+
+            # Flags with an unknown alias are left out, so that reading them reports the error.
+            if 'alias' not in flag:
+                self.thing_flag_mnemonics[mnemonic] = mnemonic
+            elif flag['alias'] in flags:
+                self.thing_flag_mnemonics[mnemonic] = flag['alias']
+
+    def update_lookups(self):
+        """
+        Builds the lookup dicts of this engine's data. Must be called after the data has been loaded.
+
+        If more than one item uses the same patch key or name, the first one is used. Code pointer lookups use the
+        lowest index or key if more than one item has the same value, text lookups keep all of them.
+        """
+
+        self.cheat_patch_keys = get_patch_key_lookup(self.cheat_data)
+        self.misc_patch_keys = get_patch_key_lookup(self.misc_data)
+
+        self.action_keys = {}
+        for key, action in self.actions.iteritems():
+            if action['name'] not in self.action_keys:
+                self.action_keys[action['name']] = key
+
+        self.string_keys = get_reverse_multi_lookup(self.strings)
+        self.sprite_name_indices = get_reverse_multi_lookup(self.sprite_names)
+        self.sound_name_indices = get_reverse_multi_lookup(self.sound_names)
+
+        if self.action_index_to_state is not None:
+            self.state_pointer_indices = get_reverse_lookup(self.action_index_to_state)
+        else:
+            self.state_pointer_indices = None
+        self.action_states = get_reverse_lookup(self.states.get_column('action'))
+
+    def get_header(self):
+        """
+        Returns this engine's header fields as a dict of simple types. These are all that is needed to determine what
+        patches an engine is compatible with.
+        """
+
+        return {
+            'versions': self.versions,
+            'extended': self.extended,
+            'name': self.name,
+            'features': self.features
+        }
+
+    def set_header(self, header):
+        """
+        Sets this engine's header fields from a dict returned by get_header().
+        """
+
+        self.versions = header['versions']
+        self.extended = header['extended']
+        self.name = header['name']
+        self.features = header['features']
+
+    def get_data(self):
+        """
+        Returns this engine's data as a dict of simple types, to store in an engine cache.
+
+        Unlike the data written by write_table(), tables are stored as their columns of validated entry values.
+        """
+
+        return {
+            'versions': self.versions,
+            'extended': self.extended,
+            'name': self.name,
+            'features': self.features,
+
+            'things': self.things.get_columns(),
+            'thingNames': self.things.names,
+            'thingFlags': self.things.flags,
+
+            'weapons': self.weapons.get_columns(),
+            'weaponNames': self.weapons.names,
+
+            'ammo': self.ammo.get_columns(),
+            'ammoNames': self.ammo.names,
+
+            'actions': self.actions,
+            'states': self.states.get_columns(),
+            'sounds': self.sounds.get_columns(),
+            'soundNames': self.sound_names,
+
+            'strings': self.strings,
+
+            'misc': self.misc,
+            'miscData': self.misc_data,
+
+            'cheats': self.cheats,
+            'cheatData': self.cheat_data,
+
+            'spriteNames': self.sprite_names,
+            'usedStates': self.used_states,
+            'hacks': self.hacks,
+            'renderStyles': self.render_styles,
+            'actionIndexToState': self.action_index_to_state
+        }
+
+    def set_data(self, data):
+        """
+        Sets this engine's data from a dict returned by get_data(). Entry values are not validated again.
+        """
+
+        self.versions = data['versions']
+        self.extended = data['extended']
+        self.name = data['name']
+        self.features = data['features']
+
+        self.things.names = data['thingNames']
+        self.things.flags = data['thingFlags']
+        self.update_thing_flags()
+        self.things.set_columns(data['things'])
+
+        self.weapons.names = data['weaponNames']
+        self.weapons.set_columns(data['weapons'])
+
+        self.ammo.names = data['ammoNames']
+        self.ammo.set_columns(data['ammo'])
+
+        self.actions = data['actions']
+        self.states.set_columns(data['states'])
+        self.sounds.set_columns(data['sounds'])
+        self.sound_names = data['soundNames']
+
+        self.strings = data['strings']
+
+        self.misc = data['misc']
+        self.misc_data = data['miscData']
+
+        self.cheats = data['cheats']
+        self.cheat_data = data['cheatData']
+
+        self.sprite_names = data['spriteNames']
+        self.used_states = data['usedStates']
+        self.hacks = data['hacks']
+        self.render_styles = data['renderStyles']
+        self.action_index_to_state = data['actionIndexToState']
+
+        self.update_lookups()
+
     def read_executable(self, engine_filename, exe_filename):
         """
         Reads engine data from a game executable, using a JSON file as base.
@@ -155,16 +346,46 @@ class Engine(object):
         from the executable.
         @param exe_filename: The filename of the game executable to read engine data from.
 
-        @raise KeyError: if the executable data file does not contain all necessary data.
+        @raise DehackedEngineError: if the executable data file does not contain all necessary data, or if the
+        executable does not contain the data it describes.
         """
 
         with open(engine_filename, 'r') as f:
             exe_config = json.load(f, object_pairs_hook=OrderedDict)
 
+        # Map the executable, so that each table can be unpacked from it in one pass.
+        with open(exe_filename, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise DehackedEngineError('The executable {} is empty.'.format(exe_filename))
+
+        try:
+            self.read_executable_data(exe_config, data)
+        finally:
+            data.close()
+
+    def read_executable_data(self, exe_config, data):
+        """
+        Reads engine data from the contents of a game executable.
+
+        @param exe_config: the executable configuration to use.
+        @param data: a string, buffer or mmap with the contents of the executable.
+
+        @raise DehackedEngineError: if the executable data file does not contain all necessary data, or if the
+        executable does not contain the data it describes.
+        """
+
         try:
             self.versions = exe_config['versions']
             self.extended = exe_config['extended']
             self.name = exe_config['name']
+            self.features = set(exe_config['features'])
+
+            if 'renderStyles' in exe_config:
+                self.render_styles = exe_config['renderStyles']
+            else:
+                self.render_styles = {}
 
             self.actions = exe_config['actions']
             self.action_index_to_state = exe_config['actionIndexToState']
@@ -175,35 +396,37 @@ class Engine(object):
             self.hacks = exe_config['hacks']
             self.used_states = exe_config['usedStates']
 
-            with open(exe_filename, 'rb') as f:
-                f.seek(exe_config['thingOffset'])
-                self.things.read_from_executable(exe_config['thingCount'], f)
-                self.things.names = exe_config['thingNames']
-                self.things.flags = exe_config['thingFlags']
+            self.things.read_from_executable(exe_config['thingCount'], data, exe_config['thingOffset'])
+            self.things.names = exe_config['thingNames']
+            self.things.flags = exe_config['thingFlags']
+            self.update_thing_flags()
 
-                f.seek(exe_config['stateOffset'])
-                self.states.read_from_executable(exe_config['stateCount'], f)
+            self.states.read_from_executable(exe_config['stateCount'], data, exe_config['stateOffset'])
 
-                f.seek(exe_config['weaponOffset'])
-                self.weapons.read_from_executable(exe_config['weaponCount'], f)
-                self.weapons.names = exe_config['weaponNames']
+            self.weapons.read_from_executable(exe_config['weaponCount'], data, exe_config['weaponOffset'])
+            self.weapons.names = exe_config['weaponNames']
 
-                f.seek(exe_config['soundOffset'])
-                self.sounds.read_from_executable(exe_config['soundCount'], f)
+            self.sounds.read_from_executable(exe_config['soundCount'], data, exe_config['soundOffset'])
 
-                # Read tables that require more work.
-                self.read_executable_sprite_names(f, exe_config)
-                self.read_executable_sound_names(f, exe_config)
-                self.read_executable_cheats(f, exe_config)
-                self.read_executable_misc(f)
-                self.read_executable_strings(f, exe_config)
+            # Read tables that require more work.
+            self.read_executable_sprite_names(data, exe_config)
+            self.read_executable_sound_names(data, exe_config)
+            self.read_executable_cheats(data, exe_config)
+            self.read_executable_misc(data)
+            self.read_executable_strings(data, exe_config)
 
-                self.read_executable_ammo(f, exe_config)
-                self.ammo.names = exe_config['ammoNames']
+            self.read_executable_ammo(data, exe_config)
+            self.ammo.names = exe_config['ammoNames']
 
         except KeyError:
             raise DehackedEngineError('Invalid executable data.')
 
+        except struct.error:
+            raise DehackedEngineError('The executable is too small to contain the data described by its executable '
+                                      'data.')
+
+        self.update_lookups()
+
     def write_table(self, filename):
         """
         Writes this engine's table data to a JSON file.
@@ -215,6 +438,7 @@ class Engine(object):
             'versions': self.versions,
             'extended': self.extended,
             'name': self.name,
+            'features': sorted(self.features),
 
             'things': self.things,
             'thingNames': self.things.names,
@@ -242,51 +466,53 @@ class Engine(object):
             'actions': self.actions,
             'actionIndexToState': self.action_index_to_state,
             'usedStates': self.used_states,
-            'hacks': self.hacks
+            'hacks': self.hacks,
+            'renderStyles': self.render_styles
         }
 
+        # Stream the encoded JSON to the file, instead of building it in memory first.
         with open(filename, 'w') as f:
-            f.write(json.dumps(obj, indent=4, sort_keys=False, cls=EngineJSONEncoder))
+            json.dump(obj, f, indent=4, sort_keys=False, cls=EngineJSONEncoder)
 
-    def read_executable_sound_names(self, f, exe_config):
+    def read_executable_sound_names(self, data, exe_config):
         """
         Reads sound names from an executable.
 
-        @param f: the file handle to read from.
+        @param data: the executable contents to read from.
         @param exe_config: the executable configuration to use.
         """
 
+        data_segment = exe_config['dataSegment']
+
         self.sound_names = []
-        for sound in self.sounds:
-            f.seek(sound['namePointer'] + exe_config['dataSegment'])
-            text = _read_string(f)
+        for pointer in self.sounds.get_column('namePointer'):
+            text, _ = _read_string(data, pointer + data_segment)
             self.sound_names.append(text)
 
-    def read_executable_strings(self, f, exe_config):
+    def read_executable_strings(self, data, exe_config):
         """
         Reads strings from an executable.
 
-        @param f: the file handle to read from.
+        @param data: the executable contents to read from.
         @param exe_config: the executable configuration to use.
         """
 
-        f.seek(exe_config['stringOffset'])
+        offset = exe_config['stringOffset']
 
         self.strings = []
         for _ in range(exe_config['stringCount']):
-            text = _read_string(f)
+            text, offset = _read_string(data, offset)
 
-            # Seek ahead to the next offset dividable by 4.
-            if f.tell() % 4 != 0:
-                f.read(4 - (f.tell() % 4))
+            # Skip ahead to the next offset dividable by 4.
+            offset = (offset + 3) & ~3
 
             self.strings.append(text)
 
-    def read_executable_misc(self, f):
+    def read_executable_misc(self, data):
         """
         Reads miscellaneous data from an executable.
 
-        @param f: the file handle to read from.
+        @param data: the executable contents to read from.
         """
 
         int_struct = struct.Struct('<i')
@@ -294,82 +520,69 @@ class Engine(object):
 
         self.misc = {}
         for name, item in self.misc_data.iteritems():
-            f.seek(item['offsets'][0])
+            offset = item['offsets'][0]
 
             # An item's data type defines its byte length.
             data_type = item['type']
             if data_type == 'int':
-                self.misc[name] = int_struct.unpack(f.read(4))[0]
+                self.misc[name] = int_struct.unpack_from(data, offset)[0]
             elif data_type == 'byte' or data_type == 'boolean':
-                self.misc[name] = byte_struct.unpack(f.read(1))[0]
+                self.misc[name] = byte_struct.unpack_from(data, offset)[0]
             else:
                 raise DehackedEngineError('Unknown miscellaneous data type {}'.format(data_type))
 
-    def read_executable_ammo(self, f, exe_config):
+    def read_executable_ammo(self, data, exe_config):
         """
         Reads ammo data from an executable.
 
-        @param f: the file handle to read from.
+        @param data: the executable contents to read from.
         @param exe_config: the executable configuration to use.
         """
 
-        single_struct = struct.Struct('<i')
         count = exe_config['ammoCount']
+        values_struct = struct.Struct('<{}i'.format(count))
 
-        # Read the maximum ammo amounts first.
-        f.seek(exe_config['ammoOffset'])
-        for index in range(count):
-            ammo_entry = entries.AmmoEntry(self)
-
-            data = single_struct.unpack(f.read(single_struct.size))
-            ammo_entry['maximum'] = data[0]
+        # The maximum ammo amounts are followed by the clip sizes.
+        maximums = values_struct.unpack_from(data, exe_config['ammoOffset'])
+        clips = values_struct.unpack_from(data, exe_config['ammoOffset'] + values_struct.size)
 
-            self.ammo.entries.append(ammo_entry)
+        for maximum, clip in zip(maximums, clips):
+            self.ammo.append(entries.AmmoEntry(self.ammo, {'maximum': maximum, 'clip': clip}))
 
-        # Read the clip sizes second.
-        for index in range(count):
-            data = single_struct.unpack(f.read(single_struct.size))
-
-            ammo_entry = self.ammo.entries[index]
-            ammo_entry['clip'] = data[0]
-
-    def read_executable_cheats(self, f, exe_config):
+    def read_executable_cheats(self, data, exe_config):
         """
         Reads and decrypts cheat code strings from an executable.
 
-        @param f: the file handle to read from.
+        @param data: the executable contents to read from.
         @param exe_config: the executable configuration to use.
         """
 
         self.cheats = {}
-        for name, data in self.cheat_data.iteritems():
-            f.seek(exe_config['cheatOffset'] + data['offset'])
-            text = f.read(data['length'])
+        for name, cheat in self.cheat_data.iteritems():
+            offset = exe_config['cheatOffset'] + cheat['offset']
+            text = data[offset:offset + cheat['length']]
 
             self.cheats[name] = _decrypt_cheat_string(text)
 
-    def read_executable_sprite_names(self, f, exe_config):
+    def read_executable_sprite_names(self, data, exe_config):
         """
         Reads sprite names from an executable.
 
-        @param f: the file handle to read from.
+        @param data: the executable contents to read from.
         @param exe_config: the executable configuration to use.
         """
 
-        pointers = []
-        self.sprite_names = []
-        spritename_struct = struct.Struct('<I')
+        count = exe_config['spriteCount']
+        data_segment = exe_config['dataSegment']
 
         # Read pointers to the sprite names.
-        f.seek(exe_config['spriteOffset'])
-        for _ in range(exe_config['spriteCount']):
-            offset = spritename_struct.unpack(f.read(4))[0]
-            pointers.append(offset)
+        pointers = struct.unpack_from('<{}I'.format(count), data, exe_config['spriteOffset'])
 
         # Read actual strings.
-        for index in range(exe_config['spriteCount']):
-            f.seek(pointers[index] + exe_config['dataSegment'])
-            self.sprite_names.append(f.read(4))
+        self.sprite_names = []
+        for pointer in pointers:
+            offset = pointer + data_segment
+            self.sprite_names.append(data[offset:offset + 4])
 
     def get_action_from_key(self, key):
         """
@@ -393,11 +606,7 @@ class Engine(object):
         @param action_name: the name of the action to find the key of.
         """
 
-        for key, item in self.actions.iteritems():
-            if item['name'] == action_name:
-                return key
-
-        return None
+        return self.action_keys.get(action_name)
 
     def is_compatible(self, patch):
         """
@@ -434,19 +643,20 @@ class EngineJSONEncoder(JSONEncoder):
         return JSONEncoder.default(self, o)
 
 
-def _read_string(f):
+def _read_string(data, offset):
     """
-    Reads a null-terminated string from a file.
+    Reads a null-terminated string from executable contents.
+
+    @return: a tuple of the string and the offset after its null terminator.
+
+    @raise DehackedEngineError: if the string is not terminated.
     """
 
-    chars = []
-    while True:
-        char = f.read(1)
-        if char == b'\0':
-            break
-        chars.append(char)
+    end = data.find(b'\0', offset)
+    if end == -1:
+        raise DehackedEngineError('Unterminated string at offset {}.'.format(offset))
 
-    return ''.join(chars)
+    return data[offset:end], end + 1
 
 
 def _decrypt_cheat_string(text):
@@ -472,19 +682,57 @@ def _decrypt_cheat_string(text):
     return bytes(output).encode('ascii')
 
 
-def get_key_from_patchkey(data, patch_key):
+def get_patch_key_lookup(data):
     """
-    Returns an internal entry key from a key used in a Dehacked patch file.
+    Returns a dict of internal entry keys by the keys used in a Dehacked patch file.
     This is used by the cheats and miscellaneous sections, since they do not have an associated table.
 
     @param data: a dict of cheat or misc data.
-    @param patch_key: the string used in a patch file to identify.
-
-    @raise LookupError: if the patch key cannot be found.
     """
 
+    lookup = {}
     for key, item in data.iteritems():
-        if item['patchKey'] == patch_key:
-            return key
+        if item['patchKey'] not in lookup:
+            lookup[item['patchKey']] = key
+
+    return lookup
+
+
+def get_reverse_lookup(items):
+    """
+    Returns a dict of the indices or keys of items, by item. If more than one index or key has the same item, the
+    lowest is used.
+
+    @param items: a list or a dict of items.
+    """
+
+    if isinstance(items, dict):
+        pairs = sorted(items.iteritems())
+    else:
+        pairs = enumerate(items)
+
+    lookup = {}
+    for key, item in pairs:
+        if item not in lookup:
+            lookup[item] = key
+
+    return lookup
+
+
+def get_reverse_multi_lookup(items):
+    """
+    Returns a dict of sorted tuples of all indices or keys of items, by item.
+
+    @param items: a list or a dict of items.
+    """
+
+    if isinstance(items, dict):
+        pairs = sorted(items.iteritems())
+    else:
+        pairs = enumerate(items)
+
+    lookup = {}
+    for key, item in pairs:
+        lookup.setdefault(item, []).append(key)
 
-    return None
+    return dict((item, tuple(keys)) for item, keys in lookup.iteritems())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a persistent cache of compiled engine table data.
+"""
+
+import cPickle
+import hashlib
+import os
+
+from whacked4 import fileutils
+from whacked4.dehacked import engine
+
+
+class EngineCache(object):
+    """
+    Stores engine data read from JSON table files in a compiled form, so that engines can be loaded without parsing
+    JSON or validating every entry's values again.
+
+    Every table file has a cache file of its own. A cache file is used if the table file's size and modification time
+    still match, or otherwise if the table file's contents still hash to the same value. The cache file starts with a
+    small header that includes the engine's header fields, so that those can be read without loading any tables.
+    """
+
+    # Increment this when the format of stored engine data changes.
+    VERSION = 3
+
+    def __init__(self, path):
+        self.path = path
+
+    def read_table(self, filename, header_only=False):
+        """
+        Returns an engine read from a JSON table file, or from its cache file if that is up to date.
+
+        @param filename: the name of the table file to read.
+        @param header_only: if True, only the engine's header fields are set, and its tables are left empty.
+
+        @raise DehackedEngineError: if the table file is invalid.
+        """
+
+        new_engine = self.read_cache(filename, header_only)
+        if new_engine is not None:
+            return new_engine
+
+        new_engine = engine.Engine()
+        new_engine.read_table(filename)
+        self.write(filename, new_engine)
+
+        if header_only:
+            header_engine = engine.Engine()
+            header_engine.set_header(new_engine.get_header())
+            return header_engine
+
+        return new_engine
+
+    def read_cache(self, filename, header_only=False):
+        """
+        Returns an engine from the cache file of a table file, or None if the cache file is missing or out of date.
+        """
+
+        stat = os.stat(filename)
+
+        new_engine = engine.Engine()
+        try:
+            with open(self.get_cache_filename(filename), 'rb') as f:
+                header = cPickle.load(f)
+                if header['version'] != self.VERSION:
+                    return None
+
+                if header['size'] == stat.st_size and header['mtime'] == stat.st_mtime:
+                    if header_only:
+                        new_engine.set_header(header['engine'])
+                    else:
+                        new_engine.set_data(cPickle.load(f))
+                    return new_engine
+
+                # Only hash the table file if it was touched since it was cached. If the contents are unchanged,
+                # the cache file is rewritten so that it does not need to be hashed again.
+                if header['hash'] == get_file_hash(filename):
+                    new_engine.set_data(cPickle.load(f))
+                    self.write(filename, new_engine)
+
+                    if header_only:
+                        new_engine = engine.Engine()
+                        new_engine.set_header(header['engine'])
+                    return new_engine
+
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError, ValueError, TypeError, KeyError,
+                AttributeError, ImportError, IndexError):
+            pass
+
+        return None
+
+    def write(self, filename, cached_engine):
+        """
+        Writes an engine's data to the cache file of a table file.
+
+        Errors are ignored, the engine will be read from the table file again next time.
+        """
+
+        stat = os.stat(filename)
+        header = {
+            'version': self.VERSION,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': get_file_hash(filename),
+            'engine': cached_engine.get_header()
+        }
+
+        # Write to a temporary file first, so that a partially written cache is never read.
+        cache_filename = self.get_cache_filename(filename)
+        temp_filename = cache_filename + '.tmp'
+        try:
+            # Another thread may create the cache directory at the same time.
+            if not os.path.exists(self.path):
+                try:
+                    os.makedirs(self.path)
+                except OSError:
+                    pass
+
+            with open(temp_filename, 'wb') as f:
+                cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+                cPickle.dump(cached_engine.get_data(), f, cPickle.HIGHEST_PROTOCOL)
+            fileutils.replace_file(temp_filename, cache_filename)
+
+        except (IOError, OSError, cPickle.PicklingError):
+            pass
+
+    def get_cache_filename(self, filename):
+        """
+        Returns the name of the cache file for a table file.
+        """
+
+        key = os.path.normcase(os.path.abspath(filename))
+        name = os.path.splitext(os.path.basename(filename))[0]
+
+        return os.path.join(self.path, '{}_{}.cache'.format(name, hashlib.sha1(key).hexdigest()[:16]))
+
+
+def get_file_hash(filename):
+    """
+    Returns a hash of a file's contents.
+    """
+
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
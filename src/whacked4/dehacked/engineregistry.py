@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a registry of available engines that loads engine tables on demand.
+"""
+
+from collections import OrderedDict
+import threading
+import weakref
+
+
+class EngineRegistry(object):
+    """
+    Keeps track of all available engine table files.
+
+    Only the header fields of each engine (versions, extended, name and features) are read when an engine is added.
+    These header engines can be iterated over like a dict of engines, and are enough for patch compatibility
+    auto-detection. An engine's tables are only loaded when get_engine() is called for it. Loaded engines are only
+    weakly referenced, so that they are released again once no patch uses them anymore.
+
+    Engines can be added in worker threads with add_all(). Until those are done, accessing this registry blocks.
+    """
+
+    # The maximum number of worker threads that add_all() uses.
+    WORKER_COUNT = 4
+
+    def __init__(self, cache):
+        # The enginecache.EngineCache to read engines through.
+        self.cache = cache
+
+        # Header-only engine objects, by name.
+        self.headers = OrderedDict()
+
+        # Table filenames, by engine name.
+        self.filenames = {}
+
+        # Fully loaded engines that are still in use, by name.
+        self.loaded = weakref.WeakValueDictionary()
+
+        # Set when no engines are being added by worker threads.
+        self.ready = threading.Event()
+        self.ready.set()
+
+    def add(self, name, filename):
+        """
+        Adds an engine table file, reading only its engine's header fields.
+
+        @raise DehackedEngineError: if the table file is invalid.
+        """
+
+        self.headers[name] = self.cache.read_table(filename, header_only=True)
+        self.filenames[name] = filename
+
+    def add_all(self, filenames, error_callback=None):
+        """
+        Adds a number of engine table files in worker threads, and returns immediately.
+
+        Engines are added in the order they were passed in, once all of them have been read. Use wait() to block until
+        then.
+
+        @param filenames: a list of (name, filename) tuples of the engine table files to add.
+        @param error_callback: called with the filename and the exception of every table file that could not be read.
+        Called from a worker thread, after all engines have been added.
+        """
+
+        self.wait()
+        if len(filenames) == 0:
+            return
+
+        self.ready.clear()
+
+        pending = list(enumerate(filenames))
+        results = [None] * len(filenames)
+        lock = threading.Lock()
+        state = {'remaining': len(filenames)}
+
+        def work():
+            while True:
+                with lock:
+                    if len(pending) == 0:
+                        return
+                    index, (name, filename) = pending.pop(0)
+
+                # Any error must be caught, otherwise the registry would never become ready.
+                try:
+                    results[index] = self.cache.read_table(filename, header_only=True)
+                except Exception as e:
+                    results[index] = e
+
+                with lock:
+                    state['remaining'] -= 1
+                    if state['remaining'] > 0:
+                        continue
+
+                # The last worker to finish merges all results.
+                errors = []
+                for (name, filename), result in zip(filenames, results):
+                    if isinstance(result, Exception):
+                        errors.append((filename, result))
+                    else:
+                        self.headers[name] = result
+                        self.filenames[name] = filename
+                self.ready.set()
+
+                if error_callback is not None:
+                    for filename, error in errors:
+                        error_callback(filename, error)
+
+        for _ in range(min(self.WORKER_COUNT, len(filenames))):
+            worker = threading.Thread(target=work)
+            worker.daemon = True
+            worker.start()
+
+    def wait(self):
+        """
+        Blocks until all engines that are being added by worker threads have been added.
+        """
+
+        self.ready.wait()
+
+    def get_engine(self, name):
+        """
+        Returns a fully loaded engine, loading its tables if they are not already in use.
+
+        @raise KeyError: if there is no engine with that name.
+        @raise DehackedEngineError: if the engine's table file has become invalid.
+        """
+
+        self.wait()
+
+        loaded_engine = self.loaded.get(name)
+        if loaded_engine is None:
+            loaded_engine = self.cache.read_table(self.filenames[name])
+            self.loaded[name] = loaded_engine
+
+        return loaded_engine
+
+    def iteritems(self):
+        self.wait()
+        return self.headers.iteritems()
+
+    def itervalues(self):
+        self.wait()
+        return self.headers.itervalues()
+
+    def __getitem__(self, name):
+        self.wait()
+        return self.headers[name]
+
+    def __contains__(self, name):
+        self.wait()
+        return name in self.headers
+
+    def __iter__(self):
+        self.wait()
+        return iter(self.headers)
+
+    def __len__(self):
+        self.wait()
+        return len(self.headers)
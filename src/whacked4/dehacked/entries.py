@@ -13,6 +13,7 @@ from whacked4.dehacked.entry import Entry, Field, FieldType
 
 
 class AmmoEntry(Entry):
+    __slots__ = ()
     NAME = 'Ammo'
     FIELDS = OrderedDict([
         ('maximum', Field('Max ammo', FieldType.INT)),
@@ -21,6 +22,7 @@ class AmmoEntry(Entry):
 
 
 class ParEntry(Entry):
+    __slots__ = ()
     NAME = 'Par'
     FIELDS = OrderedDict([
         ('episode', Field('Episode', FieldType.INT)),
@@ -30,6 +32,7 @@ class ParEntry(Entry):
 
 
 class SoundEntry(Entry):
+    __slots__ = ()
     NAME = 'Sound'
     STRUCTURE = struct.Struct('<iiiiiiiii')
     FIELDS = OrderedDict([
@@ -46,8 +49,20 @@ class SoundEntry(Entry):
 
 
 class StateEntry(Entry):
+    __slots__ = ()
     NAME = 'Frame'
     STRUCTURE = struct.Struct('<iiiiiii')
+    DEFAULTS = {
+        'arg1': 0,
+        'arg2': 0,
+        'arg3': 0,
+        'arg4': 0,
+        'arg5': 0,
+        'arg6': 0,
+        'arg7': 0,
+        'arg8': 0,
+        'arg9': 0
+    }
     FIELDS = OrderedDict([
         ('sprite',      Field('Sprite number',    FieldType.SPRITE)),
         ('spriteFrame', Field('Sprite subnumber', FieldType.INT)),
@@ -69,8 +84,28 @@ class StateEntry(Entry):
 
 
 class ThingEntry(Entry):
+    __slots__ = ()
     NAME = 'Thing'
     STRUCTURE = struct.Struct('<iiiiiiiiiiiiiiiiiiiiiii')
+    STRUCTURE_KEYS = [
+        'id', 'stateSpawn', 'health', 'stateWalk', 'soundAlert', 'reactionTime', 'soundAttack', 'statePain',
+        'painChance', 'soundPain', 'stateMelee', 'stateAttack', 'stateDeath', 'stateExplode', 'soundDeath', 'speed',
+        'radius', 'height', 'mass', 'damage', 'soundActive', 'flags', 'stateRaise'
+    ]
+    DEFAULTS = {
+        'spawnId': 0,
+        'game': 'Doom',
+        'respawnTime': 0,
+        'renderStyle': 'STYLE_Normal',
+        'stateCrash': 0,
+        'stateFreeze': 0,
+        'stateBurn': 0,
+        'alpha': 1.0,
+        'decal': '',
+        'scale': 1.0,
+        'damageFactor': 1.0,
+        'gravity': 1.0
+    }
     FIELDS = OrderedDict([
         ('id',           Field('ID #',                FieldType.INT)),
         ('stateSpawn',   Field('Initial frame',       FieldType.INT)),
@@ -111,8 +146,14 @@ class ThingEntry(Entry):
 
 
 class WeaponEntry(Entry):
+    __slots__ = ()
     NAME = 'Weapon'
     STRUCTURE = struct.Struct('<iiiiii')
+    DEFAULTS = {
+        'minAmmo': 0,
+        'ammoUse': 0,
+        'decal': ''
+    }
     FIELDS = OrderedDict([
         ('ammoType',      Field('Ammo type',      FieldType.AMMO)),
         ('stateDeselect', Field('Deselect frame', FieldType.STATE)),
@@ -127,6 +168,7 @@ class WeaponEntry(Entry):
 
 
 class SpriteEntry(Entry):
+    __slots__ = ()
     NAME = 'Sprite'
     STRUCTURE = None
     FIELDS = OrderedDict([
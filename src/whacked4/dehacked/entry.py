@@ -1,12 +1,10 @@
 #!/usr/bin/env python
 #coding=utf8
 
-import copy
-
 from collections import namedtuple
 
 from whacked4.dehacked import validators
-from whacked4.utils import Enum
+from whacked4.enumeration import Enum
 
 
 class FieldType(Enum):
@@ -31,7 +29,58 @@ class FieldType(Enum):
 Field = namedtuple('Field', ['patch_key', 'type'])
 
 
+def _read_int(value, key, table):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Value "{}" for field "{}" is not an integer.'.format(value, key))
+
+
+def _read_float(value, key, table):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError('Value "{}" for field "{}" is not a float.'.format(value, key))
+
+
+def _read_string(value, key, table):
+    return str(value)
+
+
+def _read_flags(value, key, table):
+    return validators.thing_flags_read(value, table)
+
+
+def _read_any(value, key, table):
+    return value
+
+
+# Functions that validate a field value, by field type. Each is called with the value, the field key and the table of
+# the entry that the value is for.
+FIELD_READERS = {
+    FieldType.INT: _read_int,
+    FieldType.STATE: _read_int,
+    FieldType.SOUND: _read_int,
+    FieldType.AMMO: _read_int,
+    FieldType.SPRITE: _read_int,
+    FieldType.FLOAT: _read_float,
+    FieldType.STRING: _read_string,
+    FieldType.ACTION: _read_string,
+    FieldType.ENUM_GAME: _read_string,
+    FieldType.ENUM_RENDER_STYLE: _read_string,
+    FieldType.FLAGS: _read_flags
+}
+
+
 class Entry(object):
+    """
+    A Dehacked table entry.
+
+    An entry is either a view of a row in a table, or a detached entry that stores its own values. Clones are always
+    detached, and can be stored in a table row again by assigning them to it.
+    """
+
+    __slots__ = ('table', 'index', 'values')
 
     # The name of this patch entry.
     NAME = None
@@ -39,15 +88,35 @@ class Entry(object):
     # The struct module structure definition to use when reading this entry directly from an executable.
     STRUCTURE = None
 
+    # The keys of the fields read from an executable, in structure order. If None, the structure's values are the
+    # first fields of this entry.
+    STRUCTURE_KEYS = None
+
+    # A dict of values for the fields that are not read from an executable, by key.
+    DEFAULTS = None
+
     # A dict of fields in this entry.
     FIELDS = None
 
-    def __init__(self, table):
+    # A dict of (field key, field reader function) tuples by patch key. Built by get_patch_keys() for each subclass.
+    PATCH_KEYS = None
+
+    def __init__(self, table, values=None, index=None):
+        """
+        @param table: the table this entry belongs to.
+        @param values: a dict of values for a detached entry. If None, all values are None.
+        @param index: the table row index this entry is a view of. If None, this entry is detached.
+        """
+
         self.table = table
+        self.index = index
 
-        self.values = {}
-        for key in self.FIELDS.keys():
-            self.values[key] = None
+        if index is not None:
+            self.values = None
+        elif values is not None:
+            self.values = values
+        else:
+            self.values = dict.fromkeys(self.FIELDS)
 
     def __getitem__(self, key):
         """
@@ -56,6 +125,12 @@ class Entry(object):
         @raise KeyError: If the key cannot be found.
         """
 
+        if self.values is None:
+            try:
+                return self.table.get_value(self.index, key)
+            except KeyError:
+                raise KeyError('Cannot find patch key "{}".'.format(key))
+
         if key not in self.FIELDS:
             raise KeyError('Cannot find patch key "{}".'.format(key))
 
@@ -71,7 +146,22 @@ class Entry(object):
         if key not in self.FIELDS:
             raise KeyError('Cannot find patch key "{}".'.format(key))
 
-        self.values[key] = value
+        if self.values is None:
+            self.table.set_value(self.index, key, value)
+        else:
+            self.values[key] = value
+
+    def get_values(self):
+        """
+        Returns a dict with all of this entry's values.
+
+        For views this is a new dict, for detached entries it is their own values dict.
+        """
+
+        if self.values is None:
+            return self.table.get_values(self.index)
+
+        return self.values
 
     def validate_field_value(self, key, value):
         """
@@ -83,29 +173,26 @@ class Entry(object):
         @returns: A validated value.
         """
 
-        field = self.FIELDS[key]
-
-        if field.type == FieldType.FLAGS:
-            value = validators.thing_flags_read(value, self.table)
+        reader = FIELD_READERS.get(self.FIELDS[key].type, _read_any)
+        return reader(value, key, self.table)
 
-        elif field.type == FieldType.INT or field.type == FieldType.AMMO or field.type == FieldType.SOUND or \
-                field.type == FieldType.SPRITE or field.type == FieldType.STATE:
-            try:
-                value = int(value)
-            except ValueError:
-                raise ValueError('Value "{}" for field "{}" is not an integer.'.format(value, key))
+    @classmethod
+    def get_patch_keys(cls):
+        """
+        Returns a dict of (field key, field reader function) tuples by patch key for this entry class.
 
-        elif field.type == FieldType.FLOAT:
-            try:
-                value = float(value)
-            except ValueError:
-                raise ValueError('Value "{}" for field "{}" is not a float.'.format(value, key))
+        The dict is built the first time it is needed. If more than one field uses the same patch key, the first
+        field is used.
+        """
 
-        elif field.type == FieldType.STRING or field.type == FieldType.ACTION or field.type == FieldType.ENUM_GAME or \
-                field.type == FieldType.ENUM_RENDER_STYLE:
-            value = str(value)
+        if 'PATCH_KEYS' not in cls.__dict__:
+            patch_keys = {}
+            for key, field in cls.FIELDS.iteritems():
+                if field.patch_key not in patch_keys:
+                    patch_keys[field.patch_key] = (key, FIELD_READERS.get(field.type, _read_any))
+            cls.PATCH_KEYS = patch_keys
 
-        return value
+        return cls.PATCH_KEYS
 
     def set_patch_key(self, patch_key, value):
         """
@@ -117,33 +204,19 @@ class Entry(object):
         @raise LookupError: if the patch key cannot be found in this entry.
         """
 
-        for key, field in self.FIELDS.iteritems():
-            if field.patch_key != patch_key:
-                continue
-
-            self.values[key] = self.validate_field_value(key, value)
-            return
+        try:
+            key, reader = self.get_patch_keys()[patch_key]
+        except KeyError:
+            raise LookupError('Cannot find patch key "{}".'.format(patch_key))
 
-        raise LookupError('Cannot find patch key "{}".'.format(patch_key))
-
-    def read_from_executable(self, f):
-        """
-        Reads this entry's values from an executable.
-        """
-
-        self.values = {}
-        data = self.STRUCTURE.unpack(f.read(self.STRUCTURE.size))
-
-        for index, key in enumerate(self.FIELDS.keys()):
-            self.values[key] = data[index]
-
-        return self
+        self[key] = reader(value, key, self.table)
 
     def from_json(self, json):
         """
-        Reads this entry's values from a JSON object.
+        Reads this entry's values from a JSON object. The entry is detached from its table row.
         """
 
+        self.index = None
         self.values = {}
         for key, field in self.FIELDS.iteritems():
             self.values[key] = self.validate_field_value(key, json[key])
@@ -155,7 +228,7 @@ class Entry(object):
         Writes this entry's values to a JSON object. Currently just returns it's values dict.
         """
 
-        return self.values
+        return self.get_values()
 
     def get_patch_header(self, index, table, offset=0):
         """
@@ -174,6 +247,9 @@ class Entry(object):
         @param original: The original entry containing unmodified engine data.
         """
 
+        values = self.get_values()
+        original_values = original.get_values()
+
         output = {}
         for key, field in self.FIELDS.iteritems():
 
@@ -182,8 +258,8 @@ class Entry(object):
                 continue
 
             # Store modified keys in an output dict.
-            if self.values[key] != original.values[key]:
-                output[key] = self.values[key]
+            if values[key] != original_values[key]:
+                output[key] = values[key]
 
         # No values were modified.
         if len(output) == 0:
@@ -203,13 +279,16 @@ class Entry(object):
 
     def clone(self):
         """
-        Returns a clone of this entry.
+        Returns a detached clone of this entry.
         """
 
-        dup = copy.copy(self)
-        dup.values = copy.copy(self.values)
+        return type(self)(self.table, dict(self.get_values()))
+
+    def __copy__(self):
+        return self.clone()
 
-        return dup
+    def __deepcopy__(self, memo):
+        return self.clone()
 
     def __repr__(self):
-        return '{}: {}'.format(self.NAME, self.values)
+        return '{}: {}'.format(self.NAME, self.get_values())
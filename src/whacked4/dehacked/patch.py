@@ -6,11 +6,16 @@ This module contains classes to create, read and write Dehacked patches.
 """
 
 import copy
+import cStringIO
+import os
 
 from whacked4 import config
+from whacked4 import timing
 from whacked4.dehacked import entries
-from whacked4.dehacked import engine
-from whacked4.utils import Enum
+from whacked4.dehacked import table
+from whacked4.dehacked import tokenizer
+from whacked4.dehacked import tracked
+from whacked4.enumeration import Enum
 
 
 
@@ -65,6 +70,24 @@ class ParseMode(Enum):
     POINTERS_EXT = 13
 
 
+# Parse modes of the sections that the tokenizer detects, by section key.
+SECTION_MODES = {
+    'Thing': ParseMode.THING,
+    'Frame': ParseMode.STATE,
+    'Sound': ParseMode.SOUND,
+    'Weapon': ParseMode.WEAPON,
+    'Ammo': ParseMode.AMMO,
+    'Sprite': ParseMode.SPRITE,
+    'Pointer': ParseMode.POINTER,
+    'Text': ParseMode.STRING,
+    'Cheat 0': ParseMode.CHEATS,
+    'Misc 0': ParseMode.MISC,
+    '[PARS]': ParseMode.PARS,
+    '[CODEPTR]': ParseMode.POINTERS_EXT,
+    '[STRINGS]': ParseMode.STRINGS_EXT
+}
+
+
 def write_dict(f, items, source_items, data, header):
     """
     Writes a dictionary of key\\value pairs to a Dehacked patch file, if they have been modified compared to a
@@ -118,6 +141,9 @@ class Patch(object):
         self.sprite_names = None
         self.sound_names = None
 
+        # The tokens of the last analyzed patch file, with the file's name, size and modification time.
+        self.token_cache = None
+
     def initialize_from_engine(self, parent_engine):
         """
         Initializes this patch with the data from an engine.
@@ -126,16 +152,23 @@ class Patch(object):
         self.engine = parent_engine
         self.extended = parent_engine.extended
 
-        self.things = parent_engine.things.clone()
-        self.states = parent_engine.states.clone()
-        self.sounds = parent_engine.sounds.clone()
-        self.weapons = parent_engine.weapons.clone()
-        self.ammo = parent_engine.ammo.clone()
-        self.strings = copy.deepcopy(parent_engine.strings)
-        self.cheats = copy.deepcopy(parent_engine.cheats)
-        self.misc = copy.deepcopy(parent_engine.misc)
-        self.sprite_names = copy.deepcopy(parent_engine.sprite_names)
-        self.sound_names = copy.deepcopy(parent_engine.sound_names)
+        # Tables only store the entries that this patch modifies, the engine's tables are never modified.
+        self.things = table.OverlayTable(parent_engine.things)
+        self.states = table.OverlayTable(parent_engine.states)
+        self.sounds = table.OverlayTable(parent_engine.sounds)
+        self.weapons = table.OverlayTable(parent_engine.weapons)
+        self.ammo = table.OverlayTable(parent_engine.ammo)
+
+        # These only contain immutable values, so shallow copies suffice. Strings keep track of which ones were
+        # modified.
+        if parent_engine.extended:
+            self.strings = tracked.TrackedDict(parent_engine.strings)
+        else:
+            self.strings = tracked.TrackedList(parent_engine.strings)
+        self.cheats = copy.copy(parent_engine.cheats)
+        self.misc = copy.copy(parent_engine.misc)
+        self.sprite_names = copy.copy(parent_engine.sprite_names)
+        self.sound_names = copy.copy(parent_engine.sound_names)
 
         if parent_engine.extended:
             self.pars = []
@@ -153,10 +186,11 @@ class Patch(object):
         if self.extended:
             return
 
+        string_keys = self.engine.string_keys
         for name_index, name in enumerate(engine_names):
-            if name in self.engine.strings:
-                string_index = self.engine.strings.index(name)
-                patch_names[name_index] = self.strings[string_index]
+            string_indices = string_keys.get(name)
+            if string_indices is not None:
+                patch_names[name_index] = self.strings[string_indices[0]]
 
     def get_ammo_name(self, ammo_index):
         """
@@ -174,54 +208,120 @@ class Patch(object):
 
         return None
 
-    def write_dehacked(self, filename):
+    def write_dehacked(self, filename, verify=False):
         """
         Writes this patch to a Dehacked file.
+
+        Only the entries and strings that were modified are compared to the engine's.
+
+        @param filename: the filename of the patch file to write.
+        @param verify: if True, the patch is also written by comparing all of its data to the engine's. If the results
+        differ, nothing is written and an error message is returned.
+
+        @return: an error message if the patch was not written, or None if the patch was written successfully.
         """
 
-        with open(filename, 'w') as f:
-            # Write header.
-            f.write('Patch File for DeHackEd v3.0\n')
+        try:
+            with timing.span('get_patch_data'):
+                data = self.get_patch_data()
+            if verify:
+                with timing.span('get_patch_data full'):
+                    full_data = self.get_patch_data(full=True)
+        except LookupError as e:
+            return e.__str__()
 
-            if config.APP_BETA:
-                f.write('# Created with {} {}\n'.format(config.APP_NAME, config.APP_VERSION))
-            else:
-                f.write('# Created with {} {} BETA\n'.format(config.APP_NAME, config.APP_VERSION))
+        if verify and data != full_data:
+            return 'Patch verification failed: writing only modified data gave a different result than writing all ' \
+                   'data. The patch was not saved.'
 
-            f.write('# Note: Use the pound sign (\'#\') to start comment lines.\n\n')
+        with timing.span('write file'):
+            with open(filename, 'w') as f:
+                f.write(data)
 
-            f.write('Doom version = {}\n'.format(self.version))
-            f.write('Patch format = 6\n\n')
+        return None
 
-            # Write tables.
-            self.things.write_patch_data(self.engine.things, f)
-            self.states.write_patch_data(self.engine.states, f)
-            self.sounds.write_patch_data(self.engine.sounds, f)
-            self.weapons.write_patch_data(self.engine.weapons, f)
-            self.ammo.write_patch_data(self.engine.ammo, f)
+    def get_patch_data(self, full=False):
+        """
+        Returns the contents of a Dehacked file for this patch.
 
-            # Write simple sections.
-            write_dict(f, self.cheats, self.engine.cheats, self.engine.cheat_data, 'Cheat 0')
-            write_dict(f, self.misc, self.engine.misc, self.engine.misc_data, 'Misc 0')
+        @param full: if True, all of this patch's data is compared to the engine's, instead of only modified data.
 
-            # Write code pointers.
-            try:
-                self.write_patch_codepointers(f)
-            except LookupError as e:
-                return e.__str__()
+        @raise LookupError: if a code pointer cannot be written.
+        """
+
+        f = cStringIO.StringIO()
 
-            # Write simple strings.
-            if not self.extended:
-                self.write_patch_strings(f)
+        # Write header.
+        f.write('Patch File for DeHackEd v3.0\n')
 
-            # Write extended data.
+        if config.APP_BETA:
+            f.write('# Created with {} {}\n'.format(config.APP_NAME, config.APP_VERSION))
+        else:
+            f.write('# Created with {} {} BETA\n'.format(config.APP_NAME, config.APP_VERSION))
+
+        f.write('# Note: Use the pound sign (\'#\') to start comment lines.\n\n')
+
+        f.write('Doom version = {}\n'.format(self.version))
+        f.write('Patch format = 6\n\n')
+
+        # Write tables.
+        self.things.write_patch_data(self.engine.things, f, full)
+        self.states.write_patch_data(self.engine.states, f, full)
+        self.sounds.write_patch_data(self.engine.sounds, f, full)
+        self.weapons.write_patch_data(self.engine.weapons, f, full)
+        self.ammo.write_patch_data(self.engine.ammo, f, full)
+
+        # Write simple sections.
+        write_dict(f, self.cheats, self.engine.cheats, self.engine.cheat_data, 'Cheat 0')
+        write_dict(f, self.misc, self.engine.misc, self.engine.misc_data, 'Misc 0')
+
+        # Write code pointers.
+        self.write_patch_codepointers(f, full)
+
+        # Write simple strings.
+        if not self.extended:
+            self.write_patch_strings(f, full)
+
+        # Write extended data.
+        if self.extended:
+            self.write_patch_pars(f)
+            self.write_patch_ext_strings(f, full)
+
+        return f.getvalue()
+
+    def get_modified_strings(self, full=False):
+        """
+        Returns a sorted list of the indices or keys of strings that differ from the engine's.
+
+        @param full: if True, all strings are compared, instead of only the ones that were assigned to.
+        """
+
+        if full:
             if self.extended:
-                self.write_patch_pars(f)
-                self.write_patch_ext_strings(f)
+                keys = self.strings.iterkeys()
+            else:
+                keys = xrange(len(self.strings))
+        else:
+            keys = self.strings.dirty
 
-        return None
+        return sorted(key for key in keys if self.strings[key] != self.engine.strings[key])
 
-    def write_patch_strings(self, f):
+    def get_modified_actions(self, full=False):
+        """
+        Returns a sorted list of the indices of states with an action that differs from the engine's.
+
+        @param full: if True, all states are compared, instead of only the ones that were modified.
+        """
+
+        if full:
+            indices = xrange(len(self.states))
+        else:
+            indices = self.states.get_modified_rows(self.engine.states)
+
+        return [index for index in indices
+                if self.states.get_value(index, 'action') != self.engine.states.get_value(index, 'action')]
+
+    def write_patch_strings(self, f, full=False):
         """
         Writes this patch's strings in Dehacked format.
 
@@ -230,10 +330,7 @@ class Patch(object):
         """
 
         # Create a list of modified strings.
-        out = []
-        for index in range(len(self.strings)):
-            if self.strings[index] != self.engine.strings[index]:
-                out.append(index)
+        out = self.get_modified_strings(full)
 
         # Write modified strings to the patch file.
         if len(out) > 0:
@@ -241,25 +338,22 @@ class Patch(object):
                 f.write('\nText {} {}\n'.format(len(self.engine.strings[index]), len(self.strings[index])))
                 f.write('{}{}'.format(self.engine.strings[index], self.strings[index]))
 
-    def write_patch_ext_strings(self, f):
+    def write_patch_ext_strings(self, f, full=False):
         """
-        Writes this patch's strings in extended Dehacked format.
+        Writes this patch's strings in extended Dehacked format, sorted by their key.
 
         [STRINGS]
         [string key] = [escaped string]
         """
 
         # Create a list of modified strings.
-        out = {}
-        for key, value in self.strings.iteritems():
-            if value != self.engine.strings[key]:
-                out[key] = value
+        out = self.get_modified_strings(full)
 
         # Write modified string to the patch file.
         if len(out) > 0:
             f.write('\n[STRINGS]\n')
-            for name, string in out.iteritems():
-                f.write('{} = {}\n'.format(name, string_escape(string)))
+            for name in out:
+                f.write('{} = {}\n'.format(name, string_escape(self.strings[name])))
 
     def write_patch_pars(self, f):
         """
@@ -279,61 +373,57 @@ class Patch(object):
             else:
                 f.write('par {} {} {}\n'.format(entry['episode'], entry['map'], entry['seconds']))
 
-    def write_patch_codepointers(self, f):
+    def write_patch_codepointers(self, f, full=False):
         """
         Writes codepointer data to a Dehacked patch.
 
-        @raise LookupError: if an action pointer index cannot be found, or if there is no engine state with the
-        new action pointer.
+        @param full: if True, the actions of all states are compared, instead of only those of modified states.
+
+        @raise LookupError: if any action pointer index cannot be found, or if there is no engine state with a new
+        action pointer. The error lists all code pointers that cannot be written.
         """
 
         if not self.extended:
             # For non-extended patches, each state's action has an index. States without an action are skipped.
             # When writing these action pointers to a patch file, state actions are matched to action pointer indices.
             # Their value refers to a state in the original engine data with this particular action.
-            for i in range(len(self.states)):
-                action_pointer = self.states[i]['action']
+            state_pointer_indices = self.engine.state_pointer_indices
+            action_states = self.engine.action_states
 
-                if action_pointer != self.engine.states[i]['action']:
-                    # Attempt to find this state's action pointer index in the action index lookup list.
-                    try:
-                        action_pointer_index = self.engine.action_index_to_state.index(i)
-                    except ValueError:
-                        raise LookupError('Cannot find an action pointer index for state {}'.format(i))
+            errors = []
+            for i in self.get_modified_actions(full):
+                action_pointer = self.states.get_value(i, 'action')
 
-                    # Find a state in the engine state table that uses the new action pointer.
-                    state_index = -1
-                    for j in range(len(self.engine.states)):
-                        if self.engine.states[j]['action'] == action_pointer:
-                            state_index = j
-                            break
+                action_pointer_index = state_pointer_indices.get(i)
+                if action_pointer_index is None:
+                    errors.append('Cannot find an action pointer index for state {}.'.format(i))
+                    continue
 
-                    if state_index == -1:
-                        raise LookupError('Cannot find a state for action pointer {}'.format(action_pointer))
+                # The first state in the engine state table that uses the new action pointer.
+                state_index = action_states.get(action_pointer)
+                if state_index is None:
+                    errors.append('Cannot find a state for action pointer {} of state {}.'.format(action_pointer, i))
+                    continue
 
-                    f.write('\nPointer {} (Frame {})\n'.format(action_pointer_index, i))
-                    f.write('Codep Frame = {}\n'.format(state_index))
+                f.write('\nPointer {} (Frame {})\n'.format(action_pointer_index, i))
+                f.write('Codep Frame = {}\n'.format(state_index))
 
-        else:
-            out = {}
+            if len(errors) > 0:
+                raise LookupError('{} code pointers cannot be written:\n{}'.format(len(errors), '\n'.join(errors)))
 
-            # Create a dict of modified actions.
-            # [state index] = action pointer
-            for index in range(len(self.states)):
-                action_pointer = self.states[index]['action']
-                if action_pointer != self.engine.states[index]['action']:
-                    out[index] = action_pointer
-
-            if len(out) > 0:
+        else:
+            indices = self.get_modified_actions(full)
+            if len(indices) > 0:
                 f.write('\n[CODEPTR]\n')
-                for index, action in out.iteritems():
-                    f.write('FRAME {} = {}\n'.format(index, action))
+                for index in indices:
+                    f.write('FRAME {} = {}\n'.format(index, self.states.get_value(index, 'action')))
 
     def analyze_patch(self, filename, engines):
         """
         Analyzes a Dehacked patch file without loading it.
 
-        This patch object will have it's state altered to reflect the results of the analysis.
+        This patch object will have it's state altered to reflect the results of the analysis. The patch's tokens are
+        kept, so that read_dehacked() does not need to read the file again.
 
         @param filename: The filename of the patch to analyze.
         @param engines: A dict of engine objects.
@@ -346,47 +436,72 @@ class Patch(object):
         self.filename = filename
         self.extended = False
         self.version = 0
+        self.token_cache = None
 
+        cache_key = get_file_key(filename)
         with open(filename, 'r') as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-
-                # Strip \n and whitespace.
-                line = line[:-1].strip()
-
-                # Detect version number.
-                # Searches the engines list for an engine that supports loading this patch.
-                if line.startswith('Doom version = '):
-                    version = int(line[15:])
-                    for find_engine in engines.itervalues():
-                        if version in find_engine.versions and self.extended == find_engine.extended:
-                            self.version = version
-                            break
-
-                    if self.version == 0:
-                        raise DehackedVersionError('{} with engine version {} does not match any supported engine'
-                                                   'version.'.format(filename, version))
-
-                # Detect extended patches from section headers.
-                elif line.startswith('[') and line.endswith(']'):
-                    self.extended = True
-
-                # Detect extended patches from thing flag mnemonics.
-                elif line.startswith('Bits = ') and not line[7:].isdigit():
-                    self.extended = True
-
-                # Detect normal patches from action pointer values in frames.
-                # Mixing action pointers and [CODEPTR] blocks does not make sense.
-                elif line.startswith('Action pointer = '):
-                    if self.extended:
-                        raise DehackedPatchError('Conflicting patch extension mechanisms.')
-                    self.extended = False
+            data = f.read()
+
+        tokens = []
+        for token in tokenizer.tokenize(data):
+            tokens.append(token)
+            token_type, _, text, key, value = token
+
+            # Detect extended patches from section headers.
+            if text[0] == '[' and text[-1] == ']':
+                self.extended = True
+                continue
+
+            if token_type != tokenizer.TokenType.PAIR:
+                continue
+
+            # Detect version number.
+            # Searches the engines list for an engine that supports loading this patch.
+            if key == 'Doom version':
+                version = int(value)
+                for find_engine in engines.itervalues():
+                    if version in find_engine.versions and self.extended == find_engine.extended:
+                        self.version = version
+                        break
+
+                if self.version == 0:
+                    raise DehackedVersionError('{} with engine version {} does not match any supported engine'
+                                               'version.'.format(filename, version))
+
+            # Detect extended patches from thing flag mnemonics.
+            elif key == 'Bits' and not value.isdigit():
+                self.extended = True
+
+            # Detect normal patches from action pointer values in frames.
+            # Mixing action pointers and [CODEPTR] blocks does not make sense.
+            elif key == 'Action pointer':
+                if self.extended:
+                    raise DehackedPatchError('Conflicting patch extension mechanisms.')
+                self.extended = False
 
         if self.version == 0:
             raise DehackedVersionError('{} does not define a Doom version.'.format(filename))
 
+        self.token_cache = (cache_key, tokens)
+
+    def get_tokens(self, filename):
+        """
+        Returns the tokens of a Dehacked patch file.
+
+        The tokens that were kept by analyze_patch() are returned if they are from the same file, and it has not changed
+        since. Otherwise the file is read, and its tokens are generated while they are consumed.
+        """
+
+        if self.token_cache is not None:
+            cache_key, tokens = self.token_cache
+            if cache_key == get_file_key(filename):
+                return tokens
+
+        with open(filename, 'r') as f:
+            data = f.read()
+
+        return tokenizer.tokenize(data)
+
     def read_dehacked(self, filename):
         """
         Reads a Dehacked file.
@@ -405,249 +520,163 @@ class Patch(object):
         # A dict of messages to return.
         messages = {}
 
-        with open(filename, 'r') as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                line = line[:-1].strip()
-
-                # Skip comment lines and empty lines.
-                if len(line) == 0 or line[0].startswith('#'):
-                    continue
-
-                # Validate header line.
-                if mode == ParseMode.NOTHING:
-                    if line == 'Patch File for DeHackEd v3.0':
-                        valid = True
-                if not valid:
-                    raise DehackedPatchError('The file {} does not have a valid Dehacked header.'.format(filename))
-
-                # Header pairs.
-                if line.startswith('Patch format = '):
-                    value = int(line[15:])
-                    if value != 6:
-                        raise DehackedFormatError('{} has an unsupported patch format ({}).'.format(filename, value))
-                    continue
-
-                line_words = line.split(' ')
-
-                # Entry headers.
-                if line.startswith('Thing ') and len(line_words) >= 3:
-                    mode = ParseMode.THING
+        # The tables that key\value pairs are read into, by parse mode.
+        mode_tables = {
+            ParseMode.THING: self.things,
+            ParseMode.STATE: self.states,
+            ParseMode.SOUND: self.sounds,
+            ParseMode.WEAPON: self.weapons,
+            ParseMode.AMMO: self.ammo
+        }
+
+        tokens = self.get_tokens(filename)
+        self.token_cache = None
+
+        for token_type, line_number, text, key, value in tokens:
+
+            # Validate header line.
+            if token_type == tokenizer.TokenType.SIGNATURE:
+                valid = True
+                continue
+            if not valid:
+                raise DehackedPatchError('The file {} does not have a valid Dehacked header.'.format(filename))
+
+            # Entry headers.
+            if token_type == tokenizer.TokenType.SECTION:
+                mode = SECTION_MODES[key]
+                line_words = value
+
+                if mode == ParseMode.THING:
                     entry_index = int(line_words[1]) - 1
-                    entry_name = ' '.join(line_words[2:])[1:-1]
-                    self.things.names[entry_index] = entry_name
-                    continue
-                elif line.startswith('Frame ') and len(line_words) == 2:
-                    mode = ParseMode.STATE
+                    self.things.names[entry_index] = ' '.join(line_words[2:])[1:-1]
+                elif mode == ParseMode.STATE or mode == ParseMode.SOUND:
                     entry_index = int(line_words[1])
-                    continue
-                elif line.startswith('Sound ') and len(line_words) == 2:
-                    mode = ParseMode.SOUND
+                elif mode == ParseMode.WEAPON:
                     entry_index = int(line_words[1])
-                    continue
-                elif line.startswith('Weapon ') and len(line_words) >= 3:
-                    mode = ParseMode.WEAPON
+                    self.weapons.names[entry_index] = ' '.join(line_words[2:])[1:-1]
+                elif mode == ParseMode.AMMO:
                     entry_index = int(line_words[1])
-                    entry_name = ' '.join(line_words[2:])[1:-1]
-                    self.weapons.names[entry_index] = entry_name
-                    continue
-                elif line.startswith('Ammo ') and len(line_words) >= 3 and line_words[2][0] == '(':
-                    mode = ParseMode.AMMO
-                    entry_index = int(line_words[1])
-                    entry_name = ' '.join(line_words[2:])[1:-1]
-                    self.ammo.names[entry_index] = entry_name
-                    continue
-                elif line.startswith('Sprite ') and len(line_words) == 2:
-                    mode = ParseMode.SPRITE
+                    self.ammo.names[entry_index] = ' '.join(line_words[2:])[1:-1]
+                elif mode == ParseMode.SPRITE:
                     entry_index = int(line_words[1])
                     messages['UNSUPPORTED_SPRITE'] = 'The patch contains sprite blocks, which are unsupported and ' \
                                                      'will not be loaded.'
-                    continue
-                elif line.startswith('Pointer ') and len(line_words) >= 4:
-                    mode = ParseMode.POINTER
+                elif mode == ParseMode.POINTER:
                     entry_index = int(line_words[3][:-1])
-                    continue
-                elif line.startswith('Cheat 0'):
-                    mode = ParseMode.CHEATS
-                    continue
-                elif line.startswith('Misc 0'):
-                    mode = ParseMode.MISC
-                    continue
-                elif line.startswith('[PARS]'):
-                    mode = ParseMode.PARS
-                    continue
-                elif line.startswith('[CODEPTR]'):
-                    mode = ParseMode.POINTERS_EXT
-                    continue
-                elif line.startswith('[STRINGS]'):
-                    mode = ParseMode.STRINGS_EXT
-                    continue
-
-                # Text header.
-                elif line.startswith('Text ') and len(line_words) == 3:
-                    mode = ParseMode.STRING
-
-                    entry_len1 = int(line_words[1])
-                    entry_len2 = int(line_words[2])
-
-                    original = f.read(entry_len1)
-                    new = f.read(entry_len2)
-
-                    # Match strings to one in the original engine string table.
-                    if not self.extended:
-                        index = -1
-                        for i in range(len(self.strings)):
-                            if self.strings[i] == original:
-                                index = i
-                                break
-
-                        if index == -1:
-                            messages['NOSTRING_' + str(len(messages))] = 'The engine string "{}" could not be found.' \
-                                                                         'It will not be loaded.'.format(original)
-
-                        self.strings[index] = new
-
-                        # Also replace sprite names, so that patches can alter them without offset modifications.
-                        for i in range(len(self.sprite_names)):
-                            if self.sprite_names[i] == original:
-                                self.sprite_names[i] = new
-                                break
-
-                        # Also replace sound names, so that patches can alter them without offset modifications.
-                        for i in range(len(self.sound_names)):
-                            if self.sound_names[i] == original:
-                                self.sound_names[i] = new
-                                break
-
-                    # In extended mode, locate the key of the string and replace that.
-                    # This ensures that extended patches can still load normal strings.
+                elif mode == ParseMode.STRING:
+                    original, new = value
+                    self.read_text(original, new, messages)
+
+                continue
+
+            # Header pairs.
+            if token_type == tokenizer.TokenType.PAIR and key == 'Patch format':
+                value = int(value)
+                if value != 6:
+                    raise DehackedFormatError('{} has an unsupported patch format ({}).'.format(filename, value))
+                continue
+
+            # Extended mode section contents.
+            if mode == ParseMode.PARS:
+                line_words = text.split(' ')
+                if line_words[0] == 'par':
+                    par = entries.ParEntry(self.engine)
+
+                    if len(line_words) == 4:
+                        par['episode'] = int(line_words[1])
+                        par['map'] = int(line_words[2])
+                        par['seconds'] = int(line_words[3])
+                    elif len(line_words) == 3:
+                        par['episode'] = 0
+                        par['map'] = int(line_words[1])
+                        par['seconds'] = int(line_words[2])
                     else:
-                        key = None
-                        for string_key, text in self.strings.iteritems():
-                            if text == original:
-                                key = string_key
-                                break
-
-                        if key is None:
-                            messages['NOSTRING_' + str(len(messages))] = 'The engine string "{}" could not be found.' \
-                                                                         'It will not be loaded.'.format(original)
-                        else:
-                            self.strings[key] = new
-
-                    continue
+                        continue
 
-                # Extended mode section contents.
-                if mode == ParseMode.PARS:
-                    if line_words[0] == 'par':
-                        par = entries.ParEntry(self.engine)
+                    self.pars.append(par)
 
-                        if len(line_words) == 4:
-                            par['episode'] = int(line_words[1])
-                            par['map'] = int(line_words[2])
-                            par['seconds'] = int(line_words[3])
-                        elif len(line_words) == 3:
-                            par['episode'] = 0
-                            par['map'] = int(line_words[1])
-                            par['seconds'] = int(line_words[2])
-                        else:
-                            continue
+                continue
 
-                        self.pars.append(par)
+            # Key\value pairs.
+            if token_type != tokenizer.TokenType.PAIR:
+                continue
 
-                    continue
+            if mode == ParseMode.STRINGS_EXT:
+                self.strings[key] = string_unescape(value)
+                continue
 
-                elif mode == ParseMode.STRINGS_EXT:
-                    pair = line.split(' = ')
-                    if len(pair) < 2:
-                        continue
+            elif mode == ParseMode.POINTERS_EXT:
+                index = int(key.split(' ')[1])
 
-                    key = pair[0]
-                    value = pair[1]
+                if value not in self.engine.actions:
+                    messages['UNKNOWN_ACTION_NAME'] = 'Unknown action name ' + value
+                elif index < 0 or index >= len(self.states):
+                    messages['INVALID_CODEPOINTER'] = 'Invalid codepointer values were encountered.'
+                else:
+                    self.states[index]['action'] = value
 
-                    # Read multiline strings.
-                    if line.endswith('\\'):
+                continue
 
-                        # Strip the trailing \
-                        value = value[:-1]
-                        while True:
-                            line = f.readline()
-                            if line is None:
-                                break
+            try:
+                if mode in mode_tables:
+                    mode_tables[mode][entry_index].set_patch_key(key, value)
+                elif mode == ParseMode.POINTER:
+                    self.states[entry_index]['action'] = self.engine.states[int(value)]['action']
+                elif mode == ParseMode.CHEATS:
+                    table_key = self.engine.cheat_patch_keys.get(key)
+                    if table_key is None:
+                        messages['PATCH_CHEAT_KEY_' + str(len(messages))] = 'Unknown patch cheat key {}. This' \
+                                                                            'entry will be ignored.'.format(key)
+                    else:
+                        self.cheats[table_key] = value
+                elif mode == ParseMode.MISC:
+                    table_key = self.engine.misc_patch_keys.get(key)
+                    if table_key is None:
+                        messages['PATCH_MISC_KEY_' + str(len(messages))] = 'Unknown patch miscellaneous key {}.' \
+                                                                           'This entry will be ignored.'.format(key)
+                    else:
+                        self.misc[table_key] = value
 
-                            # Strip newline.
-                            line = line[:-1]
+            except Exception as e:
+                messages['EXCEPTION'] = 'Exceptions occurred during loading. The patch may be corrupted.\n\n' \
+                                        'Last exception on line {}:\n{}'.format(line_number, e)
 
-                            # Lines that do not end with \ will terminate the string value.
-                            # Lines that do are added without the \
-                            if not line.endswith('\\'):
-                                value += line.lstrip()
-                                break
-                            else:
-                                value += line.lstrip()[:-1]
+        return messages
 
-                    self.strings[key] = string_unescape(value)
-                    continue
+    def read_text(self, original, new, messages):
+        """
+        Replaces an engine string with a new text from a Dehacked Text section.
 
-                elif mode == ParseMode.POINTERS_EXT:
-                    pair = line.split(' = ')
-                    if len(pair) < 2:
-                        continue
+        The original text is looked up in the engine's strings, so that a patch can only replace the original engine
+        strings. If more than one engine string has the original text, the first one that was not replaced yet is
+        replaced, so that every Text section of a patch replaces a different one.
 
-                    key = pair[0]
-                    value = pair[1]
-                    index = int(key.split(' ')[1])
+        @param original: the engine string to replace.
+        @param new: the text to replace it with.
+        @param messages: the dict of messages to add a message to if the engine string could not be found.
+        """
 
-                    if value not in self.engine.actions:
-                        messages['UNKNOWN_ACTION_NAME'] = 'Unknown action name ' + value
-                    elif index < 0 or index >= len(self.states):
-                        messages['INVALID_CODEPOINTER'] = 'Invalid codepointer values were encountered.'
-                    else:
-                        self.states[index]['action'] = value
+        # In extended mode, this is the key of the string. This ensures that extended patches can still load normal
+        # strings.
+        key = find_unreplaced_key(self.engine.string_keys.get(original), self.strings, original)
+        if key is None:
+            messages['NOSTRING_' + str(len(messages))] = 'The engine string "{}" could not be found.' \
+                                                         'It will not be loaded.'.format(original)
+        else:
+            self.strings[key] = new
 
-                    continue
+        if self.extended:
+            return
 
-                # Key\value pairs.
-                pair = line.split(' = ', 1)
-                if len(pair) != 2:
-                    continue
-                key = pair[0]
-                value = pair[1]
-
-                try:
-                    if mode == ParseMode.THING:
-                        self.things[entry_index].set_patch_key(key, value)
-                    elif mode == ParseMode.STATE:
-                        self.states[entry_index].set_patch_key(key, value)
-                    elif mode == ParseMode.SOUND:
-                        self.sounds[entry_index].set_patch_key(key, value)
-                    elif mode == ParseMode.WEAPON:
-                        self.weapons[entry_index].set_patch_key(key, value)
-                    elif mode == ParseMode.AMMO:
-                        self.ammo[entry_index].set_patch_key(key, value)
-                    elif mode == ParseMode.POINTER:
-                        self.states[entry_index]['action'] = self.engine.states[int(value)]['action']
-                    elif mode == ParseMode.CHEATS:
-                        table_key = engine.get_key_from_patchkey(self.engine.cheat_data, key)
-                        if table_key is None:
-                            messages['PATCH_CHEAT_KEY_' + str(len(messages))] = 'Unknown patch cheat key {}. This' \
-                                                                                'entry will be ignored.'.format(key)
-                        else:
-                            self.cheats[table_key] = value
-                    elif mode == ParseMode.MISC:
-                        table_key = engine.get_key_from_patchkey(self.engine.misc_data, key)
-                        if table_key is None:
-                            messages['PATCH_MISC_KEY_' + str(len(messages))] = 'Unknown patch miscellaneous key {}.' \
-                                                                               'This entry will be ignored.'.format(key)
-                        else:
-                            self.misc[table_key] = value
-
-                except Exception as e:
-                    messages['EXCEPTION'] = 'Exceptions occurred during loading. The patch may be corrupted.\n\n' \
-                                            'Last exception:\n' + str(e)
+        # Also replace sprite names, so that patches can alter them without offset modifications.
+        index = find_unreplaced_key(self.engine.sprite_name_indices.get(original), self.sprite_names, original)
+        if index is not None:
+            self.sprite_names[index] = new
 
-        return messages
+        # Also replace sound names, so that patches can alter them without offset modifications.
+        index = find_unreplaced_key(self.engine.sound_name_indices.get(original), self.sound_names, original)
+        if index is not None:
+            self.sound_names[index] = new
 
     def get_state_name(self, state_index):
         """
@@ -689,6 +718,34 @@ class Patch(object):
             return self.engine.sound_names[sound_index].upper()
 
 
+def find_unreplaced_key(keys, items, original):
+    """
+    Returns the first of a number of keys whose item still has its original text, or None if there is none.
+
+    @param keys: a sequence of keys or indices of items that originally had the text, or None.
+    @param items: the list or dict of items.
+    @param original: the original text.
+    """
+
+    if keys is None:
+        return None
+
+    for key in keys:
+        if items[key] == original:
+            return key
+
+    return None
+
+
+def get_file_key(filename):
+    """
+    Returns a tuple that identifies a file and its current contents, by name, size and modification time.
+    """
+
+    stat = os.stat(filename)
+    return filename, stat.st_size, stat.st_mtime
+
+
 def string_escape(string):
     """
     Returns an escaped string for use in Dehacked patch writing.
@@ -94,21 +94,22 @@ class StateFilter(object):
                 states_list = self.get_weapon_states(filter_index)
 
             # Keep marking all currently listed states' next state as used until none can be found anymore.
+            next_states = self.patch.states.get_column('nextState')
+            actions = self.patch.states.get_column('action')
             while True:
                 added = False
 
                 for index in range(len(states_list)):
                     if states_list[index]:
-                        next_state = self.patch.states[index]['nextState']
+                        next_state = next_states[index]
                         if next_state >= 0 and not states_list[next_state]:
                             states_list[next_state] = True
                             added = True
 
                         # Action-specific state jumps.
                         # Randomly jump to state in param1
-                        state = self.patch.states[index]
-                        if state['action'] == 'RandomJump':
-                            states_list[state['parameter1']] = True
+                        if actions[index] == 'RandomJump':
+                            states_list[self.patch.states[index]['parameter1']] = True
 
                 if not added:
                     break
@@ -1,27 +1,85 @@
 #!/usr/bin/env python
 #coding=utf8
 
+from array import array
+from collections import OrderedDict
+from itertools import izip
 import copy
+import struct
+
+from whacked4.dehacked import tracked
+from whacked4.dehacked.entry import FieldType
+
+
+# Field types that are stored in integer columns.
+INT_FIELD_TYPES = frozenset([FieldType.INT, FieldType.STATE, FieldType.SOUND, FieldType.AMMO, FieldType.SPRITE])
+
+# The value types that typed array columns can store without changing them, by array typecode.
+ARRAY_VALUE_TYPES = {
+    'i': (int, long),
+    'd': (float,)
+}
 
 
 class Table(object):
     """
-    A table containing Dehacked entry objects.
+    A table containing Dehacked entries.
+
+    Entry values are stored per field, in columns. Integer and float fields are stored in compact arrays, and text
+    fields in lists of shared strings. If a value is stored in an array column that it does not fit in, that column is
+    turned into a plain list. Indexing a table returns an Entry that is a view of that row.
     """
 
     def __init__(self, entry_class, engine):
-        self.entries = []
         self.entry_class = entry_class
         self.offset = 0
         self.engine = engine
 
-    def read_from_executable(self, count, f):
+        # The number of entries in this table.
+        self.count = 0
+
+        # Columns of entry values, by field key.
+        self.columns = OrderedDict()
+        for key, field in entry_class.FIELDS.iteritems():
+            if field.type in INT_FIELD_TYPES:
+                self.columns[key] = array('i')
+            elif field.type == FieldType.FLOAT:
+                self.columns[key] = array('d')
+            else:
+                self.columns[key] = []
+
+    def read_from_executable(self, count, data, offset):
         """
-        Reads a number of entries from an executable.
+        Reads a number of entries from the contents of an executable, unpacking all of them at once.
+
+        Fields that are not part of the entry class' executable structure are set to their default values.
+
+        @param count: the number of entries to read.
+        @param data: a string, buffer or mmap with the contents of the executable.
+        @param offset: the offset of the first entry in data.
+
+        @raise struct.error: if data is too small to contain the entries.
         """
 
-        for _ in range(count):
-            self.entries.append(self.entry_class(self).read_from_executable(f))
+        structure = self.entry_class.STRUCTURE
+        field_count = len(structure.unpack(b'\0' * structure.size))
+        structure_keys = self.entry_class.STRUCTURE_KEYS or self.columns.keys()[:field_count]
+
+        # Unpack all entries at once, the values of each field are then every field_count-th value.
+        values = struct.unpack_from(structure.format[0] + structure.format[1:] * count, data, offset)
+        if count == 0:
+            return
+
+        for key in self.columns.keys():
+            if key in structure_keys:
+                field_index = structure_keys.index(key)
+                column_values = values[field_index::field_count]
+            else:
+                column_values = [self.entry_class.DEFAULTS[key]] * count
+
+            self.get_writable_column(key, column_values[0]).extend(column_values)
+
+        self.count += count
 
     def read_from_json(self, json):
         """
@@ -29,16 +87,178 @@ class Table(object):
         """
 
         for json_entry in json:
-            self.entries.append(self.entry_class(self).from_json(json_entry))
+            self.append(self.entry_class(self).from_json(json_entry))
+
+    def get_columns(self):
+        """
+        Returns this table's columns as a dict of simple types, to store in an engine cache.
+
+        Array columns are stored as a typecode and their raw data, list columns as a None typecode and the list.
+        """
+
+        columns = {}
+        for key, column in self.columns.iteritems():
+            if isinstance(column, array):
+                columns[key] = (column.typecode, column.tostring())
+            else:
+                columns[key] = (None, column)
+
+        return {
+            'count': self.count,
+            'columns': columns
+        }
+
+    def set_columns(self, data):
+        """
+        Sets this table's columns from a dict returned by get_columns(). The values are used as they are, without being
+        validated.
+        """
+
+        self.count = data['count']
+        for key, (typecode, column) in data['columns'].iteritems():
+            if typecode is not None:
+                values = array(typecode)
+                values.fromstring(column)
+                self.columns[key] = values
+            else:
+                self.columns[key] = column
+
+    def get_column(self, key):
+        """
+        Returns a column of entry values, for bulk operations. The column must not be modified.
+
+        @raise KeyError: if the key is not a field of this table's entries.
+        """
+
+        return self.columns[key]
+
+    def get_value(self, index, key):
+        """
+        Returns a single entry value.
+
+        @raise KeyError: if the key is not a field of this table's entries.
+        """
+
+        return self.columns[key][index]
+
+    def set_value(self, index, key, value):
+        """
+        Sets a single entry value.
+
+        @raise KeyError: if the key is not a field of this table's entries.
+        """
+
+        if type(value) is str:
+            value = intern(value)
+
+        column = self.get_writable_column(key, value)
+        try:
+            column[index] = value
+        except OverflowError:
+            column = self.columns[key] = list(column)
+            column[index] = value
+
+    def get_writable_column(self, key, value):
+        """
+        Returns the column that a value for a field can be stored in, turning an array column into a list if the
+        value does not fit in it.
+        """
+
+        column = self.columns[key]
+        if isinstance(column, array) and type(value) not in ARRAY_VALUE_TYPES[column.typecode]:
+            column = self.columns[key] = list(column)
+
+        return column
+
+    def get_values(self, index):
+        """
+        Returns a new dict with all values of an entry.
+        """
+
+        return dict((key, column[index]) for key, column in self.columns.iteritems())
+
+    def set_values(self, index, values):
+        """
+        Sets all values of an entry from a dict.
+        """
+
+        for key in self.columns:
+            self.set_value(index, key, values.get(key))
+
+    def append(self, entry):
+        """
+        Adds a copy of an entry's values to the end of this table.
+        """
+
+        values = entry.get_values()
+        for key in self.columns.keys():
+            value = values.get(key)
+            if type(value) is str:
+                value = intern(value)
+
+            column = self.get_writable_column(key, value)
+            try:
+                column.append(value)
+            except OverflowError:
+                column = self.columns[key] = list(column)
+                column.append(value)
+
+        self.count += 1
+
+    def get_modified_rows(self, source_table):
+        """
+        Returns a sorted list of the indices of entries with values that differ from those in another table of the
+        same size.
+
+        Whole columns are compared first, so that unmodified columns are skipped quickly.
+        """
+
+        modified = set()
+        for key, column in self.columns.iteritems():
+            source_column = source_table.columns[key]
+            if column == source_column:
+                continue
 
-    def write_patch_data(self, source_table, f):
+            for index, (value, source_value) in enumerate(izip(column, source_column)):
+                if value != source_value:
+                    modified.add(index)
+
+        return sorted(modified)
+
+    def get_dirty_rows(self, source_table):
+        """
+        Returns a sorted list of the indices of entries that may differ from those in another table of the same size,
+        including their names.
+
+        This table does not track which entries were modified, so all entries are compared.
+        """
+
+        rows = set(Table.get_modified_rows(self, source_table))
+        if hasattr(self, 'names'):
+            for index in range(self.count):
+                if self.names[index] != source_table.names[index]:
+                    rows.add(index)
+
+        return sorted(rows)
+
+    def write_patch_data(self, source_table, f, full=False):
         """
         Writes this table's entry to a Dehacked patch file.
+
+        @param source_table: the table to write the differences to.
+        @param f: the file object to write to.
+        @param full: if True, all entries are compared to the source table, instead of only the ones that were
+        modified.
         """
 
-        for index in range(len(self.entries)):
-            entry = self.entries[index]
-            source_entry = source_table.entries[index]
+        if full:
+            rows = Table.get_dirty_rows(self, source_table)
+        else:
+            rows = self.get_dirty_rows(source_table)
+
+        for index in rows:
+            entry = self[index]
+            source_entry = source_table[index]
 
             # Write the current entry index if it returns any data to be written.
             patch_str = entry.get_patch_string(source_entry)
@@ -56,25 +276,167 @@ class Table(object):
         """
 
         dup = copy.copy(self)
-        dup_entries = []
-        for entry in self.entries:
-            dup_entries.append(entry.clone())
-        dup.entries = dup_entries
+        dup.columns = OrderedDict((key, column[:]) for key, column in self.columns.iteritems())
 
         return dup
 
-
     def __repr__(self):
-        return '{}: {}'.format(self.entry_class, self.entries)
+        return '{}: {}'.format(self.entry_class, list(self))
 
     def __getitem__(self, index):
-        return self.entries[index]
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError('Table index {} out of range.'.format(index))
+
+        return self.entry_class(self, index=index)
 
     def __setitem__(self, index, value):
-        self.entries[index] = value
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError('Table index {} out of range.'.format(index))
+
+        self.set_values(index, value.get_values())
 
     def __len__(self):
-        return len(self.entries)
+        return self.count
 
     def __iter__(self):
-        return iter(self.entries)
+        for index in xrange(self.count):
+            yield self.entry_class(self, index=index)
+
+
+class OverlayTable(Table):
+    """
+    A copy-on-write table that overlays an engine's table.
+
+    Only rows that were written to are stored, as dicts of values. Reads of other rows fall through to the base table,
+    which is never modified. Storing a row with the same values as the base table removes it from the overlay again.
+
+    Overlay tables always have the same rows as their base table, and only support accessing and changing those. They
+    are not read from executables or JSON, and cannot be appended to. Tables that are loaded into are plain Tables.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.entry_class = base.entry_class
+        self.offset = base.offset
+        self.engine = base.engine
+
+        # Names are copied so that renaming entries does not alter the base table.
+        if hasattr(base, 'names'):
+            self.names = tracked.TrackedList(base.names)
+        if hasattr(base, 'flags'):
+            self.flags = base.flags
+
+        # Dicts of the values of rows that were written to, by row index.
+        self.rows = {}
+
+    @property
+    def count(self):
+        return self.base.count
+
+    @property
+    def columns(self):
+        """
+        Returns a dict of columns with the overlaid values merged in. Only meant for compatibility, prefer the
+        methods that access single values or rows.
+        """
+
+        return OrderedDict((key, self.get_column(key)) for key in self.base.columns)
+
+    def get_column(self, key):
+        """
+        Returns a new list of the values of a field, with the overlaid values merged in.
+
+        @raise KeyError: if the key is not a field of this table's entries.
+        """
+
+        column = list(self.base.get_column(key))
+        for index, row in self.rows.iteritems():
+            column[index] = row[key]
+
+        return column
+
+    def get_value(self, index, key):
+        row = self.rows.get(index)
+        if row is not None:
+            return row[key]
+
+        return self.base.get_value(index, key)
+
+    def set_value(self, index, key, value):
+        if key not in self.base.columns:
+            raise KeyError(key)
+
+        if type(value) is str:
+            value = intern(value)
+
+        row = self.rows.get(index)
+        if row is None:
+            row = self.base.get_values(index)
+            self.rows[index] = row
+
+        row[key] = value
+
+    def get_values(self, index):
+        row = self.rows.get(index)
+        if row is not None:
+            return dict(row)
+
+        return self.base.get_values(index)
+
+    def set_values(self, index, values):
+        row = dict((key, values.get(key)) for key in self.base.columns)
+        if row == self.base.get_values(index):
+            self.rows.pop(index, None)
+        else:
+            self.rows[index] = row
+
+    def get_modified_rows(self, source_table):
+        """
+        @see: Table.get_modified_rows
+
+        Against the base table, only the overlaid rows need to be compared.
+        """
+
+        if source_table is not self.base:
+            return Table.get_modified_rows(self, source_table)
+
+        modified = []
+        for index in sorted(self.rows):
+            if self.rows[index] != self.base.get_values(index):
+                modified.append(index)
+
+        return modified
+
+    def get_dirty_rows(self, source_table):
+        """
+        @see: Table.get_dirty_rows
+
+        Against the base table, only the overlaid rows and entries that were renamed are compared.
+        """
+
+        if source_table is not self.base:
+            return Table.get_dirty_rows(self, source_table)
+
+        rows = set(self.get_modified_rows(source_table))
+        if hasattr(self, 'names'):
+            for index in self.names.dirty:
+                if self.names[index] != source_table.names[index]:
+                    rows.add(index)
+
+        return sorted(rows)
+
+    def clone(self):
+        """
+        Returns a clone of this table, overlaying the same base table.
+        """
+
+        dup = copy.copy(self)
+        if hasattr(self, 'names'):
+            dup.names = copy.copy(self.names)
+        dup.rows = dict((index, dict(row)) for index, row in self.rows.iteritems())
+
+        return dup
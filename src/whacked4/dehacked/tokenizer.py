@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a tokenizer that splits the contents of a Dehacked patch into tokens in a single pass.
+"""
+
+from collections import namedtuple
+
+from whacked4.enumeration import Enum
+
+
+# The first line of a valid Dehacked patch.
+SIGNATURE = 'Patch File for DeHackEd v3.0'
+
+# Sections that start with a keyword, with the minimum and maximum number of space separated words on their line.
+KEYWORD_SECTIONS = {
+    'Thing': (3, None),
+    'Frame': (2, 2),
+    'Sound': (2, 2),
+    'Weapon': (3, None),
+    'Ammo': (3, None),
+    'Sprite': (2, 2),
+    'Pointer': (4, None),
+    'Text': (3, 3)
+}
+
+# Sections that are detected by the start of their line.
+PREFIX_SECTIONS = ['Cheat 0', 'Misc 0', '[PARS]', '[CODEPTR]', '[STRINGS]']
+
+# The first words of lines that can start a section. Other lines are not checked any further.
+SECTION_WORDS = frozenset(KEYWORD_SECTIONS.keys() + [prefix.split(' ')[0] for prefix in PREFIX_SECTIONS])
+
+
+class TokenType(Enum):
+    """
+    Types of Dehacked patch tokens.
+    """
+
+    # The patch signature line.
+    SIGNATURE = 0
+
+    # A section header. The key is the section's keyword or prefix. The value is the list of words on its line, or for
+    # Text sections a tuple of the original and the new text.
+    SECTION = 1
+
+    # A key = value pair. For values in a [STRINGS] section, continuation lines are included in the value.
+    PAIR = 2
+
+    # Any other line.
+    LINE = 3
+
+
+# A single token from a Dehacked patch. Line is the line number the token starts on, text is the stripped line.
+Token = namedtuple('Token', ['type', 'line', 'text', 'key', 'value'])
+
+# Creates tokens from a tuple of their values, without the overhead of the generated keyword argument constructor.
+new_token = tuple.__new__
+
+
+def get_section(line, words):
+    """
+    Returns the key of the section that a line starts, or None if it does not start a section.
+
+    @param line: the stripped line.
+    @param words: the line split by spaces.
+    """
+
+    counts = KEYWORD_SECTIONS.get(words[0])
+    if counts is not None:
+        min_count, max_count = counts
+        if len(words) < min_count or (max_count is not None and len(words) > max_count):
+            return None
+
+        # Ammo sections need a name, to tell them apart from an "Ammo = " key.
+        if words[0] == 'Ammo' and not words[2].startswith('('):
+            return None
+
+        # Text sections need the lengths of their texts.
+        if words[0] == 'Text' and not (words[1].isdigit() and words[2].isdigit()):
+            return None
+
+        return words[0]
+
+    for prefix in PREFIX_SECTIONS:
+        if line.startswith(prefix):
+            return prefix
+
+    return None
+
+
+def tokenize(data):
+    """
+    Generates the tokens of the contents of a Dehacked patch.
+
+    Empty lines and comments are skipped. The original and new texts of Text sections are read from the data directly
+    following their header line.
+
+    @param data: the contents of a patch file.
+    """
+
+    size = len(data)
+    find = data.find
+    pos = 0
+    line_number = 1
+
+    # Whether the tokens are part of a [STRINGS] section, which supports multiline values.
+    strings_section = False
+
+    while pos < size:
+        number = line_number
+        end = find('\n', pos)
+        if end == -1:
+            line = data[pos:].strip()
+            pos = size
+        else:
+            line = data[pos:end].strip()
+            pos = end + 1
+            line_number += 1
+
+        if not line or line[0] == '#':
+            continue
+
+        if line == SIGNATURE:
+            yield new_token(Token, (TokenType.SIGNATURE, number, line, None, None))
+            continue
+
+        # Only split lines that can start a section into words.
+        if line.split(' ', 1)[0] in SECTION_WORDS:
+            words = line.split(' ')
+            section = get_section(line, words)
+            if section is not None:
+                strings_section = (section == '[STRINGS]')
+
+                # Text sections are directly followed by their original and new texts, which can span multiple lines.
+                if section == 'Text':
+                    original_end = min(pos + int(words[1]), size)
+                    new_end = min(original_end + int(words[2]), size)
+                    texts = (data[pos:original_end], data[original_end:new_end])
+
+                    line_number += data.count('\n', pos, new_end)
+                    pos = new_end
+
+                    yield new_token(Token, (TokenType.SECTION, number, line, section, texts))
+                else:
+                    yield new_token(Token, (TokenType.SECTION, number, line, section, words))
+
+                continue
+
+        pair = line.split(' = ', 1)
+        if len(pair) != 2:
+            yield new_token(Token, (TokenType.LINE, number, line, None, None))
+            continue
+
+        key, value = pair
+
+        # Values ending with \ continue on the next line. Continuation lines that do not end with \ end the value.
+        if strings_section and line[-1] == '\\':
+            value = value[:-1]
+            while pos < size:
+                end = find('\n', pos)
+                if end == -1:
+                    next_line = data[pos:]
+                    pos = size
+                else:
+                    next_line = data[pos:end]
+                    pos = end + 1
+                    line_number += 1
+
+                next_line = next_line.lstrip()
+                if not next_line.endswith('\\'):
+                    value += next_line
+                    break
+                value += next_line[:-1]
+
+        yield new_token(Token, (TokenType.PAIR, number, line, key, value))
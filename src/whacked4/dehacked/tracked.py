@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains containers that keep track of which of their items were assigned to.
+"""
+
+from collections import OrderedDict
+
+
+class TrackedList(list):
+    """
+    A list that records the indices of items that were assigned to in its dirty set.
+
+    Only item assignment is tracked. The list's size is not meant to change after it was created.
+    """
+
+    def __init__(self, items=()):
+        list.__init__(self, items)
+        self.dirty = set()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            raise TypeError('Slice assignment is not supported by tracked lists.')
+
+        if index < 0:
+            index += len(self)
+        list.__setitem__(self, index, value)
+        self.dirty.add(index)
+
+    def __setslice__(self, start, end, values):
+        # Python 2 assigns simple slices of lists through this method instead of __setitem__.
+        raise TypeError('Slice assignment is not supported by tracked lists.')
+
+    def __copy__(self):
+        dup = TrackedList(self)
+        dup.dirty = set(self.dirty)
+
+        return dup
+
+
+class TrackedDict(OrderedDict):
+    """
+    An ordered dict that records the keys of items that were assigned to in its dirty set.
+    """
+
+    def __init__(self, items=()):
+        self.dirty = set()
+        OrderedDict.__init__(self, items)
+        self.dirty.clear()
+
+    def __setitem__(self, key, value, *args, **kwargs):
+        OrderedDict.__setitem__(self, key, value, *args, **kwargs)
+        self.dirty.add(key)
+
+    def __copy__(self):
+        dup = TrackedDict(self)
+        dup.dirty = set(self.dirty)
+
+        return dup
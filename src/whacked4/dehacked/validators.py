@@ -6,7 +6,6 @@ This module contains functions used by Dehacked table entries to validate certai
 them.
 """
 
-import math
 import re
 
 
@@ -18,7 +17,13 @@ def thing_flags_read(value, table):
     @raise LookupError: if the value contains an unknown mnemonic.
     """
 
+    # Plain numeric values are the most common, and need no splitting.
+    if type(value) is int and value >= 0:
+        return _get_thing_flag_mnemonics(value, table)
+
     value = str(value)
+    if value.isdigit():
+        return _get_thing_flag_mnemonics(int(value), table)
 
     out = set()
     items = re.split(r"[,+| \t\f\r]+", value)
@@ -35,6 +40,11 @@ def thing_flags_read(value, table):
             if not table.engine.extended:
                 raise LookupError('Encountered thing flag mnemonic "{}" in a non-extended patch.'.format(item))
 
+            mnemonic = table.engine.thing_flag_mnemonics.get(item)
+            if mnemonic is not None:
+                out.add(mnemonic)
+                continue
+
             flag = table.flags.get(item)
             if flag is None:
                 raise LookupError('Ignoring unknown thing flag "{}".'.format(item))
@@ -51,17 +61,19 @@ def thing_flags_read(value, table):
 
 
 def _get_thing_flag_mnemonics(bits, table):
-    out = set()
+    """
+    Returns a set of the mnemonics of the flags set in the lowest 32 bits of a bitfield.
+    """
 
-    for bit in range(0, 32):
-        mask = int(math.pow(2, bit))
-        if (bits & mask) == 0:
-            continue
+    out = set()
 
-        for mnemonic, flag in table.flags.iteritems():
-            if 'index' in flag and flag['index'] == bit:
-                out.add(mnemonic)
-                break
+    bit_mnemonics = table.engine.thing_flag_bits
+    bit = 0
+    while bits != 0 and bit < 32:
+        if bits & 1 and bit_mnemonics[bit] is not None:
+            out.add(bit_mnemonics[bit])
+        bits >>= 1
+        bit += 1
 
     return out
 
@@ -79,12 +91,14 @@ def thing_flags_write(value, table):
 
 def _thing_flags_write_extended(value, table):
     """
-    Returns a thing flags value as a string of extended engine mnemonics.
+    Returns a thing flags value as a string of extended engine mnemonics, in the order that the engine defines them.
     """
 
+    order = table.engine.thing_flag_order
+
     out = []
     for mnemonic in value:
-        if mnemonic not in table.flags:
+        if mnemonic not in order:
             raise LookupError('Unknown thing flag mnemonic "{}".'.format(mnemonic))
 
         out.append(mnemonic)
@@ -92,6 +106,8 @@ def _thing_flags_write_extended(value, table):
     if len(out) == 0:
         return 0
 
+    out.sort(key=order.get)
+
     return '+'.join(out)
 
 
@@ -100,12 +116,14 @@ def _thing_flags_write_vanilla(value, table):
     Returns a thing flags value as a 32 bit integer bitfield.
     """
 
+    masks = table.engine.thing_flag_masks
+
     bits = 0
     for mnemonic in value:
-        flag = table.flags.get(mnemonic)
-        if 'index' not in flag:
+        mask = masks.get(mnemonic)
+        if mask is None:
             raise LookupError('Cannot write non-bitfield thing flag "{}" into a non-extended patch.'.format(mnemonic))
 
-        bits |= int(math.pow(2, flag['index']))
+        bits |= mask
 
     return bits
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a persistent on-disk cache for decoded sprite images.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import zlib
+
+from whacked4 import fileutils
+
+
+class SpriteDiskCache(object):
+    """
+    Stores decoded sprite RGBA data on disk, so that sprites do not need to be decoded again in later sessions.
+
+    Every WAD file gets its own directory, named after a hash of its path. That directory contains a stamp file with
+    the WAD's size and modification time. When a WAD is registered with a different stamp, its directory is emptied,
+    so entries for modified WADs are invalidated automatically. Entries are named after their lump offset and palette
+    hash.
+
+    The total size of all entries is capped. The least recently used entries are removed first, using their file
+    modification times to determine their use across sessions.
+
+    All methods are safe to call from multiple threads.
+    """
+
+    # Entry header. Magic bytes, width, height, left offset, top offset.
+    S_HEADER = struct.Struct('<4sHHhh')
+    MAGIC = 'WSC1'
+
+    STAMP_FILENAME = 'stamp.json'
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+
+        # Entry filenames mapped to their size, from least to most recently used. Built on first use.
+        self.entries = None
+        self.size = 0
+
+        # Directories of WADs whose stamps have been validated.
+        self.wad_paths = {}
+
+    def register_wad(self, wad):
+        """
+        Registers a WAD with this cache, removing all of its cached entries if the WAD has been modified.
+
+        Files are accessed outside of the lock, so that other threads can keep reading entries in the meantime.
+        """
+
+        if self.entries is None:
+            found = self.find_entries()
+            with self.lock:
+                if self.entries is None:
+                    self.set_entries(found)
+
+        wad_path = self.get_wad_path(wad.filename)
+        stamp_filename = os.path.join(wad_path, self.STAMP_FILENAME)
+
+        # The WAD's path is already part of its directory's name.
+        stamp = {
+            'size': wad.size,
+            'mtime': wad.mtime
+        }
+
+        try:
+            with open(stamp_filename, 'r') as f:
+                valid = (json.load(f) == stamp)
+        except (IOError, OSError, ValueError):
+            valid = False
+
+        if not valid:
+            # Stop using the WAD's entries before they are removed.
+            with self.lock:
+                self.wad_paths.pop(wad.filename, None)
+                self.remove_wad_entries(wad_path)
+
+            shutil.rmtree(wad_path, ignore_errors=True)
+            try:
+                os.makedirs(wad_path)
+                with open(stamp_filename, 'w') as f:
+                    json.dump(stamp, f)
+            except (IOError, OSError):
+                return
+
+        with self.lock:
+            self.wad_paths[wad.filename] = wad_path
+
+    def get(self, lump, palette_hash):
+        """
+        Returns cached patch data for a sprite lump.
+
+        @return: a tuple of patch data as returned by graphics.decode_patch(), or None if the lump is not cached.
+        """
+
+        with self.lock:
+            filename = self.get_entry_filename(lump, palette_hash)
+            if filename is None or filename not in self.entries:
+                return None
+
+            try:
+                with open(filename, 'rb') as f:
+                    data = f.read()
+                magic, width, height, left, top = self.S_HEADER.unpack_from(data)
+                image_data = bytearray(zlib.decompress(data[self.S_HEADER.size:]))
+            except (IOError, OSError, struct.error, zlib.error):
+                self.remove_entry(filename)
+                return None
+
+            if magic != self.MAGIC or len(image_data) != width * height * 4:
+                self.remove_entry(filename)
+                return None
+
+            # Mark the entry as most recently used, also for later sessions.
+            self.entries[filename] = self.entries.pop(filename)
+            try:
+                os.utime(filename, None)
+            except OSError:
+                pass
+
+            return width, height, left, top, image_data
+
+    def put(self, lump, palette_hash, patch):
+        """
+        Stores patch data for a sprite lump.
+
+        @param patch: a tuple of patch data as returned by graphics.decode_patch().
+        """
+
+        with self.lock:
+            filename = self.get_entry_filename(lump, palette_hash)
+            if filename is None or filename in self.entries:
+                return
+
+            width, height, left, top, image_data = patch
+            data = self.S_HEADER.pack(self.MAGIC, width, height, left, top) + zlib.compress(bytes(image_data), 1)
+
+            # Write to a temporary file first, so that partially written entries are never read.
+            temp_filename = filename + '.tmp'
+            try:
+                with open(temp_filename, 'wb') as f:
+                    f.write(data)
+                fileutils.replace_file(temp_filename, filename)
+            except (IOError, OSError):
+                return
+
+            self.entries[filename] = len(data)
+            self.size += len(data)
+            self.trim()
+
+    def clear(self):
+        """
+        Removes all entries from this cache.
+        """
+
+        with self.lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+            self.entries = OrderedDict()
+            self.size = 0
+            self.wad_paths = {}
+
+    def find_entries(self):
+        """
+        Returns a list of (modification time, filename, size) tuples of all entries in the cache directory, from least
+        to most recently used.
+        """
+
+        found = []
+        if os.path.isdir(self.path):
+            for wad_dir in os.listdir(self.path):
+                wad_path = os.path.join(self.path, wad_dir)
+                if not os.path.isdir(wad_path):
+                    continue
+
+                for entry in os.listdir(wad_path):
+                    if not entry.endswith('.bin'):
+                        continue
+
+                    filename = os.path.join(wad_path, entry)
+                    try:
+                        found.append((os.path.getmtime(filename), filename, os.path.getsize(filename)))
+                    except OSError:
+                        pass
+
+        found.sort()
+
+        return found
+
+    def set_entries(self, found):
+        """
+        Builds the index of cached entries from a list returned by find_entries().
+        """
+
+        self.entries = OrderedDict()
+        self.size = 0
+        for _, filename, size in found:
+            self.entries[filename] = size
+            self.size += size
+
+        self.trim()
+
+    def trim(self):
+        """
+        Removes the least recently used entries until this cache fits within its maximum size.
+        """
+
+        while self.size > self.max_size and len(self.entries) > 0:
+            self.remove_entry(next(iter(self.entries)))
+
+    def get_wad_path(self, wad_filename):
+        """
+        Returns the directory that contains a WAD file's entries.
+        """
+
+        wad_filename = os.path.normcase(os.path.abspath(wad_filename))
+        if isinstance(wad_filename, unicode):
+            wad_filename = wad_filename.encode('utf8')
+
+        return os.path.join(self.path, hashlib.sha1(wad_filename).hexdigest())
+
+    def get_entry_filename(self, lump, palette_hash):
+        """
+        Returns the filename of a lump's entry, or None if the lump's WAD has not been registered.
+        """
+
+        wad_path = self.wad_paths.get(lump.owner.filename)
+        if wad_path is None:
+            return None
+
+        return os.path.join(wad_path, '{}_{}.bin'.format(lump.offset, palette_hash))
+
+    def remove_entry(self, filename):
+        """
+        Removes a single entry.
+        """
+
+        size = self.entries.pop(filename, None)
+        if size is not None:
+            self.size -= size
+
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def remove_wad_entries(self, wad_path):
+        """
+        Removes the entries in the directory of a WAD from the index. Their files are not removed.
+        """
+
+        prefix = wad_path + os.sep
+        for filename in [filename for filename in self.entries if filename.startswith(prefix)]:
+            self.size -= self.entries.pop(filename)
+
@@ -5,8 +5,15 @@
 Contains classes to read Doom style patch graphics, and Doom PLAYPAL lump palette data.
 """
 
+import copy
+import hashlib
 import struct
-import wx
+
+# wx is only needed to create bitmaps, patches can be decoded without it.
+try:
+    import wx
+except ImportError:
+    wx = None
 
 
 class Palette(object):
@@ -20,7 +27,7 @@ class Palette(object):
         if len(data) < 768:
             raise Exception('Not enough data for a 256 RGB color palette.')
 
-        data = bytearray(data)
+        data = bytearray(data[:768])
 
         offset = 0
         while offset < 768:
@@ -28,6 +35,14 @@ class Palette(object):
             self.colors.append(entry)
             offset += 3
 
+        # Per-channel translation tables, to map entire runs of palette indices to colors at once.
+        self.red = bytes(data[0::3])
+        self.green = bytes(data[1::3])
+        self.blue = bytes(data[2::3])
+
+        # A short hash of the palette's colors, to identify sprites decoded with it.
+        self.hash = hashlib.sha1(bytes(data)).hexdigest()[:16]
+
 
 class Image(object):
     """
@@ -36,82 +51,53 @@ class Image(object):
 
     S_HEADER = struct.Struct('<HHhh')
 
-    def __init__(self, data, palette, mirror=False):
+    def __init__(self, data=None, palette=None, mirror=False):
         self.set_empty()
         self.invalid = False
 
-        width, height, left, top = self.S_HEADER.unpack_from(data)
+        if data is not None:
+            self.set_patch(decode_patch(data, palette), mirror)
 
-        # Attempt to detect invalid data.
-        if width > 2048 or height > 2048 or top > 2048 or left > 2048:
-            self.set_invalid()
-            return
-        if width <= 0 or height <= 0:
-            self.set_invalid()
-            return
-
-        # Initialize an empty bitmap.
-        image_data = bytearray([0, 0, 0, 0] * width * height)
-
-        # Read column offsets.
-        offset_struct = struct.Struct('<' + ('I' * width))
-        offsets = offset_struct.unpack_from(data[8:8 + (width * 4)])
+    def set_patch(self, patch, mirror=False):
+        """
+        Sets this image from decoded patch data.
 
-        # Read columns.
-        data = bytearray(data)
-        column_index = 0
-        while column_index < width:
-            offset = offsets[column_index]
-
-            # Attempt to detect invalid data.
-            if offset < 0 or offset > len(data):
-                self.set_invalid()
-                return
+        This creates a bitmap, so it must be called from the main thread.
 
-            prev_delta = 0
-            while True:
-                column_top = data[offset]
+        @param patch: a tuple of patch data as returned by decode_patch(), or None if the patch is invalid.
+        @param mirror: if True, the image is mirrored horizontally.
+        """
 
-                # Column end.
-                if column_top == 255:
-                    break
-
-                # Tall columns are extended.
-                if column_top <= prev_delta:
-                    column_top += prev_delta
-                prev_delta = column_top
-
-                pixel_count = data[offset + 1]
-                offset += 3
-
-                pixel_index = 0
-                while pixel_index < pixel_count:
-                    pixel = data[offset + pixel_index]
-                    if mirror:
-                        dest = ((pixel_index + column_top) * width + ((width - 1) - column_index)) * 4
-                    else:
-                        dest = ((pixel_index + column_top) * width + column_index) * 4
-
-                    # Plot pixel from palette.
-                    image_data[dest] = palette.colors[pixel][0]
-                    image_data[dest + 1] = palette.colors[pixel][1]
-                    image_data[dest + 2] = palette.colors[pixel][2]
-                    image_data[dest + 3] = 255
-
-                    pixel_index += 1
-
-                offset += pixel_count + 1
+        if patch is None:
+            self.set_invalid()
+            return
 
-            column_index += 1
+        width, height, left, top, image_data = patch
+        if mirror:
+            image_data = flip_rgba(image_data, width, height)
 
         self.width = width
         self.height = height
         self.top = top
         self.left = left
+        self.invalid = False
 
         # Create usable bitmap.
         self.image = wx.BitmapFromBufferRGBA(width, height, image_data)
 
+    def mirrored(self):
+        """
+        Returns a horizontally mirrored copy of this image.
+
+        The copy is made from this image's bitmap, so that the patch does not need to be decoded again.
+        """
+
+        dup = copy.copy(self)
+        if self.image is not None:
+            dup.image = wx.BitmapFromImage(self.image.ConvertToImage().Mirror(True))
+
+        return dup
+
     def set_empty(self):
         self.width = 0
         self.height = 0
@@ -123,3 +109,193 @@ class Image(object):
     def set_invalid(self):
         self.set_empty()
         self.invalid = True
+
+
+def decode_patch(data, palette):
+    """
+    Decodes Doom patch data into RGBA pixel data.
+
+    Each post of a column is decoded as a whole; its palette indices are translated per color channel and written to
+    every row it spans with a single strided slice assignment per channel. Posts that extend beyond the bottom of the
+    patch are clipped.
+
+    @param data: the patch data. This may be a view into a memory mapped WAD file.
+    @param palette: the palette to map patch pixels with.
+
+    @return: a tuple containing the patch width, height, left offset, top offset and a bytearray of RGBA pixel data.
+    None is returned if the patch data is invalid.
+    """
+
+    if len(data) < Image.S_HEADER.size:
+        return None
+
+    width, height, left, top = Image.S_HEADER.unpack_from(data)
+
+    # Attempt to detect invalid data.
+    if width > 2048 or height > 2048 or top > 2048 or left > 2048:
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    if len(data) < Image.S_HEADER.size + width * 4:
+        return None
+
+    # Read column offsets.
+    offsets = struct.unpack_from('<{}I'.format(width), data, Image.S_HEADER.size)
+
+    # Initialize an empty bitmap.
+    stride = width * 4
+    image_data = bytearray(stride * height)
+
+    # Read columns from a temporary copy, since views into mapped WAD files index as characters.
+    data = bytearray(data)
+    data_size = len(data)
+
+    for column_index, offset in enumerate(offsets):
+        prev_delta = 0
+        while True:
+
+            # Attempt to detect invalid data.
+            if offset >= data_size:
+                return None
+
+            column_top = data[offset]
+
+            # Column end.
+            if column_top == 255:
+                break
+
+            # Tall columns are extended.
+            if column_top <= prev_delta:
+                column_top += prev_delta
+            prev_delta = column_top
+
+            if offset + 1 >= data_size:
+                return None
+
+            pixel_count = data[offset + 1]
+            pixels = data[offset + 3:offset + 3 + pixel_count]
+            if len(pixels) < pixel_count:
+                return None
+            offset += pixel_count + 4
+
+            # Clip posts to the patch height.
+            pixel_count = min(pixel_count, height - column_top)
+            if pixel_count <= 0:
+                continue
+            if pixel_count < len(pixels):
+                pixels = pixels[:pixel_count]
+
+            # Plot the post's pixels from the palette.
+            dest = (column_top * width + column_index) * 4
+            end = dest + pixel_count * stride
+            image_data[dest:end:stride] = pixels.translate(palette.red)
+            image_data[dest + 1:end + 1:stride] = pixels.translate(palette.green)
+            image_data[dest + 2:end + 2:stride] = pixels.translate(palette.blue)
+            image_data[dest + 3:end + 3:stride] = b'\xff' * pixel_count
+
+    return width, height, left, top, image_data
+
+
+def decode_patch_reference(data, palette, mirror=False):
+    """
+    Decodes Doom patch data into RGBA pixel data, one pixel at a time.
+
+    This is a straightforward version of decode_patch() that plots every pixel separately. It produces identical
+    output, and is used to test decode_patch() and flip_rgba() against.
+
+    @param data: the patch data.
+    @param palette: the palette to map patch pixels with.
+    @param mirror: if True, the image is mirrored horizontally while it is decoded.
+
+    @return: the same as decode_patch().
+    """
+
+    if len(data) < Image.S_HEADER.size:
+        return None
+
+    width, height, left, top = Image.S_HEADER.unpack_from(data)
+
+    # Attempt to detect invalid data.
+    if width > 2048 or height > 2048 or top > 2048 or left > 2048:
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    if len(data) < Image.S_HEADER.size + width * 4:
+        return None
+
+    offsets = struct.unpack_from('<{}I'.format(width), data, Image.S_HEADER.size)
+    image_data = bytearray(width * height * 4)
+    data = bytearray(data)
+
+    for column_index, offset in enumerate(offsets):
+        if mirror:
+            x = width - 1 - column_index
+        else:
+            x = column_index
+
+        prev_delta = 0
+        while True:
+
+            # Attempt to detect invalid data.
+            if offset >= len(data):
+                return None
+
+            column_top = data[offset]
+
+            # Column end.
+            if column_top == 255:
+                break
+
+            # Tall columns are extended.
+            if column_top <= prev_delta:
+                column_top += prev_delta
+            prev_delta = column_top
+
+            if offset + 1 >= len(data):
+                return None
+
+            pixel_count = data[offset + 1]
+            if offset + 3 + pixel_count > len(data):
+                return None
+
+            for pixel_index in xrange(pixel_count):
+                y = column_top + pixel_index
+
+                # Clip posts to the patch height.
+                if y >= height:
+                    break
+
+                # Plot pixel from palette.
+                dest = (y * width + x) * 4
+                image_data[dest:dest + 4] = palette.colors[data[offset + 3 + pixel_index]]
+
+            offset += pixel_count + 4
+
+    return width, height, left, top, image_data
+
+
+def flip_rgba(image_data, width, height):
+    """
+    Returns a horizontally mirrored copy of RGBA pixel data.
+
+    Reversing the entire buffer mirrors every row, but also reverses the row order and the byte order within each
+    pixel. Those are restored with one strided slice assignment per channel and one slice copy per row.
+    """
+
+    reverse = image_data[::-1]
+
+    # Restore RGBA byte order.
+    swapped = bytearray(len(image_data))
+    swapped[0::4] = reverse[3::4]
+    swapped[1::4] = reverse[2::4]
+    swapped[2::4] = reverse[1::4]
+    swapped[3::4] = reverse[0::4]
+
+    # Restore row order.
+    stride = width * 4
+    flipped = bytearray(len(image_data))
+    for row in range(height):
+        source = (height - 1 - row) * stride
+        flipped[row * stride:(row + 1) * stride] = swapped[source:source + stride]
+
+    return flipped
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a memory bounded cache for decoded images.
+"""
+
+from collections import OrderedDict
+
+
+class ImageCache(object):
+    """
+    A least recently used cache of images, bounded by the size of their pixel data.
+
+    Each image is accounted for as width * height * 4 bytes, the size of its RGBA bitmap.
+    """
+
+    def __init__(self, max_size):
+        # The maximum size of all cached images' pixel data, in bytes.
+        self.max_size = max_size
+
+        # The current size of all cached images' pixel data, in bytes.
+        self.size = 0
+
+        # Cached images, in order of least to most recently used.
+        self.images = OrderedDict()
+
+        # Lookup statistics.
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns a cached image and marks it as the most recently used one.
+
+        @return: the cached image, or None if no image is cached with the key.
+        """
+
+        image = self.images.pop(key, None)
+        if image is None:
+            self.misses += 1
+            return None
+
+        self.images[key] = image
+        self.hits += 1
+
+        return image
+
+    def put(self, key, image):
+        """
+        Adds an image to this cache, replacing any image cached with the same key.
+
+        The least recently used images are evicted until the cache fits within its maximum size again. The image
+        that was just added is never evicted, even if it alone exceeds the maximum size.
+        """
+
+        if key in self.images:
+            self.size -= get_image_size(self.images.pop(key))
+
+        self.images[key] = image
+        self.size += get_image_size(image)
+
+        while self.size > self.max_size and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.size -= get_image_size(evicted)
+
+    def remove(self, key):
+        """
+        Removes an image from this cache, if it is cached.
+        """
+
+        image = self.images.pop(key, None)
+        if image is not None:
+            self.size -= get_image_size(image)
+
+    def set_max_size(self, max_size):
+        """
+        Sets the maximum size of this cache, evicting images if it no longer fits.
+        """
+
+        self.max_size = max_size
+
+        while self.size > self.max_size and len(self.images) > 0:
+            _, evicted = self.images.popitem(last=False)
+            self.size -= get_image_size(evicted)
+
+    def clear(self):
+        """
+        Removes all images from this cache. Lookup statistics are retained.
+        """
+
+        self.images = OrderedDict()
+        self.size = 0
+
+    def get_stats(self):
+        """
+        Returns a dict of this cache's usage statistics.
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'count': len(self.images),
+            'size': self.size,
+            'max_size': self.max_size
+        }
+
+    def __contains__(self, key):
+        return key in self.images
+
+    def __len__(self):
+        return len(self.images)
+
+
+def get_image_size(image):
+    """
+    Returns the number of bytes an image's RGBA pixel data occupies.
+    """
+
+    return image.width * image.height * 4
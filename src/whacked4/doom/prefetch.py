@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a background sprite decoder that fills a WAD list's sprite image cache ahead of time.
+"""
+
+import Queue
+import threading
+import wx
+
+from whacked4.doom import graphics
+
+
+class SpritePrefetcher(object):
+    """
+    Decodes sprite lumps in worker threads.
+
+    Workers only decode patch data. The decoded data is handed to the main thread with wx.CallAfter, where the bitmap
+    is created and stored in the WAD list's sprite image cache. Queued work is cancelled whenever a new set of sprites
+    is requested, or when cancel() is called.
+    """
+
+    def __init__(self, wads, worker_count=1):
+        self.wads = wads
+        self.worker_count = worker_count
+
+        self.queue = Queue.Queue()
+        self.workers = []
+
+        # Incremented every time queued work is cancelled. Work from older generations is discarded.
+        self.generation = 0
+
+    def prefetch(self, lumps):
+        """
+        Cancels any pending work and starts decoding a new list of sprite lumps.
+
+        @param lumps: a list of sprite lumps to decode. Lumps that are already cached are skipped.
+        """
+
+        self.cancel()
+
+        if self.wads.palette is None:
+            return
+
+        if len(self.workers) == 0:
+            self.start_workers()
+
+        for lump in lumps:
+            if (lump.name, False) not in self.wads.sprite_image_cache:
+                self.queue.put((self.generation, lump, self.wads.palette))
+
+    def cancel(self):
+        """
+        Cancels all pending work.
+
+        Sprites that are being decoded while this is called are discarded once they are done.
+        """
+
+        self.generation += 1
+
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                break
+
+    def start_workers(self):
+        """
+        Starts this prefetcher's worker threads. They run as daemon threads so that they do not prevent exiting.
+        """
+
+        for _ in range(self.worker_count):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+
+            self.workers.append(worker)
+
+    def work(self):
+        """
+        Worker thread main loop.
+        """
+
+        while True:
+            generation, lump, palette = self.queue.get()
+            if generation != self.generation:
+                continue
+
+            # The lump's WAD may have been closed in the meantime.
+            try:
+                patch = self.wads.get_sprite_patch(lump, palette)
+            except ValueError:
+                continue
+
+            if generation == self.generation:
+                wx.CallAfter(self.store, generation, lump, patch)
+
+    def store(self, generation, lump, patch):
+        """
+        Stores a decoded sprite in the WAD list's sprite image cache. Called on the main thread.
+        """
+
+        if generation != self.generation:
+            return
+
+        key = (lump.name, False)
+        if key in self.wads.sprite_image_cache:
+            return
+
+        image = graphics.Image()
+        image.set_patch(patch)
+        self.wads.sprite_image_cache.put(key, image)
@@ -3,12 +3,20 @@
 
 """
 Classes for Doom audio reading and playback using the PyAudio PortAudio bindings.
+
+All playback goes through a single long-lived mixer, which mixes any number of concurrently playing sounds into one
+output stream. If PyAudio is not available, a null output backend is used, which never outputs any audio.
 """
 
-import pyaudio
+import audioop
 import struct
 import threading
 
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
 
 class Sound(object):
     """
@@ -24,6 +32,10 @@ class Sound(object):
         self.sample_count = 0
         self.samples = None
 
+        # Samples converted to the mixer's output format, and the rate they were converted to.
+        self.mix_samples = None
+        self.mix_rate = None
+
     def read_from(self, data):
         """
         Reads sound data from a lump.
@@ -38,36 +50,238 @@ class Sound(object):
         if self.format != 3:
             return
 
-        # Slice sample data from the rest of the lump.
+        # Slice sample data from the rest of the lump. This copies the samples out of the lump data, so that they can
+        # still be played back after a memory mapped WAD file has been closed.
         self.samples = data[self.SOUND_HEADER.size:]
 
+    def get_mix_samples(self, rate):
+        """
+        Returns this sound's samples as signed 16 bit mono samples at a specified rate.
+
+        The converted samples are kept, so that a sound only needs to be converted the first time it is played.
+        """
+
+        if self.mix_rate != rate:
+            samples = audioop.bias(self.samples, 1, -128)
+            samples = audioop.lin2lin(samples, 1, 2)
+            if self.sample_rate != rate:
+                samples = audioop.ratecv(samples, 2, 1, self.sample_rate, rate, None)[0]
+
+            self.mix_samples = samples
+            self.mix_rate = rate
+
+        return self.mix_samples
+
     def play(self):
         """
         Plays this sound.
+
+        If this sound is already playing, it is restarted.
         """
 
-        # Start a new playback thread so that this function call does not block.
-        player = PlaybackThread(self.sample_rate, self.samples)
-        player.start()
+        if self.samples is None or self.sample_rate == 0:
+            return
+
+        get_mixer().play(self)
 
 
-class PlaybackThread(threading.Thread):
+class Voice(object):
     """
-    A thread that uses PyAudio to play back raw sample data.
+    A sound that is being played back by a mixer.
     """
 
-    def __init__(self, sample_rate, samples):
-        threading.Thread.__init__(self)
-
-        self.sample_rate = sample_rate
+    def __init__(self, sound, samples):
+        self.sound = sound
         self.samples = samples
+        self.position = 0
+
+
+class Mixer(object):
+    """
+    Mixes a number of voices into a single stream of signed 16 bit mono samples.
+
+    The voices are mixed when the output backend requests more samples, which is usually from another thread.
+    """
+
+    # The sample rate of the mixed output.
+    RATE = 44100
+
+    # The maximum number of sounds to play at once.
+    MAX_VOICES = 8
+
+    def __init__(self, backend_class, rate=RATE, max_voices=MAX_VOICES):
+        self.rate = rate
+        self.max_voices = max_voices
+
+        self.lock = threading.Lock()
+        self.voices = []
+
+        self.backend = backend_class(self)
+
+    def play(self, sound):
+        """
+        Starts playing a sound.
+
+        A sound that is already playing is stopped first. If all voices are in use, the oldest one is stopped.
+        """
+
+        voice = Voice(sound, sound.get_mix_samples(self.rate))
+
+        with self.lock:
+            self.voices = [playing for playing in self.voices if playing.sound is not sound]
+            if len(self.voices) >= self.max_voices:
+                del self.voices[0]
+
+            self.voices.append(voice)
+
+        self.backend.start()
+
+    def stop(self, sound=None):
+        """
+        Stops playing a sound, or all sounds if none is specified.
+        """
+
+        with self.lock:
+            if sound is None:
+                self.voices = []
+            else:
+                self.voices = [playing for playing in self.voices if playing.sound is not sound]
+
+    def mix(self, frame_count):
+        """
+        Mixes the next number of frames of all playing voices.
+
+        Voices that have finished playing are removed.
+
+        @return: a string of signed 16 bit mono samples.
+        """
+
+        size = frame_count * 2
+        output = '\0' * size
+
+        with self.lock:
+            for voice in self.voices:
+                data = voice.samples[voice.position:voice.position + size]
+                voice.position += size
+
+                if len(data) < size:
+                    data += '\0' * (size - len(data))
+                output = audioop.add(output, data, 2)
+
+            self.voices = [voice for voice in self.voices if voice.position < len(voice.samples)]
+
+        return output
+
+    def close(self):
+        """
+        Stops all playback and closes the output backend.
+        """
+
+        self.stop()
+        self.backend.close()
+
+
+class NullBackend(object):
+    """
+    An output backend that does not output any audio.
+
+    Voices are only advanced when the mixer's mix method is called directly.
+    """
+
+    def __init__(self, mixer):
+        self.mixer = mixer
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PyAudioBackend(object):
+    """
+    An output backend that keeps a single PyAudio output stream open.
+
+    The stream is opened the first time a sound is played, and requests mixed samples through a callback. If the
+    stream cannot be opened, for example because there is no output device, this backend behaves like a NullBackend.
+    """
+
+    def __init__(self, mixer):
+        self.mixer = mixer
+
+        self.audio = None
+        self.stream = None
+
+        # Set if the output stream could not be opened, so that it is not attempted again.
+        self.failed = False
+
+    def start(self):
+        """
+        Opens the output stream if it is not open yet.
+        """
+
+        if self.stream is not None or self.failed:
+            return
 
-    def run(self):
-        aud = pyaudio.PyAudio()
+        audio = pyaudio.PyAudio()
+        try:
+            stream = audio.open(format=pyaudio.paInt16, channels=1, rate=self.mixer.rate, output=True,
+                                stream_callback=self.callback)
+        except IOError as e:
+            audio.terminate()
+            self.failed = True
+            print 'Cannot open an audio output stream, sounds will not be played: {}'.format(e)
+            return
+
+        self.audio = audio
+        self.stream = stream
+
+    def callback(self, in_data, frame_count, time_info, status):
+        return self.mixer.mix(frame_count), pyaudio.paContinue
+
+    def close(self):
+        """
+        Closes the output stream.
+        """
+
+        if self.stream is None:
+            return
+
+        self.stream.stop_stream()
+        self.stream.close()
+        self.stream = None
+
+        self.audio.terminate()
+        self.audio = None
+
+
+# The global mixer that all sounds are played back with.
+mixer = None
+
+
+def get_mixer():
+    """
+    Returns the global mixer, creating it if needed.
+    """
+
+    global mixer
+
+    if mixer is None:
+        if pyaudio is None:
+            mixer = Mixer(NullBackend)
+        else:
+            mixer = Mixer(PyAudioBackend)
+
+    return mixer
+
+
+def close_mixer():
+    """
+    Closes the global mixer, if it was created.
+    """
 
-        stream = aud.open(format=pyaudio.paUInt8, channels=1, rate=self.sample_rate, output=True)
-        stream.write(self.samples)
-        stream.stop_stream()
-        stream.close()
+    global mixer
 
-        aud.terminate()
+    if mixer is not None:
+        mixer.close()
+        mixer = None
@@ -5,7 +5,12 @@
 Contains Doom WAD file reading classes.
 """
 
+from array import array
+import mmap
+import os
+import re
 import struct
+import sys
 
 
 class WADError(Exception):
@@ -31,7 +36,8 @@ class Lump(object):
     A lump that is part of a WAD file.
 
     It is recommended to access a lump's data through the get_data() method to prevent having to load an entire
-    WAD's data in memory.
+    WAD's data in memory. If the owning WAD is memory mapped, get_data() returns a view into the mapped file instead
+    of a copy.
     """
 
     def __init__(self, name, size, offset, owner):
@@ -45,9 +51,14 @@ class Lump(object):
         """
         Returns this lump's data.
 
-        If the data has not yet been read, it will open the WAD file and read it before returning it.
+        If the owning WAD is memory mapped, a read-only view into the mapped file is returned. The view is only valid
+        as long as the WAD has not been closed, so anything that needs to outlive it should copy the data it needs.
+        Otherwise, if the data has not yet been read, it will open the WAD file and read it before returning it.
         """
 
+        if self.owner.map is not None:
+            return self.owner.get_view(self.offset, self.size)
+
         if self.data is None:
             with open(self.owner.filename, 'rb') as f:
                 f.seek(self.offset)
@@ -56,9 +67,24 @@ class Lump(object):
         return self.data
 
 
+# Whether WAD files are memory mapped by default. On Windows an open mapping prevents other programs from replacing or
+# truncating the file, so WAD files are read from when needed instead.
+MAP_FILES = sys.platform != 'win32'
+
+# The array typecode of unsigned 32 bit integers.
+if array('I').itemsize == 4:
+    UINT32 = 'I'
+else:
+    UINT32 = 'L'
+
+
 class WADReader(object):
     """
     Reads Doom WAD files.
+
+    The lump directory is kept in compact form: a single buffer of fixed width lump names, and arrays of lump offsets
+    and sizes. Lumps are only looked up by name and Lump objects are only created when they are requested, so that
+    WADs with very many lumps do not need a Python object for every lump.
     """
 
     TYPE_IWAD = 'IWAD'
@@ -67,69 +93,340 @@ class WADReader(object):
     S_HEADER = struct.Struct("<4sII")
     S_LUMP = struct.Struct("<II8s")
 
-    def __init__(self, filename):
+    # The width of a lump name in the name buffer.
+    NAME_SIZE = 8
+
+    # Matches a NULL character that is followed by garbage in a lump name.
+    RE_NAME_GARBAGE = re.compile('\x00[^\x00]')
+
+    def __init__(self, filename, mapped=MAP_FILES, cache=None):
         self.filename = None
-        self.lumps = None
         self.type = None
 
-        self.read(filename)
+        # The size and modification time of the WAD file when it was read.
+        self.size = 0
+        self.mtime = 0
+
+        # The lump directory, in directory order. Names are stored in a single string of NULL padded 8 byte names,
+        # offsets and sizes in arrays of unsigned 32 bit integers.
+        self.names = None
+        self.offsets = None
+        self.sizes = None
+
+        # Maps lump names that have been looked up to the directory index of the last lump with that name, or None.
+        self.lump_index = None
+
+        # Maps sprite lump names to their directory index.
+        self.sprite_index = None
+
+        # Lump objects that have been created so far, by directory index.
+        self.lumps = None
+
+        # The memory map of the WAD file, if it is opened in mapped mode.
+        self.map = None
+
+        self.read(filename, mapped, cache)
 
-    def read(self, filename):
+    def read(self, filename, mapped=MAP_FILES, cache=None):
         """
         Reads a WAD file's header and lump directory.
 
+        @param filename: the filename of the WAD file to read.
+        @param mapped: if True, the WAD file is memory mapped once and lump data is returned as views into the map. The
+        map stays open until close() is called. Defaults to MAP_FILES.
+        @param cache: an optional wadcache.WADDirectoryCache to read the lump directory from, if it contains an
+        up to date copy of it. Otherwise the directory that is read from the file is stored in it.
+
+        @raise WADError: if the WAD file is too small to contain a header or lump directory.
         @raise WADTypeError: if the WAD file is not of a valid type (IWAD or PWAD).
         """
 
+        self.close()
+
         with open(filename, 'rb') as f:
+            stat = os.fstat(f.fileno())
+
+            if mapped:
+                try:
+                    wad_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (mmap.error, ValueError) as e:
+                    raise WADError('Cannot map WAD file "{}": {}'.format(filename, e))
+            else:
+                wad_map = None
+
+            entry = None
+            if cache is not None:
+                entry = cache.get(filename, stat.st_size, stat.st_mtime)
+
+            try:
+                if entry is None:
+                    self.read_directory(f, wad_map)
+                else:
+                    self.set_directory(entry)
+            except WADError:
+                if wad_map is not None:
+                    wad_map.close()
+                raise
 
-            # Read and validate header. Should contain PWAD or IWAD magic bytes.
-            wad_type, entry_count, dir_offset = self.S_HEADER.unpack(f.read(self.S_HEADER.size))
-            wad_type = wad_type.decode('ascii')
-            if wad_type != self.TYPE_IWAD and wad_type != self.TYPE_PWAD:
-                raise WADTypeError('Invalid WAD type "{}"'.format(type))
+        self.filename = filename
+        self.map = wad_map
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.lump_index = {}
+        self.lumps = {}
 
-            # Read lump directory.
-            f.seek(dir_offset)
-            self.lumps = []
-            for _ in range(entry_count):
-                offset, size, name = self.S_LUMP.unpack(f.read(self.S_LUMP.size))
+        if cache is not None and entry is None:
+            cache.put(filename, stat.st_size, stat.st_mtime, self.get_directory())
 
-                # Strip trailing NULL characters.
-                name = name.split('\x00')[0].decode('ascii')
+    def read_directory(self, f, wad_map):
+        """
+        Reads and validates a WAD file's header and lump directory.
 
-                self.lumps.append(Lump(name, size, offset, self))
+        @param f: the opened WAD file.
+        @param wad_map: the memory map of the WAD file, or None if it is not mapped.
+        """
 
-        self.filename = filename
+        # Read and validate header. Should contain PWAD or IWAD magic bytes.
+        header = f.read(self.S_HEADER.size)
+        if len(header) < self.S_HEADER.size:
+            raise WADError('Not enough data for a WAD header.')
+
+        wad_type, entry_count, dir_offset = self.S_HEADER.unpack(header)
+        wad_type = wad_type.decode('ascii')
+        if wad_type != self.TYPE_IWAD and wad_type != self.TYPE_PWAD:
+            raise WADTypeError('Invalid WAD type "{}"'.format(wad_type))
+
+        # Read the lump directory from the mapped file, or from the file itself.
+        dir_size = entry_count * self.S_LUMP.size
+        if wad_map is not None:
+            if dir_offset + dir_size > len(wad_map):
+                raise WADError('The WAD lump directory extends beyond the end of the file.')
+            directory = buffer(wad_map, dir_offset, dir_size)
+
+        else:
+            f.seek(dir_offset)
+            directory = f.read(dir_size)
+            if len(directory) < dir_size:
+                raise WADError('The WAD lump directory extends beyond the end of the file.')
+
+        # Unpack all offsets and sizes at once, as an array of 4 integers per lump.
+        values = array(UINT32)
+        values.fromstring(directory)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        self.offsets = values[0::4]
+        self.sizes = values[1::4]
+
+        # Gather the lump names into a buffer of their own, one byte column at a time.
+        directory = bytearray(directory)
+        names = bytearray(entry_count * self.NAME_SIZE)
+        for column in range(self.NAME_SIZE):
+            names[column::self.NAME_SIZE] = directory[8 + column::self.S_LUMP.size]
+
+        # Some lump names have garbage after their terminating NULL character, clear it so that names can be compared
+        # as whole fixed width strings.
+        for match in self.RE_NAME_GARBAGE.finditer(str(names)):
+            start = match.start()
+            end = start + self.NAME_SIZE - start % self.NAME_SIZE
+            names[start:end] = bytearray(end - start)
+
+        self.names = str(names)
         self.type = wad_type
+        self.sprite_index = self.find_sprites()
 
-    def get_lump(self, lump_name):
+    def find_sprites(self):
         """
-        Searches this WAD's lump directory for a lump by name.
+        Returns a dict of sprite lump names mapped to their directory index.
 
-        @return: the first matching lump with the specified name, or None if no lump with that name could be found.
+        Sprite lumps are all lumps between S_START and S_END or SS_START and SS_END markers. If a sprite name occurs
+        more than once, the first one is used.
         """
 
-        for lump in reversed(self.lumps):
-            if lump.name == lump_name:
-                return lump
-
-        return None
+        # Find all section markers. Only the lumps between them need to be visited.
+        markers = []
+        for name in ('S_START', 'SS_START'):
+            markers.extend((index, False) for index in self.find_lump_indices(name))
+        for name in ('S_END', 'SS_END'):
+            markers.extend((index, True) for index in self.find_lump_indices(name))
+        markers.sort(reverse=True)
 
-    def get_sprite_lumps(self):
         sprites = {}
         section_active = False
+        section_end = len(self)
 
         # Note that these are iterated in reverse, so reverse logic applies for deleting the start and end of
         # the sprite list.
-        for lump in reversed(self.lumps):
-            if lump.name == 'SS_START' or lump.name == 'S_START':
-                section_active = False
-                continue
-            elif lump.name == 'SS_END' or lump.name == 'S_END':
-                section_active = True
-                continue
-            elif section_active:
-                sprites[lump.name] = lump
+        for marker_index, is_end in markers:
+            if section_active:
+                for index in range(section_end - 1, marker_index, -1):
+                    sprites[self.get_name(index)] = index
+            section_active = is_end
+            section_end = marker_index
+
+        if section_active:
+            for index in range(section_end - 1, -1, -1):
+                sprites[self.get_name(index)] = index
 
         return sprites
+
+    def get_name(self, index):
+        """
+        Returns the name of the lump at a lump directory index.
+        """
+
+        start = index * self.NAME_SIZE
+        return self.names[start:start + self.NAME_SIZE].rstrip('\x00')
+
+    def find_lump_indices(self, lump_name):
+        """
+        Returns the directory indices of all lumps with a name, in directory order.
+        """
+
+        key = get_name_key(lump_name)
+        if key is None:
+            return []
+
+        indices = []
+        position = self.names.find(key)
+        while position != -1:
+            if position % self.NAME_SIZE == 0:
+                indices.append(position / self.NAME_SIZE)
+                position = self.names.find(key, position + self.NAME_SIZE)
+            else:
+                position = self.names.find(key, position + 1)
+
+        return indices
+
+    def find_lump(self, lump_name):
+        """
+        Returns the directory index of the last lump with a name, or None if there is no lump with that name.
+
+        The name buffer is searched directly, and the result is remembered for later lookups.
+        """
+
+        if lump_name in self.lump_index:
+            return self.lump_index[lump_name]
+
+        index = None
+        key = get_name_key(lump_name)
+        if key is not None:
+            position = self.names.rfind(key)
+            while position != -1:
+                if position % self.NAME_SIZE == 0:
+                    index = position / self.NAME_SIZE
+                    break
+                position = self.names.rfind(key, 0, position + self.NAME_SIZE - 1)
+
+        self.lump_index[lump_name] = index
+        return index
+
+    def get_directory(self):
+        """
+        Returns this WAD's lump directory as a dict of simple types, to store in a directory cache.
+        """
+
+        return {
+            'type': self.type,
+            'names': self.names,
+            'offsets': self.offsets.tostring(),
+            'sizes': self.sizes.tostring(),
+            'spriteIndex': self.sprite_index
+        }
+
+    def set_directory(self, directory):
+        """
+        Sets this WAD's lump directory from a dict returned by get_directory().
+        """
+
+        self.type = directory['type']
+        self.names = directory['names']
+        self.offsets = array(UINT32)
+        self.offsets.fromstring(directory['offsets'])
+        self.sizes = array(UINT32)
+        self.sizes.fromstring(directory['sizes'])
+        self.sprite_index = directory['spriteIndex']
+
+    def is_modified(self):
+        """
+        Returns True if the WAD file's size or modification time differ from when it was read, or if it no longer
+        exists.
+        """
+
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return True
+
+        return stat.st_size != self.size or stat.st_mtime != self.mtime
+
+    def get_view(self, offset, size):
+        """
+        Returns a read-only view into the mapped WAD file, without copying any data.
+
+        Python 2's mmap objects do not export the new style buffer interface, so buffer objects are used as views.
+        Slicing a view creates a copy, but struct.unpack_from and bytearray accept them directly.
+        """
+
+        return buffer(self.map, offset, size)
+
+    def close(self):
+        """
+        Releases the memory map of this WAD file, if any.
+
+        Any views previously returned by lumps of this WAD raise a ValueError when accessed after closing.
+        """
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def get_lump_at(self, index):
+        """
+        Returns the lump at a lump directory index.
+        """
+
+        lump = self.lumps.get(index)
+        if lump is None:
+            lump = Lump(self.get_name(index), self.sizes[index], self.offsets[index], self)
+            self.lumps[index] = lump
+
+        return lump
+
+    def get_lump(self, lump_name):
+        """
+        Searches this WAD's lump directory for a lump by name.
+
+        @return: the last lump in the directory with the specified name, or None if no lump with that name could be
+        found.
+        """
+
+        index = self.find_lump(lump_name)
+        if index is None:
+            return None
+
+        return self.get_lump_at(index)
+
+    def get_sprite_lumps(self):
+        """
+        Returns a dict of this WAD's sprite lumps, by name.
+        """
+
+        sprites = {}
+        for name, index in self.sprite_index.iteritems():
+            sprites[name] = self.get_lump_at(index)
+
+        return sprites
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+def get_name_key(lump_name):
+    """
+    Returns a lump name as it is stored in a WAD's name buffer, or None if it cannot occur in one.
+    """
+
+    if len(lump_name) == 0 or len(lump_name) > WADReader.NAME_SIZE or '\x00' in lump_name:
+        return None
+
+    return str(lump_name).ljust(WADReader.NAME_SIZE, '\x00')
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a persistent cache of WAD lump directories.
+"""
+
+import marshal
+import os
+import time
+
+from whacked4 import fileutils
+
+
+class WADDirectoryCache(object):
+    """
+    Stores the lump directories and sprite tables of WAD files in a single file, so that they can be loaded in one
+    read instead of being parsed from every WAD file again.
+
+    Entries are keyed by the WAD's path, and are only used if the WAD's size and modification time still match. Only
+    the most recently used entries are kept when saving.
+    """
+
+    # Increment this when the format of stored entries changes.
+    VERSION = 2
+
+    # The maximum number of WAD directories to keep.
+    MAX_ENTRIES = 64
+
+    def __init__(self, path):
+        self.path = path
+
+        # WAD directories, keyed by the normalized WAD path.
+        self.entries = {}
+
+        # True if any entries were added since loading.
+        self.modified = False
+
+    def load(self):
+        """
+        Loads all cached WAD directories. A missing or unreadable cache file results in an empty cache.
+        """
+
+        self.entries = {}
+        self.modified = False
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return
+
+        if isinstance(data, dict) and data.get('version') == self.VERSION:
+            self.entries = data['entries']
+
+    def save(self):
+        """
+        Saves the cached WAD directories, if they were modified.
+        """
+
+        if not self.modified:
+            return
+
+        # Only keep the most recently used entries.
+        keys = sorted(self.entries, key=lambda key: self.entries[key]['used'], reverse=True)
+        for key in keys[self.MAX_ENTRIES:]:
+            del self.entries[key]
+
+        data = {
+            'version': self.VERSION,
+            'entries': self.entries
+        }
+
+        # Write to a temporary file first, so that a partially written cache is never read.
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                marshal.dump(data, f)
+            fileutils.replace_file(temp_path, self.path)
+        except (IOError, OSError):
+            return
+
+        self.modified = False
+
+    def get(self, filename, size, mtime):
+        """
+        Returns a cached WAD directory.
+
+        @return: a directory dict as returned by WADReader.get_directory(), or None if the WAD is not cached or has
+        been modified since it was cached.
+        """
+
+        entry = self.entries.get(get_key(filename))
+        if entry is None or entry['size'] != size or entry['mtime'] != mtime:
+            return None
+
+        # Only the use time changed, which is not worth rewriting the cache file for on its own.
+        entry['used'] = time.time()
+
+        return entry['directory']
+
+    def put(self, filename, size, mtime, directory):
+        """
+        Stores a WAD directory.
+        """
+
+        self.entries[get_key(filename)] = {
+            'size': size,
+            'mtime': mtime,
+            'used': time.time(),
+            'directory': directory
+        }
+        self.modified = True
+
+
+def get_key(filename):
+    """
+    Returns a normalized cache key for a WAD path.
+    """
+
+    return os.path.normcase(os.path.abspath(filename))
@@ -3,7 +3,7 @@
 
 from collections import namedtuple
 
-from whacked4.doom import sound, graphics
+from whacked4.doom import sound, graphics, imagecache, prefetch
 
 
 SpriteEntry = namedtuple('SpriteEntry', ['lump', 'is_mirrored'])
@@ -14,13 +14,27 @@ class WADList(object):
     Maintains a list of WAD files that can be queried for specific lump data.
     """
 
-    def __init__(self):
+    # The default maximum size of decoded sprite images to keep in memory, in bytes.
+    SPRITE_CACHE_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, sprite_cache_size=SPRITE_CACHE_SIZE, sprite_disk_cache=None):
         self.wads = None
 
+        # Maps lump names that have been looked up to the overriding lump from all WADs in this list, or None.
+        self.lump_index = None
+
         self.sprites = None
-        self.sprite_image_cache = None
+
+        # Maps sprite lump names to the overriding sprite lump from all WADs in this list.
+        self.sprite_lumps = None
+
+        self.sprite_image_cache = imagecache.ImageCache(sprite_cache_size)
+        self.sprite_prefetcher = prefetch.SpritePrefetcher(self)
         self.palette = None
 
+        # An optional diskcache.SpriteDiskCache to store decoded sprites in across sessions.
+        self.sprite_disk_cache = sprite_disk_cache
+
         self.sound_cache = None
 
         self.clear()
@@ -28,12 +42,22 @@ class WADList(object):
     def clear(self):
         """
         Empties this WAD list of all data.
+
+        WAD files that were memory mapped are closed, and pending sprite prefetches are cancelled.
         """
 
+        self.sprite_prefetcher.cancel()
+
+        if self.wads is not None:
+            for wad in self.wads:
+                wad.close()
+
         self.wads = []
+        self.lump_index = {}
 
         self.sprites = {}
-        self.sprite_image_cache = {}
+        self.sprite_lumps = {}
+        self.sprite_image_cache.clear()
         self.palette = None
 
         self.sound_cache = {}
@@ -41,26 +65,94 @@ class WADList(object):
     def add_wad(self, wad):
         """
         Adds a new WAD to this list.
+
+        Lumps in the new WAD override lumps with the same name in previously added WADs.
         """
 
         self.wads.append(wad)
+        self.invalidate_lumps([wad])
+
+        if self.sprite_disk_cache is not None:
+            self.sprite_disk_cache.register_wad(wad)
+
+    def set_wads(self, wads):
+        """
+        Replaces the WADs in this list, and updates the sprite lookup table and palette.
+
+        WADs that are kept at the same position keep their cached sprites and sounds. Only cached data of lumps that
+        are now provided by a different WAD is discarded, and only the sprites with such lumps are rebuilt in the
+        sprite lookup table. Looked up lumps are only forgotten if a WAD that was added, removed or moved contains them.
+        WADs that are no longer in the list are closed.
+
+        @param wads: the new list of WADReader objects. WADs from the current list can be reused.
+        """
+
+        self.sprite_prefetcher.cancel()
+
+        old_wads = self.wads
+        old_playpal = self.get_lump('PLAYPAL')
+
+        # WADs that were added, removed or moved can change which WAD provides a lump.
+        changed = []
+        for index, wad in enumerate(old_wads):
+            if index >= len(wads) or wads[index] is not wad:
+                changed.append(wad)
+                if wad not in wads:
+                    wad.close()
+        for index, wad in enumerate(wads):
+            if index >= len(old_wads) or old_wads[index] is not wad:
+                changed.append(wad)
+
+        self.wads = list(wads)
+        if self.sprite_disk_cache is not None:
+            for wad in wads:
+                self.sprite_disk_cache.register_wad(wad)
+        self.invalidate_lumps(changed)
+
+        # Discard cached sounds of lumps that are now provided by a different WAD.
+        for lump_name in self.sound_cache.keys():
+            if find_lump(old_wads, lump_name) is not self.get_lump(lump_name):
+                del self.sound_cache[lump_name]
+
+        sprite_names = set()
+        for wad in changed:
+            sprite_names.update(wad.sprite_index)
+        self.update_sprites(sprite_names)
+
+        # Reload the palette if a different one is used now, invalidating all sprite images.
+        if old_playpal is not self.get_lump('PLAYPAL'):
+            self.sprite_image_cache.clear()
+            self.load_palette()
 
     def get_lump(self, lump_name):
         """
         Returns a lump with the specified name.
 
-        The last WAD is searched first, in reverse order. This way the lumps in the last WAD that was added will
-        override any that were in previously added ones.
+        The lumps in the last WAD that was added override any that were in previously added ones.
 
         @return: a lump object, or None if the lump could not be found.
         """
 
-        for wad in reversed(self.wads):
-            lump = wad.get_lump(lump_name)
-            if lump is not None:
-                return lump
+        if lump_name in self.lump_index:
+            return self.lump_index[lump_name]
 
-        return None
+        lump = find_lump(self.wads, lump_name)
+        self.lump_index[lump_name] = lump
+
+        return lump
+
+    def invalidate_lumps(self, wads):
+        """
+        Forgets the looked up lumps that a number of WADs contain, because a different WAD may provide them now.
+
+        @param wads: the WADs that were added, removed or moved in this list.
+        """
+
+        for lump_name in self.lump_index.keys():
+            for wad in wads:
+                if wad.find_lump(lump_name) is not None:
+                    del self.lump_index[lump_name]
+                    break
 
     def get_sound(self, lump_name):
         """
@@ -108,28 +200,68 @@ class WADList(object):
         """
         Returns an image object from a sprite lump.
 
-        Previously requested sprites are cached so that they will not have to be rendered again. A palette has to be
-        loaded for this function to work.
+        Previously requested sprites are cached so that they will not have to be rendered again. Mirrored sprites are
+        created from the unmirrored sprite image. A palette has to be loaded for this function to work.
         """
 
         if self.palette is None:
             return None
 
+        key = (lump.name, mirror)
+        image = self.sprite_image_cache.get(key)
+        if image is not None:
+            return image
+
         if mirror:
-            lump_name = '{}M'.format(lump.name)
+            image = self.get_sprite_image(lump, False).mirrored()
         else:
-            lump_name = lump.name
-
-        if lump_name in self.sprite_image_cache:
-            return self.sprite_image_cache[lump_name]
-
-        image = graphics.Image(lump.get_data(), self.palette, mirror)
+            image = graphics.Image()
+            image.set_patch(self.get_sprite_patch(lump, self.palette))
 
         # Add the loaded image to the cache.
-        self.sprite_image_cache[lump_name] = image
+        self.sprite_image_cache.put(key, image)
 
         return image
 
+    def get_sprite_patch(self, lump, palette):
+        """
+        Returns decoded patch data for a sprite lump.
+
+        The data is read from the sprite disk cache if possible. Otherwise the lump is decoded and the result is
+        stored in the disk cache. This does not create any bitmaps, so it is safe to call from worker threads.
+
+        @return: a tuple of patch data as returned by graphics.decode_patch(), or None if the patch is invalid.
+        """
+
+        if self.sprite_disk_cache is None:
+            return graphics.decode_patch(lump.get_data(), palette)
+
+        patch = self.sprite_disk_cache.get(lump, palette.hash)
+        if patch is None:
+            patch = graphics.decode_patch(lump.get_data(), palette)
+            if patch is not None:
+                self.sprite_disk_cache.put(lump, palette.hash, patch)
+
+        return patch
+
+    def prefetch_sprites(self, sprite_frames):
+        """
+        Decodes all rotations of a number of sprite frames in the background, replacing any previous prefetch.
+
+        @param sprite_frames: an iterable of (sprite name, frame index) tuples.
+        """
+
+        lumps = []
+        found = set()
+        for sprite_name, frame_index in sprite_frames:
+            for rotation in range(0, 9):
+                sprite_entry = self.get_sprite_entry(sprite_name, frame_index, rotation)
+                if sprite_entry is not None and sprite_entry.lump not in found:
+                    lumps.append(sprite_entry.lump)
+                    found.add(sprite_entry.lump)
+
+        self.sprite_prefetcher.prefetch(lumps)
+
     def build_sprite_list(self):
         """
         Builds a lookup table of sprite lumps, and loads a PLAYPAL palette from the current WAD list.
@@ -139,34 +271,104 @@ class WADList(object):
         with lump data for subsprite A1 and E1, both pointing to the same lump.
         """
 
-        sprites = {}
+        self.sprites = {}
+        self.sprite_lumps = {}
         for wad in self.wads:
-            sprites.update(wad.get_sprite_lumps())
+            self.sprite_lumps.update(wad.get_sprite_lumps())
 
         # Build the lookup table by splitting sprite lump names into relevant parts.
-        for name, lump in sprites.iteritems():
-            sprite_name = name[:4]
+        for name, lump in self.sprite_lumps.iteritems():
+            self.add_sprite_lump(name, lump)
 
-            # Use current or create a new sprite dict.
-            if sprite_name in self.sprites:
-                sprite = self.sprites[sprite_name]
+        self.load_palette()
+
+    def update_sprites(self, lump_names):
+        """
+        Updates the sprite lookup table for a number of sprite lump names whose overriding lump may have changed.
+
+        Only the sprites that have a changed lump are rebuilt, and their cached images are discarded.
+        """
+
+        rebuild = set()
+        for name in lump_names:
+
+            # Find the last WAD that provides this sprite lump.
+            lump = None
+            for wad in reversed(self.wads):
+                index = wad.sprite_index.get(name)
+                if index is not None:
+                    lump = wad.get_lump_at(index)
+                    break
+
+            if lump is self.sprite_lumps.get(name):
+                continue
+
+            if lump is None:
+                del self.sprite_lumps[name]
             else:
-                sprite = {}
-                self.sprites[sprite_name] = sprite
+                self.sprite_lumps[name] = lump
+
+            self.sprite_image_cache.remove((name, False))
+            self.sprite_image_cache.remove((name, True))
+            rebuild.add(name[:4])
+
+        if len(rebuild) == 0:
+            return
+
+        for sprite_name in rebuild:
+            self.sprites.pop(sprite_name, None)
 
-            # Add subsprite.
-            subsprite = name[4:6]
-            sprite[subsprite] = SpriteEntry(lump, False)
+        for name, lump in self.sprite_lumps.iteritems():
+            if name[:4] in rebuild:
+                self.add_sprite_lump(name, lump)
 
-            # Add mirrored sprite as well.
-            if len(lump.name) == 8:
-                subsprite = name[6:8]
-                sprite[subsprite] = SpriteEntry(lump, True)
+    def add_sprite_lump(self, name, lump):
+        """
+        Adds a sprite lump to the sprite lookup table.
+        """
+
+        sprite_name = name[:4]
+
+        # Use current or create a new sprite dict.
+        if sprite_name in self.sprites:
+            sprite = self.sprites[sprite_name]
+        else:
+            sprite = {}
+            self.sprites[sprite_name] = sprite
+
+        # Add subsprite.
+        subsprite = name[4:6]
+        sprite[subsprite] = SpriteEntry(lump, False)
+
+        # Add mirrored sprite as well.
+        if len(lump.name) == 8:
+            subsprite = name[6:8]
+            sprite[subsprite] = SpriteEntry(lump, True)
+
+    def load_palette(self):
+        """
+        Loads the palette from the overriding PLAYPAL lump, if any.
+        """
 
         # Find a PLAYPAL lump to use as palette.
         playpal = self.get_lump('PLAYPAL')
         if playpal is not None:
             self.palette = graphics.Palette(playpal.get_data())
+        else:
+            self.palette = None
 
     def __len__(self):
         return len(self.wads)
+
+
+def find_lump(wads, lump_name):
+    """
+    Returns the overriding lump with a name from a list of WADs, or None if none of them contain it.
+    """
+
+    for wad in reversed(wads):
+        lump = wad.get_lump(lump_name)
+        if lump is not None:
+            return lump
+
+    return None
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a generic enumeration object. It is kept apart from the utility functions so that it can be used without
+wxPython.
+"""
+
+
+class Enum(object):
+    """
+    Generic enumeration object.
+    """
+
+    def __init__(self):
+        pass
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+File utility functions that do not depend on the user interface.
+"""
+
+import os
+
+
+def replace_file(source, target):
+    """
+    Renames a file, replacing the target file if it exists.
+
+    On Windows os.rename() fails if the target exists, so the target is removed first. Another process may remove it at
+    the same time, which is ignored. Elsewhere the target is replaced atomically.
+
+    @param source: the filename of the file to rename.
+    @param target: the new filename of the file.
+
+    @raise OSError: if the file could not be renamed.
+    """
+
+    if os.name == 'nt':
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+
+    os.rename(source, target)
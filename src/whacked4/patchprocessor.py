@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+A command line tool that validates Dehacked patches and writes them again, without a user interface.
+
+Engines are loaded once, and patches are processed in parallel worker processes. Every patch is analyzed, then read
+with and written for each engine that it is compatible with. The result of every patch is written to a JSON lines
+report, and a summary of the throughput is printed when all patches are done.
+"""
+
+from collections import OrderedDict
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+
+from whacked4 import config
+from whacked4.dehacked import engine
+from whacked4.dehacked import enginecache
+from whacked4.dehacked import patch
+
+
+# The extensions of patch files to process in directories.
+PATCH_EXTENSIONS = frozenset(['.deh', '.bex'])
+
+# Loaded engines by name. Set in the main process before the worker processes are started, so that workers that are
+# forked from it do not load them again.
+worker_engines = None
+
+
+def load_engines(table_filenames, cache_path):
+    """
+    Loads engines from table files, through an engine cache.
+
+    @param table_filenames: a list of (name, filename) tuples of the engine table files to load.
+    @param cache_path: the path of the engine cache directory.
+
+    @return: an OrderedDict of engines by name, and a list of (filename, error message) tuples of the table files that
+    could not be loaded.
+    """
+
+    cache = enginecache.EngineCache(cache_path)
+
+    engines = OrderedDict()
+    errors = []
+    for name, filename in table_filenames:
+        try:
+            engines[name] = cache.read_table(filename)
+        except (engine.DehackedEngineError, EnvironmentError, ValueError) as e:
+            errors.append((filename, str(e)))
+
+    return engines, errors
+
+
+def init_worker(table_filenames, cache_path):
+    """
+    Initializes a worker process, loading the engines if they were not inherited from the main process.
+    """
+
+    global worker_engines
+
+    if worker_engines is None:
+        worker_engines = load_engines(table_filenames, cache_path)[0]
+
+
+def find_patches(paths):
+    """
+    Returns a list of (filename, relative filename) tuples of the patch files to process.
+
+    Directories are searched recursively for files with a patch extension, other paths are used as they are.
+    Relative filenames are relative to the directory that was passed.
+    """
+
+    patches = []
+    for path in paths:
+        if not os.path.isdir(path):
+            patches.append((path, os.path.basename(path)))
+            continue
+
+        for dir_path, dir_names, filenames in os.walk(path):
+            dir_names.sort()
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in PATCH_EXTENSIONS:
+                    full_filename = os.path.join(dir_path, filename)
+                    patches.append((full_filename, os.path.relpath(full_filename, path)))
+
+    return patches
+
+
+def process_patch(job):
+    """
+    Analyzes a patch, and reads and writes it with every selected engine that is compatible with it.
+
+    Runs in a worker process, so all errors are returned as part of the result.
+
+    @param job: a tuple of the patch filename, the filename relative to the output directory, the output directory or
+    None to not keep written patches, a list of the names of the engines to use or None to use all engines, and
+    whether to verify written patches.
+
+    @return: a dict with the patch filename, its size, version, whether it is extended, the names of compatible
+    engines, the time taken to analyze it in seconds, an error message, which is None if the patch could be analyzed,
+    and a dict of results by engine name.
+    """
+
+    filename, relative_filename, output_dir, engine_names, verify = job
+    result = OrderedDict([
+        ('patch', filename),
+        ('size', 0),
+        ('version', 0),
+        ('extended', False),
+        ('engines', []),
+        ('analyze_time', 0.0),
+        ('error', None),
+        ('results', OrderedDict())
+    ])
+
+    try:
+        result['size'] = os.path.getsize(filename)
+
+        start = time.time()
+        analyzed_patch = patch.Patch()
+        analyzed_patch.analyze_patch(filename, worker_engines)
+        result['analyze_time'] = time.time() - start
+
+    except (patch.DehackedPatchError, EnvironmentError, ValueError) as e:
+        result['error'] = str(e)
+        return result
+
+    result['version'] = analyzed_patch.version
+    result['extended'] = analyzed_patch.extended
+
+    for name, patch_engine in worker_engines.iteritems():
+        if not patch_engine.is_compatible(analyzed_patch):
+            continue
+        result['engines'].append(name)
+
+        if engine_names is None or name in engine_names:
+            output_filename = None
+            if output_dir is not None:
+                output_filename = os.path.join(output_dir, name, relative_filename)
+            result['results'][name] = process_engine_patch(analyzed_patch, patch_engine, output_filename, verify)
+
+    return result
+
+
+def process_engine_patch(analyzed_patch, patch_engine, output_filename, verify):
+    """
+    Reads an analyzed patch with an engine, and writes it.
+
+    @param analyzed_patch: the analyzed patch. It is not modified, so that it can be read with other engines.
+    @param patch_engine: the engine to read the patch with.
+    @param output_filename: the filename to write the patch to, or None to discard the written patch.
+    @param verify: if True, the written patch is verified by comparing all of its data to the engine's.
+
+    @return: a dict with the messages returned by reading the patch, the time taken to read and to write in seconds,
+    the output filename and an error message, which is None if the patch was read and written.
+    """
+
+    result = OrderedDict([
+        ('messages', {}),
+        ('read_time', 0.0),
+        ('write_time', 0.0),
+        ('output', output_filename),
+        ('error', None)
+    ])
+
+    # Reuse the analyzed patch's tokens, the analyzed patch keeps them for reading with other engines.
+    engine_patch = patch.Patch()
+    engine_patch.filename = analyzed_patch.filename
+    engine_patch.version = analyzed_patch.version
+    engine_patch.token_cache = analyzed_patch.token_cache
+    engine_patch.initialize_from_engine(patch_engine)
+
+    try:
+        start = time.time()
+        result['messages'] = engine_patch.read_dehacked(analyzed_patch.filename)
+        result['read_time'] = time.time() - start
+
+        if output_filename is not None:
+            output_path = os.path.dirname(output_filename)
+
+            # Another worker may create the output directory at the same time.
+            if not os.path.exists(output_path):
+                try:
+                    os.makedirs(output_path)
+                except OSError:
+                    pass
+        else:
+            output_filename = os.devnull
+
+        start = time.time()
+        result['error'] = engine_patch.write_dehacked(output_filename, verify=verify)
+        result['write_time'] = time.time() - start
+
+    except (patch.DehackedPatchError, EnvironmentError, ValueError, LookupError) as e:
+        result['error'] = str(e)
+
+    return result
+
+
+def print_result(result):
+    """
+    Prints a line describing the result of a process_patch() call.
+    """
+
+    if result['error'] is not None:
+        print '{}: FAILED: {}'.format(result['patch'], result['error'])
+        return
+
+    if len(result['engines']) == 0:
+        print '{}: no compatible engines'.format(result['patch'])
+        return
+
+    engine_texts = []
+    for name, engine_result in result['results'].iteritems():
+        if engine_result['error'] is not None:
+            engine_texts.append('{} FAILED: {}'.format(name, engine_result['error']))
+        else:
+            engine_texts.append('{} {} message(s) in {:.1f} ms'.format(
+                name, len(engine_result['messages']), (engine_result['read_time'] + engine_result['write_time']) * 1000
+            ))
+
+    print '{}: version {}{}, analyzed in {:.1f} ms; {}'.format(
+        result['patch'], result['version'], ' extended' if result['extended'] else '', result['analyze_time'] * 1000,
+        '; '.join(engine_texts) if len(engine_texts) > 0 else 'no selected engines'
+    )
+
+
+def is_failed(result):
+    """
+    Returns True if a process_patch() result contains an error.
+    """
+
+    if result['error'] is not None:
+        return True
+
+    for engine_result in result['results'].itervalues():
+        if engine_result['error'] is not None:
+            return True
+
+    return False
+
+
+def main(argv=None):
+    """
+    Runs the patch processor with command line arguments.
+
+    @return: the process exit code. 1 if any patch could not be processed.
+    """
+
+    global worker_engines
+
+    parser = argparse.ArgumentParser(description='Validates Dehacked patches and writes them again with WhackEd4.')
+    parser.add_argument('patches', nargs='+', metavar='PATCH',
+                        help='A patch file, or a directory to search for .deh and .bex files.')
+    parser.add_argument('-tables', action='store', default='cfg/tables_*.json',
+                        help='A glob pattern of the engine table files to load.')
+    parser.add_argument('-engine', action='append', metavar='NAME',
+                        help='Only read patches with this engine, if it is compatible. Can be repeated.')
+    parser.add_argument('-output', action='store',
+                        help='The directory to write patches to, in a subdirectory for every engine.')
+    parser.add_argument('-report', action='store', help='The file to write a JSON lines report to.')
+    parser.add_argument('-verify', action='store_true',
+                        help='Verify written patches by comparing all of their data to the engine\'s.')
+    parser.add_argument('-cache', action='store', default=config.ENGINE_CACHE_PATH,
+                        help='The engine cache directory.')
+    parser.add_argument('-workers', action='store', type=int, default=multiprocessing.cpu_count(),
+                        help='The number of worker processes to use.')
+    args = parser.parse_args(argv)
+
+    table_filenames = []
+    for filename in sorted(glob.glob(args.tables)):
+        table_filenames.append((os.path.splitext(os.path.basename(filename))[0], filename))
+
+    start = time.time()
+    worker_engines, errors = load_engines(table_filenames, args.cache)
+    for filename, error in errors:
+        print '{}: FAILED to load engine: {}'.format(filename, error)
+    if len(worker_engines) == 0:
+        parser.error('No engines could be loaded from {}.'.format(args.tables))
+    print '{} engine(s) loaded in {:.1f} ms.'.format(len(worker_engines), (time.time() - start) * 1000)
+
+    if args.engine is not None:
+        for name in args.engine:
+            if name not in worker_engines:
+                parser.error('Unknown engine {}.'.format(name))
+
+    jobs = []
+    for filename, relative_filename in find_patches(args.patches):
+        jobs.append((filename, relative_filename, args.output, args.engine, args.verify))
+
+    report = None
+    if args.report is not None:
+        report = open(args.report, 'w')
+
+    start = time.time()
+    worker_count = max(1, min(args.workers, len(jobs)))
+
+    # Print results as they come in, in the order that the patches were found.
+    results = []
+    try:
+        if worker_count == 1:
+            result_iterator = (process_patch(job) for job in jobs)
+            pool = None
+        else:
+            loaded_table_filenames = [item for item in table_filenames if item[0] in worker_engines]
+            pool = multiprocessing.Pool(worker_count, init_worker, (loaded_table_filenames, args.cache))
+            chunk_size = max(1, len(jobs) / (worker_count * 8))
+            result_iterator = pool.imap(process_patch, jobs, chunk_size)
+
+        try:
+            for result in result_iterator:
+                results.append(result)
+                print_result(result)
+                if report is not None:
+                    # Patch texts in messages use DOS code pages, not UTF-8.
+                    report.write(json.dumps(result, encoding='latin-1') + '\n')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    finally:
+        if report is not None:
+            report.close()
+
+    duration = time.time() - start
+    failed = len([result for result in results if is_failed(result)])
+    total_size = sum(result['size'] for result in results)
+    read_count = sum(len(result['results']) for result in results)
+    print '{} of {} patches processed without errors in {:.1f} ms with {} worker(s), {} patch reads.'.format(
+        len(results) - failed, len(results), duration * 1000, worker_count, read_count
+    )
+    if duration > 0:
+        print '{:.1f} patches/s, {:.1f} KB/s.'.format(len(results) / duration, total_size / 1024.0 / duration)
+
+    if failed > 0:
+        return 1
+    return 0
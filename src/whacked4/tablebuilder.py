@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+A command line tool that builds engine table files from game executables.
+
+Every executable is read using an executable data file (executable_*.json in the cfg directory) that describes where
+its tables are. Executables are extracted in parallel worker processes, and a report with the time taken by each one
+is printed when they are done.
+"""
+
+import argparse
+import multiprocessing
+import os.path
+import time
+
+from whacked4.dehacked import engine
+
+
+def get_table_filename(exe_config_filename, exe_filename, output_dir, unique):
+    """
+    Returns the name of the engine table file to write for an executable.
+
+    executable_doom19.json becomes tables_doom19.json, other names only get a tables_ prefix. If the executable data
+    file is used for more than one executable, the executable's name is appended, as in tables_doom19_doom2.json.
+    """
+
+    name = os.path.splitext(os.path.basename(exe_config_filename))[0]
+    if name.startswith('executable_'):
+        name = name[len('executable_'):]
+
+    if not unique:
+        name += '_' + os.path.splitext(os.path.basename(exe_filename))[0].lower()
+
+    return os.path.join(output_dir, 'tables_{}.json'.format(name))
+
+
+def build_table(job):
+    """
+    Extracts an engine from a game executable, and writes its table file.
+
+    Runs in a worker process, so all errors are returned as part of the result.
+
+    @param job: a tuple of the executable data filename, the executable filename and the table filename to write.
+
+    @return: a dict with the filenames, the time taken to extract and to write in seconds, the size of the table file
+    and an error message, which is None if the table was written.
+    """
+
+    exe_config_filename, exe_filename, table_filename = job
+    result = {
+        'config': exe_config_filename,
+        'executable': exe_filename,
+        'table': table_filename,
+        'extract_time': 0.0,
+        'write_time': 0.0,
+        'size': 0,
+        'error': None
+    }
+
+    try:
+        start = time.time()
+        new_engine = engine.Engine()
+        new_engine.read_executable(exe_config_filename, exe_filename)
+        result['extract_time'] = time.time() - start
+
+        start = time.time()
+        new_engine.write_table(table_filename)
+        result['write_time'] = time.time() - start
+
+        result['size'] = os.path.getsize(table_filename)
+
+    except (engine.DehackedEngineError, EnvironmentError, ValueError) as e:
+        result['error'] = str(e)
+
+    return result
+
+
+def print_result(result):
+    """
+    Prints a line describing the result of a build_table() call.
+    """
+
+    if result['error'] is not None:
+        print '{}: FAILED: {}'.format(result['executable'], result['error'])
+        return
+
+    print '{}: extracted in {:.1f} ms, written in {:.1f} ms, {} KB to {}'.format(
+        result['executable'], result['extract_time'] * 1000, result['write_time'] * 1000, result['size'] / 1024,
+        result['table']
+    )
+
+
+def main(argv=None):
+    """
+    Runs the table builder with command line arguments.
+
+    @return: the process exit code. 1 if any executable could not be extracted.
+    """
+
+    parser = argparse.ArgumentParser(description='Builds WhackEd4 engine table files from game executables.')
+    parser.add_argument('-exe', action='append', nargs=2, metavar=('CONFIG', 'EXECUTABLE'), required=True,
+                        help='An executable data file and the executable to extract with it. Can be repeated.')
+    parser.add_argument('-output', action='store', default='.', help='The directory to write table files to.')
+    parser.add_argument('-workers', action='store', type=int, default=multiprocessing.cpu_count(),
+                        help='The number of worker processes to use.')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    config_counts = {}
+    for exe_config_filename, _ in args.exe:
+        config_counts[exe_config_filename] = config_counts.get(exe_config_filename, 0) + 1
+
+    jobs = []
+    for exe_config_filename, exe_filename in args.exe:
+        unique = config_counts[exe_config_filename] == 1
+        table_filename = get_table_filename(exe_config_filename, exe_filename, args.output, unique)
+        jobs.append((exe_config_filename, exe_filename, table_filename))
+
+    table_filenames = [job[2] for job in jobs]
+    if len(set(table_filenames)) != len(table_filenames):
+        parser.error('More than one executable would be written to the same table file.')
+
+    start = time.time()
+    worker_count = max(1, min(args.workers, len(jobs)))
+
+    # Print results as they come in, in the order that the executables were passed.
+    if worker_count == 1:
+        results = []
+        for job in jobs:
+            results.append(build_table(job))
+            print_result(results[-1])
+    else:
+        pool = multiprocessing.Pool(worker_count)
+        try:
+            results = []
+            for result in pool.imap(build_table, jobs):
+                results.append(result)
+                print_result(result)
+        finally:
+            pool.close()
+            pool.join()
+
+    failed = len([result for result in results if result['error'] is not None])
+    total_size = sum(result['size'] for result in results)
+    print '{} of {} tables built in {:.1f} ms with {} worker(s), {} KB written.'.format(
+        len(results) - failed, len(results), (time.time() - start) * 1000, worker_count, total_size / 1024
+    )
+
+    if failed > 0:
+        return 1
+    return 0
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Contains a lightweight API to time the phases of an operation, such as opening or saving a patch.
+
+An operation is started with begin() and finished with end(). Phases are timed with spans, which can be nested:
+
+    timing.begin('open')
+    with timing.span('read_dehacked'):
+        ...
+    timing.end()
+
+Statistics, such as the usage of a cache, can be added to an operation with add_stats(), and are included in its
+summary.
+
+Timing is only done if it is enabled. Otherwise spans do nothing, so that they can be left in place. Spans outside of
+an operation do nothing either. Operations and spans are meant to be used from the user interface thread only.
+"""
+
+import json
+import time
+
+
+# Set to True to time operations.
+enabled = False
+
+# If set, the summary of every finished operation is printed.
+log = False
+
+# If set, the summaries of the last finished operation of every name are written to this file, as JSON.
+summary_path = None
+
+# The summary of the last finished operation of every name, by operation name.
+summaries = {}
+
+# The operation that is currently being timed, or None.
+current_operation = None
+
+
+class NullSpan(object):
+    """
+    A span that does nothing, used when there is no operation to time.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, value, trace_back):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    """
+    Times a single phase of an operation.
+    """
+
+    def __init__(self, operation, name):
+        self.operation = operation
+        self.name = name
+        self.depth = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.depth = len(self.operation.stack)
+        self.operation.stack.append(self)
+        self.start = time.time()
+
+        return self
+
+    def __exit__(self, exception_type, value, trace_back):
+        duration = time.time() - self.start
+
+        self.operation.stack.pop()
+        self.operation.spans.append({
+            'name': self.name,
+            'depth': self.depth,
+            'start': self.start - self.operation.start,
+            'duration': duration
+        })
+
+        return False
+
+
+class Operation(object):
+    """
+    Collects the spans of a single operation.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+
+        # Finished spans, in the order that they finished.
+        self.spans = []
+
+        # Spans that are being timed, from the outermost one.
+        self.stack = []
+
+        # Dicts of statistics, by name.
+        self.stats = {}
+
+    def get_summary(self):
+        """
+        Returns a summary of this operation, with its spans sorted by when they started.
+        """
+
+        return {
+            'operation': self.name,
+            'time': self.start,
+            'duration': time.time() - self.start,
+            'spans': sorted(self.spans, key=lambda span: (span['start'], span['depth'])),
+            'stats': self.stats
+        }
+
+
+def begin(name):
+    """
+    Starts timing an operation, replacing any operation that was not finished. Does nothing if timing is disabled.
+
+    @param name: the name of the operation, for example open or save.
+    """
+
+    global current_operation
+
+    if enabled:
+        current_operation = Operation(name)
+
+
+def span(name):
+    """
+    Returns a context manager that times a phase of the current operation.
+
+    @param name: the name of the phase.
+    """
+
+    if current_operation is None:
+        return NULL_SPAN
+
+    return Span(current_operation, name)
+
+
+def add_stats(name, stats):
+    """
+    Adds statistics to the current operation. Does nothing if no operation is being timed.
+
+    @param name: the name of the statistics, for example the name of a cache.
+    @param stats: a dict of statistic values by name.
+    """
+
+    if current_operation is not None:
+        current_operation.stats[name] = dict(stats)
+
+
+def end():
+    """
+    Finishes the current operation, and keeps its summary. Does nothing if no operation is being timed.
+
+    @return: the summary of the operation, or None.
+    """
+
+    global current_operation
+
+    operation = current_operation
+    if operation is None:
+        return None
+    current_operation = None
+
+    summary = operation.get_summary()
+    summaries[operation.name] = summary
+
+    if log:
+        print_summary(summary)
+
+    if summary_path is not None:
+        try:
+            with open(summary_path, 'w') as f:
+                json.dump(summaries, f, indent=4, sort_keys=True)
+        except IOError:
+            pass
+
+    return summary
+
+
+def print_summary(summary):
+    """
+    Prints the summary of an operation, with a line for every span that is indented by its depth, followed by a line
+    for every set of statistics.
+    """
+
+    print '{} took {:.1f} ms:'.format(summary['operation'], summary['duration'] * 1000)
+    for span_summary in summary['spans']:
+        print '{}{}: {:.1f} ms'.format('    ' * (span_summary['depth'] + 1), span_summary['name'],
+                                       span_summary['duration'] * 1000)
+    for name, stats in sorted(summary['stats'].iteritems()):
+        values = ['{} {}'.format(key, value) for key, value in sorted(stats.iteritems())]
+        print '    {}: {}'.format(name, ', '.join(values))
@@ -146,7 +146,7 @@ class PatchInfoDialog(windows.PatchInfoDialogBase):
         if filename is not None:
             # Validate the WAD file.
             try:
-                iwad = wad.WADReader(filename)
+                iwad = wad.WADReader(filename, mapped=False)
             except wad.WADTypeError:
                 wx.MessageBox(message='The selected WAD is not a valid WAD file.', caption='Invalid WAD file',
                               style=wx.OK | wx.ICON_EXCLAMATION, parent=self)
@@ -168,7 +168,7 @@ class PatchInfoDialog(windows.PatchInfoDialogBase):
         if filename is not None:
             # Validate the WAD file.
             try:
-                pwad = wad.WADReader(filename)
+                pwad = wad.WADReader(filename, mapped=False)
             except wad.WADTypeError:
                 wx.MessageBox(message='The selected WAD is not a valid WAD file.', caption='Invalid WAD file',
                               style=wx.OK | wx.ICON_EXCLAMATION, parent=self)
@@ -147,7 +147,7 @@ class StatesFrame(editormixin.EditorMixin, windows.StatesFrameBase):
             # Restore all state indices in the undo item.
             if state_index in self.filter.state_indices:
                 list_index = self.filter.state_indices.index(state_index)
-                self.filter.states[list_index] = state
+                self.filter.states[list_index] = self.patch.states[state_index]
                 self.statelist_update_row(list_index)
 
         self.update_properties()
@@ -203,10 +203,9 @@ class StatesFrame(editormixin.EditorMixin, windows.StatesFrameBase):
         for state in self.clipboard:
             # Ignore states that are not currently visible because of filters.
             if list_index in self.selected:
-                dup = copy.deepcopy(state)
                 state_index = self.filter.state_indices[list_index]
-                self.patch.states[state_index] = dup
-                self.filter.states[list_index] = dup
+                self.patch.states[state_index] = state
+                self.filter.states[list_index] = self.patch.states[state_index]
                 self.statelist_update_row(list_index)
 
             list_index += 1
@@ -355,6 +354,27 @@ class StatesFrame(editormixin.EditorMixin, windows.StatesFrameBase):
         self.filter.update(index)
         self.statelist_build()
         self.update_properties()
+        self.prefetch_sprites(index)
+
+    def prefetch_sprites(self, filter_index):
+        """
+        Starts decoding the sprites of all currently filtered states in the background.
+
+        The unfiltered list is skipped, since it references nearly every sprite in the loaded WADs.
+        """
+
+        if self.filter.filters[filter_index]['type'] == statefilter.FILTER_TYPE_NONE:
+            self.pwads.sprite_prefetcher.cancel()
+            return
+
+        sprite_frames = set()
+        for state in self.filter.states:
+            sprite_index = state['sprite']
+            if sprite_index < len(self.patch.sprite_names):
+                sprite_frame = state['spriteFrame'] & ~self.FRAMEFLAG_LIT
+                sprite_frames.add((self.patch.sprite_names[sprite_index], sprite_frame))
+
+        self.pwads.prefetch_sprites(sprite_frames)
 
     def set_selected_property(self, key, value):
         """
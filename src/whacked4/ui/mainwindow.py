@@ -1,10 +1,9 @@
 #!/usr/bin/env python
 #coding=utf8
 
-from collections import OrderedDict
-from whacked4 import config, utils
-from whacked4.dehacked import engine, patch
-from whacked4.doom import wadlist, wad
+from whacked4 import config, timing, utils
+from whacked4.dehacked import engine, enginecache, engineregistry, patch
+from whacked4.doom import wadlist, wad, wadcache, diskcache, sound
 from whacked4.ui import windows, workspace
 from whacked4.ui.dialogs import startdialog, aboutdialog, patchinfodialog
 from whacked4.ui.editors import thingsframe, statesframe, soundsframe, stringsframe, weaponsframe, ammoframe, \
@@ -39,10 +38,16 @@ class MainWindow(windows.MainFrameBase):
 
         # WAD\lump management.
         self.iwad = None
-        self.pwads = wadlist.WADList()
+        sprite_disk_cache = diskcache.SpriteDiskCache(config.SPRITE_CACHE_PATH,
+                                                      config.settings['sprite_disk_cache_size'])
+        self.pwads = wadlist.WADList(config.settings['sprite_cache_size'], sprite_disk_cache)
+
+        # Lump directories of previously loaded WADs.
+        self.wad_cache = wadcache.WADDirectoryCache(config.WAD_CACHE_PATH)
+        self.wad_cache.load()
 
         # Engine configuration related data.
-        self.engines = OrderedDict()
+        self.engines = engineregistry.EngineRegistry(enginecache.EngineCache(config.ENGINE_CACHE_PATH))
         self.load_engines()
 
         # Window\ID relationships.
@@ -111,20 +116,50 @@ class MainWindow(windows.MainFrameBase):
 
     def load_engines(self):
         """
-        Loads all engine configuration files. These are kept in memory for patch compatibility auto-detection.
+        Registers all engine configuration files. Only their headers are kept in memory for patch compatibility
+        auto-detection, engine tables are loaded when a patch needs them.
+
+        Engines are loaded from the engine cache if their configuration file has not changed since it was cached.
         """
 
+        filenames = []
         for file_name in glob.glob('cfg/tables_*.json'):
-            new_engine = engine.Engine()
-            try:
-                new_engine.read_table(file_name)
-            except engine.DehackedEngineError as e:
-                wx.MessageBox(message='Invalid engine configuration file "{}". Exception: {}'.format(file_name, e),
-                              caption='Engine configuration error', style=wx.OK | wx.ICON_EXCLAMATION, parent=self)
-            else:
-                name = os.path.basename(file_name)
-                name = os.path.splitext(name)[0]
-                self.engines[name] = new_engine
+            name = os.path.basename(file_name)
+            name = os.path.splitext(name)[0]
+            filenames.append((name, file_name))
+
+        # Engines are read in the background. Anything that needs them waits until they are ready.
+        self.engines.add_all(filenames, lambda file_name, e: wx.CallAfter(self.show_engine_error, file_name, e))
+
+    def wait_for_engines(self):
+        """
+        Blocks until all engine configuration files have been registered.
+        """
+
+        wx.BeginBusyCursor()
+        self.engines.wait()
+        wx.EndBusyCursor()
+
+    def show_engine_error(self, file_name, e):
+        """
+        Displays an engine configuration file error.
+        """
+
+        wx.MessageBox(message='Invalid engine configuration file "{}". Exception: {}'.format(file_name, e),
+                      caption='Engine configuration error', style=wx.OK | wx.ICON_EXCLAMATION, parent=self)
+
+    def get_engine(self, name):
+        """
+        Returns a fully loaded engine.
+
+        @return: the engine, or None if its configuration file could not be loaded.
+        """
+
+        try:
+            return self.engines.get_engine(name)
+        except engine.DehackedEngineError as e:
+            self.show_engine_error(self.engines.filenames[name], e)
+            return None
 
     def view_patch_settings(self, event):
         """
@@ -162,6 +197,21 @@ class MainWindow(windows.MainFrameBase):
             self.open_file(filename, force_show_settings)
 
     def open_file(self, filename, force_show_settings=False):
+        """
+        Opens and reads a new Dehacked patch, timing the phases of opening it.
+
+        @param filename: the filename of the file to open.
+        @param force_show_settings: if True, will always display the patch settings dialog.
+        """
+
+        timing.begin('open')
+        try:
+            self.load_file(filename, force_show_settings)
+        finally:
+            timing.add_stats('sprite image cache', self.pwads.sprite_image_cache.get_stats())
+            timing.end()
+
+    def load_file(self, filename, force_show_settings=False):
         """
         Opens and reads a new Dehacked patch.
 
@@ -173,12 +223,17 @@ class MainWindow(windows.MainFrameBase):
         new_workspace = workspace.Workspace()
         workspace_file = workspace.get_filename(filename)
         if os.path.exists(workspace_file):
-            new_workspace.load(filename)
+            with timing.span('load workspace'):
+                new_workspace.load(filename)
+
+        with timing.span('wait for engines'):
+            self.wait_for_engines()
 
         # Analyze the patch file to determine what engines support it.
         new_patch = patch.Patch()
         try:
-            new_patch.analyze_patch(filename, self.engines)
+            with timing.span('analyze_patch'):
+                new_patch.analyze_patch(filename, self.engines)
         except patch.DehackedPatchError as e:
             wx.MessageBox(message=e.__str__(), caption='Patch error', style=wx.OK | wx.ICON_ERROR, parent=self)
             return
@@ -188,7 +243,8 @@ class MainWindow(windows.MainFrameBase):
         patch_info = patchinfodialog.PatchInfoDialog(self)
         patch_info.set_state(new_patch, self.engines, new_workspace)
         if new_workspace.engine is None or force_show_settings:
-            patch_info.ShowModal()
+            with timing.span('patch info dialog'):
+                patch_info.ShowModal()
 
             # User cancelled out of the patch info dialog.
             if patch_info.selected_engine is None:
@@ -201,12 +257,17 @@ class MainWindow(windows.MainFrameBase):
             new_workspace.save(workspace_file)
 
         # Initialize the patch with tables from the selected engine.
-        selected_engine = self.engines[new_workspace.engine]
-        new_patch.initialize_from_engine(selected_engine)
+        with timing.span('get_engine'):
+            selected_engine = self.get_engine(new_workspace.engine)
+        if selected_engine is None:
+            return
+        with timing.span('initialize_from_engine'):
+            new_patch.initialize_from_engine(selected_engine)
 
         # Attempt to parse the patch file.
         try:
-            messages = new_patch.read_dehacked(filename)
+            with timing.span('read_dehacked'):
+                messages = new_patch.read_dehacked(filename)
         except patch.DehackedVersionError as e:
             wx.MessageBox(message=e.__str__(), caption='Patch version error', style=wx.OK | wx.ICON_ERROR, parent=self)
             return
@@ -232,12 +293,15 @@ class MainWindow(windows.MainFrameBase):
         self.workspace = new_workspace
 
         # Refresh user interface contents.
-        self.load_wads()
-        self.update_ui()
+        with timing.span('load_wads'):
+            self.load_wads()
+        with timing.span('update_ui'):
+            self.update_ui()
         self.file_set_state()
 
         # Store potentially updated workspace.
-        self.workspace_save()
+        with timing.span('save workspace'):
+            self.workspace_save()
 
         # Add item to recent files.
         config.settings.recent_files_add(filename)
@@ -246,12 +310,15 @@ class MainWindow(windows.MainFrameBase):
     def load_wads(self):
         """
         Loads the WAD files that are selected in the current workspace.
+
+        WADs that are already loaded and have not been modified since are reused, so that their cached sprites and
+        sounds are kept.
         """
 
         self.iwad = None
-        self.pwads.clear()
 
         if self.workspace.iwad is None:
+            self.pwads.clear()
             return
 
         # Verify if the IWAD file exists at all.
@@ -261,13 +328,15 @@ class MainWindow(windows.MainFrameBase):
                           caption='Missing IWAD', style=wx.OK | wx.ICON_INFORMATION, parent=self)
             self.workspace.iwad = None
             self.patch_modified = True
+            self.pwads.clear()
             return
 
         wx.BeginBusyCursor()
 
-        # Load and add the IWAD to the WAD list.
-        self.iwad = wad.WADReader(self.workspace.iwad)
-        self.pwads.add_wad(self.iwad)
+        # Load the IWAD.
+        with timing.span('load_wad ' + os.path.basename(self.workspace.iwad)):
+            self.iwad = self.load_wad(self.workspace.iwad)
+        wads = [self.iwad]
 
         # Load PWADs.
         for pwad_file in self.workspace.pwads:
@@ -278,11 +347,14 @@ class MainWindow(windows.MainFrameBase):
                 self.patch_modified = True
 
             else:
-                pwad = wad.WADReader(pwad_file)
-                self.pwads.add_wad(pwad)
+                with timing.span('load_wad ' + os.path.basename(pwad_file)):
+                    wads.append(self.load_wad(pwad_file))
+
+        self.wad_cache.save()
 
-        # Build the sprite lookup tables.
-        self.pwads.build_sprite_list()
+        # Update the WAD list and its sprite lookup tables.
+        with timing.span('set_wads'):
+            self.pwads.set_wads(wads)
         if self.pwads.palette is None:
             wx.MessageBox(message='No PLAYPAL lump could be found in any of the loaded WAD files. Sprite previews'
                                   'will be disabled.', caption='Missing PLAYPAL', style=wx.OK | wx.ICON_INFORMATION,
@@ -291,6 +363,19 @@ class MainWindow(windows.MainFrameBase):
 
         wx.EndBusyCursor()
 
+    def load_wad(self, filename):
+        """
+        Returns a WAD reader for a WAD file.
+
+        A WAD that is already loaded is reused if it has not been modified since it was read.
+        """
+
+        for loaded_wad in self.pwads.wads:
+            if loaded_wad.filename == filename and not loaded_wad.is_modified():
+                return loaded_wad
+
+        return wad.WADReader(filename, cache=self.wad_cache)
+
     def save_file_dialog(self):
         """
         Displays a save file dialog to save the current patch file.
@@ -316,6 +401,18 @@ class MainWindow(windows.MainFrameBase):
             self.save_file(filename)
 
     def save_file(self, filename):
+        """
+        Saves a Dehacked patch file, timing the phases of saving it.
+        """
+
+        timing.begin('save')
+        try:
+            self.write_file(filename)
+        finally:
+            timing.add_stats('sprite image cache', self.pwads.sprite_image_cache.get_stats())
+            timing.end()
+
+    def write_file(self, filename):
         """
         Saves a Dehacked patch file.
         """
@@ -324,10 +421,12 @@ class MainWindow(windows.MainFrameBase):
 
         # Create a backup of the existing file.
         if os.path.exists(filename):
-            shutil.copyfile(filename, filename + '.bak')
+            with timing.span('backup'):
+                shutil.copyfile(filename, filename + '.bak')
 
         # Write patch.
-        message = self.patch.write_dehacked(filename)
+        with timing.span('write_dehacked'):
+            message = self.patch.write_dehacked(filename, verify=config.DEBUG)
         if message is not None:
             wx.MessageBox(message=message, caption='Patch write error', style=wx.OK | wx.ICON_ERROR, parent=self)
             return
@@ -336,7 +435,8 @@ class MainWindow(windows.MainFrameBase):
         self.set_modified(False)
 
         # Store workspace info.
-        self.workspace_save()
+        with timing.span('save workspace'):
+            self.workspace_save()
 
         # Add to recent files.
         config.settings.recent_files_add(filename)
@@ -369,7 +469,8 @@ class MainWindow(windows.MainFrameBase):
 
         # Update editor window contents.
         for window in self.editor_windows.itervalues():
-            window.build(self.patch)
+            with timing.span('build ' + window.__class__.__name__):
+                window.build(self.patch)
 
         # Store new workspace window data, or apply existing data.
         if self.workspace.windows is None:
@@ -415,6 +516,8 @@ class MainWindow(windows.MainFrameBase):
         Creates a new Dehacked patch file.
         """
 
+        self.wait_for_engines()
+
         new_workspace = workspace.Workspace()
 
         new_patch = patch.Patch()
@@ -434,7 +537,9 @@ class MainWindow(windows.MainFrameBase):
         new_workspace.engine = patch_info.selected_engine
 
         # Initialize patch table data.
-        selected_engine = self.engines[patch_info.selected_engine]
+        selected_engine = self.get_engine(patch_info.selected_engine)
+        if selected_engine is None:
+            return
         new_patch.version = max(selected_engine.versions)
         new_patch.extended = selected_engine.extended
         new_patch.initialize_from_engine(selected_engine)
@@ -480,6 +585,10 @@ class MainWindow(windows.MainFrameBase):
 
         config.settings.save()
 
+        # Release memory mapped WAD files.
+        self.pwads.clear()
+        sound.close_mixer()
+
         self.DestroyChildren()
         self.Destroy()
 
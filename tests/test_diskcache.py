@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests the on-disk sprite cache. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.doom import diskcache
+
+
+class FakeWAD(object):
+    """
+    The attributes of a WADReader that the cache uses.
+    """
+
+    def __init__(self, filename, size, mtime):
+        self.filename = filename
+        self.size = size
+        self.mtime = mtime
+
+
+class FakeLump(object):
+    """
+    The attributes of a Lump that the cache uses.
+    """
+
+    def __init__(self, owner, offset):
+        self.owner = owner
+        self.offset = offset
+
+
+class SpriteDiskCacheTest(unittest.TestCase):
+    """
+    Tests storing sprites across sessions, and invalidating them when their WAD changes.
+    """
+
+    PATCH = (2, 1, 0, 0, bytearray('\x01\x02\x03\xff\x04\x05\x06\xff'))
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def store(self, wad):
+        """
+        Stores a patch for a lump of a WAD in a new cache.
+        """
+
+        cache = diskcache.SpriteDiskCache(os.path.join(self.path, 'cache'), 1024 * 1024)
+        cache.register_wad(wad)
+        cache.put(FakeLump(wad, 12), 'palette', self.PATCH)
+
+    def load(self, wad):
+        """
+        Returns the patch that a new cache has stored for a lump of a WAD, or None.
+        """
+
+        cache = diskcache.SpriteDiskCache(os.path.join(self.path, 'cache'), 1024 * 1024)
+        cache.register_wad(wad)
+
+        return cache.get(FakeLump(wad, 12), 'palette')
+
+    def test_reuse(self):
+        self.store(FakeWAD(os.path.join(self.path, 'doom.wad'), 100, 1.5))
+        self.assertEqual(self.load(FakeWAD(os.path.join(self.path, 'doom.wad'), 100, 1.5)), self.PATCH)
+
+    def test_non_ascii_path(self):
+        filename = os.path.join(self.path, 'd\xc3\xb6\xc3\xb6m.wad')
+        self.store(FakeWAD(filename, 100, 1.5))
+        self.assertEqual(self.load(FakeWAD(filename, 100, 1.5)), self.PATCH)
+
+    def test_modified_wad(self):
+        self.store(FakeWAD(os.path.join(self.path, 'doom.wad'), 100, 1.5))
+        self.assertIsNone(self.load(FakeWAD(os.path.join(self.path, 'doom.wad'), 100, 2.5)))
+        self.assertIsNone(self.load(FakeWAD(os.path.join(self.path, 'doom.wad'), 101, 2.5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
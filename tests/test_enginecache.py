@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests the compiled engine table cache. Run from the repository root with python -m unittest discover tests.
+"""
+
+import cPickle
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.dehacked import engine
+from whacked4.dehacked import enginecache
+
+
+class EngineCacheTest(unittest.TestCase):
+    """
+    Tests when cached engines are used, and when table files are read again.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.path, 'cache')
+
+        self.filename = os.path.join(self.path, 'tables_doom19.json')
+        shutil.copyfile(os.path.join(ROOT_PATH, 'cfg', 'tables_doom19.json'), self.filename)
+        os.utime(self.filename, (1000000000, 1000000000))
+
+        # Count how often table files are read.
+        self.read_count = 0
+        self.read_table = engine.Engine.read_table
+
+        def read_table(table_engine, filename):
+            self.read_count += 1
+            self.read_table(table_engine, filename)
+
+        engine.Engine.read_table = read_table
+
+    def tearDown(self):
+        engine.Engine.read_table = self.read_table
+        shutil.rmtree(self.path)
+
+    def read(self, cache_class=enginecache.EngineCache, header_only=False):
+        return cache_class(self.cache_path).read_table(self.filename, header_only)
+
+    def get_cache_header(self):
+        cache = enginecache.EngineCache(self.cache_path)
+        with open(cache.get_cache_filename(self.filename), 'rb') as f:
+            return cPickle.load(f)
+
+    def test_cached(self):
+        table_engine = self.read()
+        cached_engine = self.read()
+
+        self.assertEqual(self.read_count, 1)
+        self.assertEqual(cached_engine.get_data(), table_engine.get_data())
+
+    def test_header_only(self):
+        table_engine = self.read()
+        header_engine = self.read(header_only=True)
+
+        self.assertEqual(self.read_count, 1)
+        self.assertEqual(header_engine.get_header(), table_engine.get_header())
+        self.assertEqual(len(header_engine.things), 0)
+
+    def test_touched(self):
+        self.read()
+
+        # Unchanged contents are recognized by their hash, and the cache file is updated with the new time.
+        os.utime(self.filename, (1000000100, 1000000100))
+        self.read()
+        self.assertEqual(self.read_count, 1)
+        self.assertEqual(self.get_cache_header()['mtime'], 1000000100)
+
+    def test_modified(self):
+        self.read()
+
+        with open(self.filename, 'r') as f:
+            data = f.read()
+        with open(self.filename, 'w') as f:
+            f.write(data.replace('"name": "Doom 1.9"', '"name": "Modified"', 1))
+
+        self.assertEqual(self.read().name, 'Modified')
+        self.assertEqual(self.read_count, 2)
+
+    def test_version(self):
+        self.read()
+
+        class NewerEngineCache(enginecache.EngineCache):
+            VERSION = enginecache.EngineCache.VERSION + 1
+
+        self.read(NewerEngineCache)
+        self.assertEqual(self.read_count, 2)
+        self.assertEqual(self.get_cache_header()['version'], NewerEngineCache.VERSION)
+
+    def test_corrupt(self):
+        self.read()
+
+        cache = enginecache.EngineCache(self.cache_path)
+        with open(cache.get_cache_filename(self.filename), 'wb') as f:
+            f.write('corrupt')
+
+        self.read()
+        self.assertEqual(self.read_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
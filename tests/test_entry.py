@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests looking up Dehacked patch keys. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.dehacked import engine
+from whacked4.dehacked.entries import AmmoEntry, StateEntry
+from whacked4.dehacked.entry import Field, FieldType
+
+
+class DuplicateKeyEntry(AmmoEntry):
+    """
+    An entry with two fields that use the same patch key.
+    """
+
+    FIELDS = AmmoEntry.FIELDS.copy()
+    FIELDS['alias'] = Field('Max ammo', FieldType.STRING)
+
+
+class PatchKeyTest(unittest.TestCase):
+    """
+    Tests setting entry fields from patch keys.
+    """
+
+    def test_set_patch_key(self):
+        entry = AmmoEntry(None, {'maximum': 0, 'clip': 0})
+        entry.set_patch_key('Max ammo', '200')
+        entry.set_patch_key('Per ammo', '-5')
+
+        self.assertEqual(entry.get_values(), {'maximum': 200, 'clip': -5})
+
+    def test_invalid_value(self):
+        entry = AmmoEntry(None, {'maximum': 0, 'clip': 0})
+        with self.assertRaises(ValueError):
+            entry.set_patch_key('Max ammo', 'many')
+        self.assertEqual(entry['maximum'], 0)
+
+    def test_unknown_key(self):
+        entry = AmmoEntry(None, {'maximum': 0, 'clip': 0})
+        with self.assertRaises(LookupError):
+            entry.set_patch_key('maximum', '200')
+
+    def test_class_lookups(self):
+        # Each entry class has its own lookup, and the first field with a patch key is used.
+        self.assertEqual(DuplicateKeyEntry.get_patch_keys()['Max ammo'][0], 'maximum')
+        self.assertEqual(len(DuplicateKeyEntry.get_patch_keys()), 2)
+        self.assertIs(AmmoEntry.get_patch_keys(), AmmoEntry.get_patch_keys())
+        self.assertNotIn('Max ammo', StateEntry.get_patch_keys())
+        self.assertEqual(StateEntry.get_patch_keys()['Next frame'][0], 'nextState')
+
+
+class LookupTest(unittest.TestCase):
+    """
+    Tests building engine lookup dicts.
+    """
+
+    def test_patch_key_lookup(self):
+        data = {
+            'a': {'patchKey': 'Key A'},
+            'b': {'patchKey': 'Key B'}
+        }
+        self.assertEqual(engine.get_patch_key_lookup(data), {'Key A': 'a', 'Key B': 'b'})
+
+    def test_reverse_lookup(self):
+        self.assertEqual(engine.get_reverse_lookup(['a', 'b', 'a']), {'a': 0, 'b': 1})
+        self.assertEqual(engine.get_reverse_lookup({'z': 'a', 'y': 'a', 'x': 'b'}), {'a': 'y', 'b': 'x'})
+
+    def test_reverse_multi_lookup(self):
+        self.assertEqual(engine.get_reverse_multi_lookup(['a', 'b', 'a']), {'a': (0, 2), 'b': (1,)})
+
+
+if __name__ == '__main__':
+    unittest.main()
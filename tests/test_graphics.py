@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests decoding Doom patches. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import random
+import struct
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.doom import graphics
+
+
+def make_patch(height, columns, left=0, top=0):
+    """
+    Returns the data of a Doom patch.
+
+    @param columns: a list of columns, each a list of (top delta, pixel string) tuples of its posts.
+    """
+
+    header = struct.pack('<HHhh', len(columns), height, left, top)
+
+    column_data = []
+    offset = len(header) + len(columns) * 4
+    offsets = []
+    for posts in columns:
+        offsets.append(offset)
+        data = ''.join(struct.pack('<BBB', delta, len(pixels), 0) + pixels + '\0' for delta, pixels in posts) + '\xff'
+        column_data.append(data)
+        offset += len(data)
+
+    return header + struct.pack('<{}I'.format(len(columns)), *offsets) + ''.join(column_data)
+
+
+def make_random_patch(rand, width, height):
+    """
+    Returns the data of a patch with random posts, some of which extend beyond the bottom of the patch.
+    """
+
+    columns = []
+    for _ in range(width):
+        posts = []
+        row = 0
+        while rand.random() < 0.7:
+            row += rand.randint(0, 20)
+            if row > 254:
+                break
+            pixels = ''.join(chr(rand.randint(0, 255)) for _ in range(rand.randint(0, 40)))
+            posts.append((row, pixels))
+            row += len(pixels)
+        columns.append(posts)
+
+    return make_patch(height, columns, rand.randint(-50, 50), rand.randint(-50, 50))
+
+
+class DecodePatchTest(unittest.TestCase):
+    """
+    Tests that the fast patch decoder produces the same output as the reference decoder.
+    """
+
+    def setUp(self):
+        self.rand = random.Random(4)
+        self.palette = graphics.Palette(''.join(chr(self.rand.randint(0, 255)) for _ in range(768)))
+
+    def assert_decoders_equal(self, data):
+        """
+        Asserts that both decoders produce identical output for patch data, with and without mirroring.
+
+        @return: the decoded patch.
+        """
+
+        patch = graphics.decode_patch(data, self.palette)
+        self.assertEqual(patch, graphics.decode_patch_reference(data, self.palette))
+
+        # Also decode from a buffer, like views into memory mapped WAD files.
+        self.assertEqual(graphics.decode_patch(buffer(data), self.palette), patch)
+
+        if patch is not None:
+            width, height, left, top, image_data = patch
+            mirrored = (width, height, left, top, graphics.flip_rgba(image_data, width, height))
+            self.assertEqual(mirrored, graphics.decode_patch_reference(data, self.palette, mirror=True))
+
+        return patch
+
+    def test_posts(self):
+        data = make_patch(4, [[(0, '\x01\x02'), (3, '\x03')], [], [(1, '\x04\x05\x06')]])
+        width, height, left, top, image_data = self.assert_decoders_equal(data)
+
+        self.assertEqual((width, height), (3, 4))
+        self.assertEqual(image_data[0:4], bytearray(self.palette.colors[1]))
+        self.assertEqual(image_data[4:8], bytearray(4))
+
+    def test_tall_column(self):
+        # A top delta that is not larger than the previous one continues from it.
+        data = make_patch(400, [[(200, '\x01' * 100), (150, '\x02' * 10)]])
+        image_data = self.assert_decoders_equal(data)[4]
+
+        self.assertEqual(image_data[350 * 4:351 * 4], bytearray(self.palette.colors[2]))
+
+    def test_clipped_posts(self):
+        data = make_patch(4, [[(2, '\x01\x02\x03\x04')], [(10, '\x05')]])
+        self.assertIsNotNone(self.assert_decoders_equal(data))
+
+    def test_truncated_posts(self):
+        data = make_patch(8, [[(0, '\x01\x02\x03\x04')]])
+
+        # Cut off inside the pixels, before the pixel count and before the column end.
+        for size in (17, 13, 20):
+            self.assertIsNone(self.assert_decoders_equal(data[:size]))
+
+    def test_invalid_header(self):
+        self.assertIsNone(self.assert_decoders_equal('\x01\x00'))
+        self.assertIsNone(self.assert_decoders_equal(make_patch(0, [[]])))
+        self.assertIsNone(self.assert_decoders_equal(make_patch(4, [[]])[:10]))
+
+    def test_random_patches(self):
+        for _ in range(50):
+            data = make_random_patch(self.rand, self.rand.randint(1, 40), self.rand.randint(1, 120))
+            self.assertIsNotNone(self.assert_decoders_equal(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests the memory bounded image cache. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.doom import imagecache
+
+
+class FakeImage(object):
+    """
+    An image with only a size.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+
+class ImageCacheTest(unittest.TestCase):
+    """
+    Tests the least recently used eviction and size accounting of the image cache.
+    """
+
+    def test_eviction(self):
+        # Room for exactly two 2x2 images of 16 bytes.
+        cache = imagecache.ImageCache(32)
+        cache.put('a', FakeImage(2, 2))
+        cache.put('b', FakeImage(2, 2))
+        cache.put('c', FakeImage(2, 2))
+
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.size, 32)
+
+    def test_get_marks_used(self):
+        cache = imagecache.ImageCache(32)
+        cache.put('a', FakeImage(2, 2))
+        cache.put('b', FakeImage(2, 2))
+        cache.get('a')
+        cache.put('c', FakeImage(2, 2))
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_replace(self):
+        cache = imagecache.ImageCache(100)
+        cache.put('a', FakeImage(2, 2))
+        cache.put('a', FakeImage(3, 3))
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 36)
+
+    def test_oversized_image(self):
+        # An image that is larger than the cache is kept until the next one is added.
+        cache = imagecache.ImageCache(16)
+        cache.put('a', FakeImage(2, 2))
+        cache.put('b', FakeImage(4, 4))
+        self.assertEqual(len(cache), 1)
+        self.assertIn('b', cache)
+
+        cache.put('c', FakeImage(1, 1))
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_remove_and_clear(self):
+        cache = imagecache.ImageCache(100)
+        cache.put('a', FakeImage(2, 2))
+        cache.put('b', FakeImage(2, 2))
+
+        cache.remove('a')
+        cache.remove('missing')
+        self.assertEqual((len(cache), cache.size), (1, 16))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_set_max_size(self):
+        cache = imagecache.ImageCache(100)
+        for key in 'abc':
+            cache.put(key, FakeImage(2, 2))
+
+        cache.set_max_size(20)
+        self.assertEqual(list(cache.images), ['c'])
+
+    def test_stats(self):
+        cache = imagecache.ImageCache(100)
+        cache.put('a', FakeImage(2, 2))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+
+        # Statistics are kept when the cache is cleared.
+        cache.clear()
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 1, 'count': 0, 'size': 0, 'max_size': 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
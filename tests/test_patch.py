@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests reading and writing Dehacked patches. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.dehacked import engine
+from whacked4.dehacked import patch
+
+
+def load_engine(name):
+    """
+    Returns an engine read from a table file in the cfg directory.
+    """
+
+    new_engine = engine.Engine()
+    new_engine.read_table(os.path.join(ROOT_PATH, 'cfg', 'tables_{}.json'.format(name)))
+
+    return new_engine
+
+
+class PatchRoundTripTest(unittest.TestCase):
+    """
+    Tests that patches read back the same data that was written to them.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def round_trip(self, patch_engine, modify):
+        """
+        Writes and verifies a patch modified by a function, and returns the patch that is read back from it.
+        """
+
+        filename = os.path.join(self.path, 'test.deh')
+
+        written_patch = patch.Patch()
+        written_patch.version = patch_engine.versions[0]
+        written_patch.initialize_from_engine(patch_engine)
+        modify(written_patch)
+        self.assertIsNone(written_patch.write_dehacked(filename, verify=True))
+
+        read_patch = patch.Patch()
+        read_patch.analyze_patch(filename, {'engine': patch_engine})
+        read_patch.initialize_from_engine(patch_engine)
+        self.assertEqual(read_patch.read_dehacked(filename), {})
+
+        return read_patch
+
+    def test_duplicate_strings(self):
+        patch_engine = load_engine('doom19')
+
+        # Find a string that the engine has more than once.
+        indices = None
+        for text, text_indices in patch_engine.string_keys.iteritems():
+            if len(text_indices) > 1 and len(text) >= 7:
+                indices = text_indices
+                break
+        self.assertIsNotNone(indices)
+        first, second = indices[:2]
+
+        def modify(modified_patch):
+            modified_patch.strings[first] = 'first!!'
+            modified_patch.strings[second] = 'second!'
+
+        read_patch = self.round_trip(patch_engine, modify)
+        self.assertEqual([read_patch.strings[first], read_patch.strings[second]], ['first!!', 'second!'])
+
+    def test_sprite_names(self):
+        patch_engine = load_engine('doom19')
+
+        def modify(modified_patch):
+            modified_patch.strings[patch_engine.string_keys[patch_engine.sprite_names[1]][0]] = 'ABCD'
+
+        read_patch = self.round_trip(patch_engine, modify)
+        self.assertEqual(read_patch.sprite_names[1], 'ABCD')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests the sound mixer and its output backends. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import struct
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.doom import sound
+
+
+def make_sound(sample_count, sample=129):
+    """
+    Returns a sound with a number of identical 8 bit samples at the mixer's rate.
+    """
+
+    new_sound = sound.Sound()
+    new_sound.read_from(struct.pack('<HHI', 3, sound.Mixer.RATE, sample_count) + chr(sample) * sample_count)
+
+    return new_sound
+
+
+class MixerTest(unittest.TestCase):
+    """
+    Tests mixing voices without any audio output.
+    """
+
+    def test_mix(self):
+        mixer = sound.Mixer(sound.NullBackend)
+        mixer.play(make_sound(4))
+        mixer.play(make_sound(2))
+
+        # Unsigned 8 bit samples of 129 become 256 as signed 16 bit samples. Two samples of both sounds are mixed, then
+        # two of only the first one, then silence.
+        samples = struct.unpack('<6h', mixer.mix(6))
+        self.assertEqual(samples, (512, 512, 256, 256, 0, 0))
+        self.assertEqual(mixer.voices, [])
+
+    def test_replace(self):
+        mixer = sound.Mixer(sound.NullBackend)
+        played_sound = make_sound(4)
+        mixer.play(played_sound)
+        mixer.mix(2)
+        mixer.play(played_sound)
+
+        self.assertEqual(len(mixer.voices), 1)
+        self.assertEqual(mixer.voices[0].position, 0)
+
+    def test_max_voices(self):
+        mixer = sound.Mixer(sound.NullBackend, max_voices=2)
+        sounds = [make_sound(4) for _ in range(3)]
+        for played_sound in sounds:
+            mixer.play(played_sound)
+
+        self.assertEqual([voice.sound for voice in mixer.voices], sounds[1:])
+
+    def test_stop(self):
+        mixer = sound.Mixer(sound.NullBackend)
+        sounds = [make_sound(4) for _ in range(2)]
+        for played_sound in sounds:
+            mixer.play(played_sound)
+
+        mixer.stop(sounds[0])
+        self.assertEqual([voice.sound for voice in mixer.voices], sounds[1:])
+        mixer.stop()
+        self.assertEqual(mixer.voices, [])
+
+
+class FakePyAudio(object):
+    """
+    A PyAudio instance without any output devices.
+    """
+
+    instances = []
+
+    def __init__(self):
+        self.terminated = False
+        FakePyAudio.instances.append(self)
+
+    def open(self, **kwargs):
+        raise IOError('No output device.')
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakePyAudioModule(object):
+    """
+    The parts of the pyaudio module that the PyAudio backend uses.
+    """
+
+    PyAudio = FakePyAudio
+    paInt16 = 8
+    paContinue = 0
+
+
+class PyAudioBackendTest(unittest.TestCase):
+    """
+    Tests that the PyAudio backend does not output anything if its stream cannot be opened.
+    """
+
+    def setUp(self):
+        self.pyaudio = sound.pyaudio
+        sound.pyaudio = FakePyAudioModule
+        FakePyAudio.instances = []
+
+    def tearDown(self):
+        sound.pyaudio = self.pyaudio
+
+    def test_open_error(self):
+        mixer = sound.Mixer(sound.PyAudioBackend)
+        mixer.play(make_sound(4))
+        mixer.play(make_sound(4))
+
+        self.assertEqual(len(FakePyAudio.instances), 1)
+        self.assertTrue(FakePyAudio.instances[0].terminated)
+        self.assertIsNone(mixer.backend.stream)
+
+        mixer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests columnar Dehacked tables. Run from the repository root with python -m unittest discover tests.
+"""
+
+from array import array
+import os
+import struct
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.dehacked import table
+from whacked4.dehacked.entries import AmmoEntry, SoundEntry
+
+
+def make_ammo_table(values):
+    """
+    Returns a table of ammo entries from a list of (maximum, clip) tuples.
+    """
+
+    ammo_table = table.Table(AmmoEntry, None)
+    for maximum, clip in values:
+        ammo_table.append(AmmoEntry(ammo_table, {'maximum': maximum, 'clip': clip}))
+
+    return ammo_table
+
+
+class TableTest(unittest.TestCase):
+    """
+    Tests storing entry values in columns.
+    """
+
+    def test_rows(self):
+        ammo_table = make_ammo_table([(200, 10), (50, 4)])
+
+        self.assertEqual(len(ammo_table), 2)
+        self.assertIsInstance(ammo_table.get_column('maximum'), array)
+        self.assertEqual(ammo_table[1]['clip'], 4)
+        self.assertEqual(ammo_table[-1]['clip'], 4)
+        self.assertEqual([entry['maximum'] for entry in ammo_table], [200, 50])
+
+        ammo_table[0]['clip'] = 20
+        self.assertEqual(ammo_table.get_value(0, 'clip'), 20)
+
+        with self.assertRaises(KeyError):
+            ammo_table[0]['unknown'] = 1
+        with self.assertRaises(IndexError):
+            ammo_table[2]
+
+    def test_row_assignment(self):
+        ammo_table = make_ammo_table([(200, 10), (50, 4)])
+
+        detached = ammo_table[0].clone()
+        ammo_table[1] = detached
+        detached['clip'] = 1
+
+        self.assertEqual(ammo_table.get_values(1), {'maximum': 200, 'clip': 10})
+
+    def test_untyped_values(self):
+        ammo_table = make_ammo_table([(200, 10), (50, 4)])
+
+        # Values that do not fit an array column turn it into a list.
+        ammo_table.set_value(0, 'maximum', 'text')
+        ammo_table.set_value(1, 'clip', 1 << 40)
+
+        self.assertIsInstance(ammo_table.get_column('maximum'), list)
+        self.assertIsInstance(ammo_table.get_column('clip'), list)
+        self.assertEqual(ammo_table.get_values(0), {'maximum': 'text', 'clip': 10})
+        self.assertEqual(ammo_table.get_values(1), {'maximum': 50, 'clip': 1 << 40})
+
+    def test_clone(self):
+        ammo_table = make_ammo_table([(200, 10), (50, 4)])
+
+        dup = ammo_table.clone()
+        dup.set_value(0, 'clip', 99)
+        dup.append(AmmoEntry(dup, {'maximum': 1, 'clip': 1}))
+
+        self.assertEqual(ammo_table.get_value(0, 'clip'), 10)
+        self.assertEqual(len(ammo_table), 2)
+        self.assertEqual(len(dup), 3)
+
+    def test_modified_rows(self):
+        ammo_table = make_ammo_table([(200, 10), (50, 4), (300, 20)])
+        dup = ammo_table.clone()
+        self.assertEqual(dup.get_modified_rows(ammo_table), [])
+
+        dup.set_value(2, 'clip', 1)
+        dup.set_value(0, 'maximum', 1)
+        self.assertEqual(dup.get_modified_rows(ammo_table), [0, 2])
+
+        ammo_table.names = ['Bullets', 'Shells', 'Cells']
+        dup.names = ['Bullets', 'Buckshot', 'Cells']
+        self.assertEqual(dup.get_dirty_rows(ammo_table), [0, 1, 2])
+
+    def test_read_from_executable(self):
+        values = range(18)
+        data = 'header' + struct.pack('<18i', *values)
+
+        sound_table = table.Table(SoundEntry, None)
+        sound_table.read_from_executable(2, data, 6)
+
+        self.assertEqual(len(sound_table), 2)
+        self.assertEqual(sound_table.get_values(1), dict(zip(SoundEntry.FIELDS, values[9:])))
+
+        with self.assertRaises(struct.error):
+            sound_table.read_from_executable(3, data, 6)
+
+    def test_columns(self):
+        ammo_table = make_ammo_table([(200, 10), (50, 4)])
+        ammo_table.set_value(1, 'maximum', 'text')
+
+        read_table = table.Table(AmmoEntry, None)
+        read_table.set_columns(ammo_table.get_columns())
+
+        self.assertEqual(len(read_table), 2)
+        self.assertEqual([read_table.get_values(index) for index in range(2)],
+                         [ammo_table.get_values(index) for index in range(2)])
+
+
+class OverlayTableTest(unittest.TestCase):
+    """
+    Tests overlaying tables copy-on-write.
+    """
+
+    def setUp(self):
+        self.base = make_ammo_table([(200, 10), (50, 4), (300, 20)])
+        self.base.names = ['Bullets', 'Shells', 'Cells']
+        self.overlay = table.OverlayTable(self.base)
+
+    def test_read_through(self):
+        self.assertEqual(len(self.overlay), 3)
+        self.assertEqual(self.overlay[1]['maximum'], 50)
+        self.assertEqual(self.overlay.rows, {})
+
+    def test_write(self):
+        self.overlay[1]['clip'] = 8
+
+        self.assertEqual(self.overlay.get_values(1), {'maximum': 50, 'clip': 8})
+        self.assertEqual(self.overlay.get_column('clip'), [10, 8, 20])
+        self.assertEqual(self.overlay.columns['clip'], [10, 8, 20])
+        self.assertEqual(self.base.get_value(1, 'clip'), 4)
+        self.assertEqual(list(self.overlay.rows), [1])
+
+        with self.assertRaises(KeyError):
+            self.overlay.set_value(0, 'unknown', 1)
+
+    def test_restore(self):
+        self.overlay.set_values(2, {'maximum': 1, 'clip': 1})
+        self.assertEqual(list(self.overlay.rows), [2])
+
+        # Storing the base table's values removes the row from the overlay again.
+        self.overlay[2] = self.base[2]
+        self.assertEqual(self.overlay.rows, {})
+
+    def test_modified_rows(self):
+        self.overlay.set_value(2, 'clip', 1)
+        self.overlay.set_value(0, 'clip', 10)
+        self.assertEqual(self.overlay.get_modified_rows(self.base), [2])
+
+        self.overlay.names[1] = 'Buckshot'
+        self.assertEqual(self.overlay.get_dirty_rows(self.base), [1, 2])
+        self.assertEqual(self.base.names[1], 'Shells')
+
+        # Other tables are compared in full.
+        other = self.base.clone()
+        other.set_value(1, 'maximum', 0)
+        self.assertEqual(self.overlay.get_modified_rows(other), [1, 2])
+
+    def test_clone(self):
+        self.overlay.set_value(0, 'clip', 1)
+
+        dup = self.overlay.clone()
+        dup.set_value(0, 'clip', 2)
+        dup.set_value(1, 'clip', 2)
+        dup.names[0] = 'Rounds'
+
+        self.assertEqual(self.overlay.get_column('clip'), [1, 4, 20])
+        self.assertEqual(self.overlay.names[0], 'Bullets')
+        self.assertIs(dup.base, self.base)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests the Dehacked patch tokenizer. Run from the repository root with python -m unittest discover tests.
+"""
+
+import os
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.dehacked.tokenizer import TokenType, tokenize
+
+
+def get_tokens(data):
+    """
+    Returns a list of (type, line, key, value) tuples of the tokens of patch data.
+    """
+
+    return [(token.type, token.line, token.key, token.value) for token in tokenize(data)]
+
+
+class TokenizerTest(unittest.TestCase):
+    """
+    Tests splitting patches into tokens.
+    """
+
+    def test_lines(self):
+        data = (
+            'Patch File for DeHackEd v3.0\n'
+            '# A comment.\n'
+            '\n'
+            'Doom version = 21\r\n'
+            '  Patch format = 6  \n'
+            'Some text'
+        )
+
+        self.assertEqual(get_tokens(data), [
+            (TokenType.SIGNATURE, 1, None, None),
+            (TokenType.PAIR, 4, 'Doom version', '21'),
+            (TokenType.PAIR, 5, 'Patch format', '6'),
+            (TokenType.LINE, 6, None, None)
+        ])
+
+    def test_sections(self):
+        data = (
+            'Thing 1 (Player)\n'
+            'Frame 12\n'
+            'Pointer 3 (Frame 5)\n'
+            'Ammo 0 (Bullets)\n'
+            'Ammo = 2\n'
+            'Cheat 0\n'
+            'Misc 0\n'
+            '[PARS]\n'
+            'Frame\n'
+            'Thing 1\n'
+            'Text 1 2 3\n'
+        )
+
+        self.assertEqual(get_tokens(data), [
+            (TokenType.SECTION, 1, 'Thing', ['Thing', '1', '(Player)']),
+            (TokenType.SECTION, 2, 'Frame', ['Frame', '12']),
+            (TokenType.SECTION, 3, 'Pointer', ['Pointer', '3', '(Frame', '5)']),
+            (TokenType.SECTION, 4, 'Ammo', ['Ammo', '0', '(Bullets)']),
+            (TokenType.PAIR, 5, 'Ammo', '2'),
+            (TokenType.SECTION, 6, 'Cheat 0', ['Cheat', '0']),
+            (TokenType.SECTION, 7, 'Misc 0', ['Misc', '0']),
+            (TokenType.SECTION, 8, '[PARS]', ['[PARS]']),
+            (TokenType.LINE, 9, None, None),
+            (TokenType.LINE, 10, None, None),
+            (TokenType.LINE, 11, None, None)
+        ])
+
+    def test_text_sections(self):
+        # Text section texts are read by length, and can contain new lines and comment characters.
+        data = (
+            'Text 4 6\n'
+            'ab\n#NEW\nNE\n'
+            'Frame 1\n'
+            'Text x 2\n'
+        )
+
+        self.assertEqual(get_tokens(data), [
+            (TokenType.SECTION, 1, 'Text', ('ab\n#', 'NEW\nNE')),
+            (TokenType.SECTION, 5, 'Frame', ['Frame', '1']),
+            (TokenType.LINE, 6, None, None)
+        ])
+
+    def test_truncated_text(self):
+        self.assertEqual(get_tokens('Text 4 6\nabcdef'), [
+            (TokenType.SECTION, 1, 'Text', ('abcd', 'ef'))
+        ])
+
+    def test_strings_continuation(self):
+        # A continuation line is never a section header, and values outside of [STRINGS] do not continue.
+        data = (
+            '[STRINGS]\n'
+            'GOTARMOR = Picked \\\n'
+            '   up some \\\n'
+            '   armor.\n'
+            'Next = a \\\n'
+            '[CODEPTR]\n'
+            '[CODEPTR]\n'
+            'FRAME 1 = Look \\\n'
+        )
+
+        self.assertEqual(get_tokens(data), [
+            (TokenType.SECTION, 1, '[STRINGS]', ['[STRINGS]']),
+            (TokenType.PAIR, 2, 'GOTARMOR', 'Picked up some armor.'),
+            (TokenType.PAIR, 5, 'Next', 'a [CODEPTR]'),
+            (TokenType.SECTION, 7, '[CODEPTR]', ['[CODEPTR]']),
+            (TokenType.PAIR, 8, 'FRAME 1', 'Look \\')
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Tests containers that track assignments. Run from the repository root with python -m unittest discover tests.
+"""
+
+import copy
+import os
+import sys
+import unittest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from whacked4.dehacked import tracked
+
+
+class TrackedListTest(unittest.TestCase):
+    """
+    Tests tracking assignments to list items.
+    """
+
+    def test_dirty(self):
+        items = tracked.TrackedList(['a', 'b', 'c'])
+        self.assertEqual(items.dirty, set())
+
+        items[0] = 'x'
+        items[-1] = 'c'
+        self.assertEqual(items, ['x', 'b', 'c'])
+
+        # Assigning an unchanged value still marks an item as dirty, and negative indices are normalized.
+        self.assertEqual(items.dirty, set([0, 2]))
+
+    def test_slice(self):
+        items = tracked.TrackedList(['a', 'b'])
+        with self.assertRaises(TypeError):
+            items[0:1] = ['x']
+        with self.assertRaises(IndexError):
+            items[2] = 'x'
+        self.assertEqual(items.dirty, set())
+
+    def test_copy(self):
+        items = tracked.TrackedList(['a', 'b'])
+        items[0] = 'x'
+
+        dup = copy.copy(items)
+        dup[1] = 'y'
+
+        self.assertIsInstance(dup, tracked.TrackedList)
+        self.assertEqual(items, ['x', 'b'])
+        self.assertEqual(items.dirty, set([0]))
+        self.assertEqual(dup.dirty, set([0, 1]))
+
+
+class TrackedDictTest(unittest.TestCase):
+    """
+    Tests tracking assignments to dict items.
+    """
+
+    def test_dirty(self):
+        items = tracked.TrackedDict([('a', 1), ('b', 2)])
+        self.assertEqual(items.dirty, set())
+
+        items['b'] = 3
+        items['c'] = 4
+        self.assertEqual(items.keys(), ['a', 'b', 'c'])
+        self.assertEqual(items.dirty, set(['b', 'c']))
+
+    def test_copy(self):
+        items = tracked.TrackedDict([('a', 1), ('b', 2)])
+        items['a'] = 5
+
+        dup = copy.copy(items)
+        dup['b'] = 6
+
+        self.assertIsInstance(dup, tracked.TrackedDict)
+        self.assertEqual(items, {'a': 5, 'b': 2})
+        self.assertEqual(items.dirty, set(['a']))
+        self.assertEqual(dup.dirty, set(['a', 'b']))
+
+
+if __name__ == '__main__':
+    unittest.main()
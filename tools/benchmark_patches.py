@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Benchmarks decoding every sprite in a WAD file, comparing graphics.decode_patch() to the per-pixel reference decoder.
+
+Every sprite is decoded with both decoders, with and without mirroring, and any sprite for which their RGBA output
+differs is reported. Run from the repository root with python tools/benchmark_patches.py doom2.wad.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from whacked4.doom import graphics, wad
+
+
+def decode_all(lumps, decode):
+    """
+    Decodes a list of lumps with a decode function.
+
+    @return: a list of the decoded patches, and the time taken in seconds.
+    """
+
+    start = time.time()
+    patches = [decode(lump.get_data()) for lump in lumps]
+
+    return patches, time.time() - start
+
+
+def flip_patch(patch):
+    """
+    Returns a patch returned by decode_patch() mirrored with flip_rgba(), or None if the patch is None.
+    """
+
+    if patch is None:
+        return None
+
+    width, height, left, top, image_data = patch
+    return width, height, left, top, graphics.flip_rgba(image_data, width, height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks decoding every sprite in a WAD file.')
+    parser.add_argument('wad', help='The WAD file to decode the sprites of. It must contain a PLAYPAL lump.')
+    args = parser.parse_args()
+
+    sprite_wad = wad.WADReader(args.wad)
+    playpal = sprite_wad.get_lump('PLAYPAL')
+    if playpal is None:
+        parser.error('{} does not contain a PLAYPAL lump.'.format(args.wad))
+    palette = graphics.Palette(playpal.get_data())
+
+    lumps = [sprite_wad.get_lump_at(index) for index in sorted(sprite_wad.sprite_index.itervalues())]
+    print '{} sprites.'.format(len(lumps))
+
+    patches, fast_time = decode_all(lumps, lambda data: graphics.decode_patch(data, palette))
+    reference_patches, reference_time = decode_all(lumps, lambda data: graphics.decode_patch_reference(data, palette))
+    print 'decode_patch: {:.3f} s, reference: {:.3f} s, {:.1f}x faster.'.format(
+        fast_time, reference_time, reference_time / max(fast_time, 1e-6)
+    )
+
+    start = time.time()
+    mirrored_patches = [flip_patch(patch) for patch in patches]
+    flip_time = time.time() - start
+    reference_mirrored_patches, reference_mirror_time = decode_all(
+        lumps, lambda data: graphics.decode_patch_reference(data, palette, mirror=True)
+    )
+    print 'flip_rgba: {:.3f} s, mirrored reference: {:.3f} s.'.format(flip_time, reference_mirror_time)
+
+    differences = 0
+    for index, lump in enumerate(lumps):
+        if patches[index] != reference_patches[index] or mirrored_patches[index] != reference_mirrored_patches[index]:
+            print '{}: the decoders produce different output.'.format(lump.name)
+            differences += 1
+
+    invalid = len([patch for patch in patches if patch is None])
+    print '{} different, {} invalid sprites.'.format(differences, invalid)
+
+    sprite_wad.close()
+
+    if differences > 0:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#coding=utf8
+
+"""
+Benchmarks reading the lump directory of a synthetic WAD file with many lumps, and loading it into a WAD list.
+
+Reports the time taken and the growth of the process' resident memory for WADReader.read(), WADList.set_wads() and
+for reloading the WAD list with an added WAD, which should only do work for the added WAD. Run from the repository
+root with python tools/benchmark_wad.py.
+"""
+
+import argparse
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from whacked4.doom import wad, wadlist
+
+
+def write_wad(filename, lump_count):
+    """
+    Writes a PWAD with a number of 4 byte lumps. One in every 100 lumps is a sprite lump between S_START and S_END
+    markers.
+    """
+
+    sprite_count = lump_count / 100
+    names = ['S_START']
+    names.extend('S{:03d}A0'.format(index % 1000) for index in xrange(sprite_count))
+    names.append('S_END')
+    names.extend('L{:07d}'.format(index) for index in xrange(lump_count - sprite_count - 2))
+
+    data_size = len(names) * 4
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<4sII', 'PWAD', len(names), 12 + data_size))
+        f.write('\0' * data_size)
+        for index, name in enumerate(names):
+            f.write(struct.pack('<II8s', 12 + index * 4, 4, name))
+
+
+def get_rss():
+    """
+    Returns the resident memory size of this process in bytes, or None if it cannot be determined.
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Only the peak size is available here, in kilobytes except on Mac OS X.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+def measure(name, function):
+    """
+    Calls a function, prints the time it took and how much the resident memory grew, and returns its result.
+    """
+
+    rss = get_rss()
+    start = time.time()
+    result = function()
+    duration = time.time() - start
+
+    if rss is None:
+        print '{}: {:.3f} s'.format(name, duration)
+    else:
+        print '{}: {:.3f} s, {:+.1f} MB RSS'.format(name, duration, (get_rss() - rss) / 1024.0 / 1024.0)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks reading a synthetic WAD file with many lumps.')
+    parser.add_argument('-lumps', action='store', type=int, default=100000, help='The number of lumps to write.')
+    parser.add_argument('-unmapped', action='store_true', help='Read the WAD file without memory mapping it.')
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(path, 'large.wad')
+        small_filename = os.path.join(path, 'small.wad')
+        write_wad(filename, args.lumps)
+        write_wad(small_filename, 100)
+
+        mapped = not args.unmapped
+        large_wad = measure('read', lambda: wad.WADReader(filename, mapped=mapped))
+        small_wad = wad.WADReader(small_filename, mapped=mapped)
+
+        wads = wadlist.WADList()
+        measure('set_wads', lambda: wads.set_wads([large_wad]))
+        measure('lookups', lambda: [wads.get_lump('L{:07d}'.format(index)) for index in xrange(1, 1000)])
+        measure('set_wads with an added WAD', lambda: wads.set_wads([large_wad, small_wad]))
+
+        wads.clear()
+
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()